@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+"""Benchmark the sixel encoder and track its output size.
+
+Every image is encoded at every size on both the NumPy and the pure-Python
+path, with the default ``SixelOptions`` and with each of the option values
+below in turn.  ``--all-combinations`` runs every combination of them
+instead, which takes a lot longer.  For each run the fastest of ``--repeat`` encode times, the peak memory
+traced during one extra encode and the sixel byte count are recorded.
+
+Results can be written to a JSON baseline with ``--output`` and compared
+with an earlier one with ``--compare``, which lists every case that got
+slower than ``--tolerance`` allows, whose output grew or that the baseline
+lacks, and fails if there are any.  Cases are told apart by the option
+values below only, so a baseline has to be regenerated when they or the
+images change.  Byte counts are deterministic; times and memory are only
+comparable on the same machine.
+"""
+
+import itertools
+import json
+import platform
+import random
+import sys
+import timeit
+import tracemalloc
+from argparse import ArgumentParser
+from collections.abc import Iterator
+from dataclasses import replace
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+from PIL import Image as PILImage
+from PIL import ImageDraw, ImageFont
+
+from textual_image._sixel import SixelOptions, image_to_sixels
+
+TEST_IMAGE = Path(__file__).parent.parent / "textual_image" / "gracehopper.jpg"
+
+SIZES = ((320, 180), (1280, 720))
+OPTION_VALUES: dict[str, tuple[Any, ...]] = {
+    "colors": (16, 256),
+    "smooth": (None, 3),
+    "quantize": ("fastoctree", "maxcoverage", "adaptive", "uniform", "ordered"),
+    "lazy_color_palette": (False, True),
+    "workers": (1, 4),
+    "elide_background": (False, True),
+    "max_bytes": (None, 100_000),
+}
+
+
+def _photo(size: tuple[int, int]) -> PILImage.Image:
+    with PILImage.open(TEST_IMAGE) as opened:
+        return opened.convert("RGB").resize(size)
+
+
+def _ui(size: tuple[int, int]) -> PILImage.Image:
+    image = PILImage.new("RGB", size, (30, 30, 46))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default_imagefont()
+    draw.rectangle((0, 0, size[0], 24), fill=(49, 50, 68))
+    draw.rectangle((0, 24, size[0] // 5, size[1]), fill=(24, 24, 37))
+    for line in range(2, size[1] // 14):
+        code = f"{line:>4}  def render(self) -> Strip:"
+        draw.text((size[0] // 5 + 8, line * 14), code, fill=(205, 214, 244), font=font)
+        draw.text((8, line * 14), f"module_{line}.py", fill=(166, 173, 200), font=font)
+    return image
+
+
+def _scan(size: tuple[int, int]) -> PILImage.Image:
+    image = PILImage.new("1", size, 1)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default_imagefont()
+    rng = random.Random(0)
+    for y in range(8, size[1] - 16, 14):
+        words = ("".join(rng.choices("abcdefghijklmnop", k=rng.randrange(2, 9))) for _ in range(size[0] // 40))
+        draw.text((8, y), " ".join(words), fill=0, font=font)
+    return image
+
+
+def _gradient(size: tuple[int, int]) -> PILImage.Image:
+    horizontal = PILImage.linear_gradient("L").rotate(90).resize(size)
+    vertical = PILImage.linear_gradient("L").resize(size)
+    radial = PILImage.radial_gradient("L").resize(size)
+    return PILImage.merge("RGB", (horizontal, vertical, radial))
+
+
+def _noise(size: tuple[int, int]) -> PILImage.Image:
+    return PILImage.frombytes("RGB", size, random.Random(0).randbytes(size[0] * size[1] * 3))
+
+
+def _transparent(size: tuple[int, int]) -> PILImage.Image:
+    # Drawn at 4x and downscaled, so the shapes get semi-transparent edges
+    large = PILImage.new("RGBA", (size[0] * 4, size[1] * 4), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(large)
+    rng = random.Random(0)
+    for _ in range(24):
+        x, y = rng.randrange(large.width), rng.randrange(large.height)
+        radius = rng.randrange(large.height // 4)
+        fill = (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=fill)
+    return large.resize(size, PILImage.Resampling.BOX)
+
+
+def _sprite(size: tuple[int, int]) -> PILImage.Image:
+    # A round cutout of the photo in a corner of a transparent canvas
+    diameter = min(size) // 2
+    mask = PILImage.new("L", (diameter, diameter))
+    ImageDraw.Draw(mask).ellipse((0, 0, diameter - 1, diameter - 1), fill=255)
+    image = PILImage.new("RGBA", size)
+    image.paste(_photo((diameter, diameter)), (size[0] - diameter * 3 // 2, size[1] // 4), mask)
+    return image
+
+
+IMAGES = {
+    "photo": _photo,
+    "ui": _ui,
+    "scan": _scan,
+    "gradient": _gradient,
+    "noise": _noise,
+    "transparent": _transparent,
+    "sprite": _sprite,
+}
+
+
+def _iter_options(all_combinations: bool) -> Iterator[SixelOptions]:
+    default = SixelOptions()
+    if all_combinations:
+        for values in itertools.product(*OPTION_VALUES.values()):
+            yield replace(default, **dict(zip(OPTION_VALUES, values, strict=True)))
+        return
+
+    yield default
+    for name, values in OPTION_VALUES.items():
+        for value in values:
+            if value != getattr(default, name):
+                yield replace(default, **{name: value})
+
+
+def _version(distribution: str) -> str | None:
+    try:
+        return version(distribution)
+    except PackageNotFoundError:
+        return None
+
+
+def _measure(image: PILImage.Image, options: SixelOptions, repeat: int) -> tuple[float, int, int]:
+    seconds = min(timeit.repeat(lambda: image_to_sixels(image, options), number=1, repeat=repeat))
+    tracemalloc.start()
+    output = image_to_sixels(image, options)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, len(output)
+
+
+def _benched_options(options: SixelOptions) -> dict[str, Any]:
+    return {name: getattr(options, name) for name in OPTION_VALUES}
+
+
+def _case_key(case: dict[str, Any]) -> str:
+    # Options a baseline predates take their default value
+    benched = {**_benched_options(SixelOptions()), **case["options"]}
+    options = " ".join(f"{name}={benched[name]}" for name in OPTION_VALUES)
+    return f"{case['image']} {case['size']} {case['path']} {options}"
+
+
+def _compare(results: list[dict[str, Any]], baseline: list[dict[str, Any]], tolerance: float) -> int:
+    previous = {_case_key(case): case for case in baseline}
+    regressions = missing = 0
+    for case in results:
+        old = previous.get(_case_key(case))
+        if old is None:
+            missing += 1
+            print(f"MISSING {_case_key(case)}: not in the baseline")
+            continue
+        slower = case["time_ms"] / old["time_ms"]
+        if slower > tolerance or case["bytes"] > old["bytes"]:
+            regressions += 1
+            print(
+                f"REGRESSION {_case_key(case)}: {old['time_ms']:.1f} -> {case['time_ms']:.1f} ms ({slower:.2f}x), "
+                f"{old['bytes']} -> {case['bytes']} bytes"
+            )
+    print(f"{regressions} regressions and {missing} cases missing against {len(previous)} baseline cases")
+    return regressions + missing
+
+
+def _dump_results(environment: dict[str, str | None], results: list[dict[str, Any]]) -> str:
+    # One case per line keeps diffs between baselines readable
+    cases = ",\n".join(f"  {json.dumps(case)}" for case in results)
+    return f'{{\n "environment": {json.dumps(environment)},\n "results": [\n{cases}\n ]\n}}\n'
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--all-combinations", action="store_true", help="run every combination of option values")
+    parser.add_argument("--filter", default="", help="only run cases whose description contains this text")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="compare the results with this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown against the baseline")
+    arguments = parser.parse_args()
+    if arguments.compare and not arguments.compare.exists():
+        parser.error(f"baseline {arguments.compare} not found")
+
+    results = []
+    for (name, make_image), size in itertools.product(IMAGES.items(), SIZES):
+        image = make_image(size)
+        for options, path in itertools.product(_iter_options(arguments.all_combinations), ("numpy", "python")):
+            case: dict[str, Any] = {
+                "image": name,
+                "size": f"{size[0]}x{size[1]}",
+                "path": path,
+                "options": _benched_options(options),
+            }
+            if arguments.filter not in _case_key(case):
+                continue
+            with patch("textual_image._sixel._HAS_NUMPY", path == "numpy"):
+                seconds, peak, length = _measure(image, options, arguments.repeat)
+            case.update(time_ms=round(seconds * 1e3, 3), peak_kib=round(peak / 1024, 1), bytes=length)
+            results.append(case)
+            print(f"{_case_key(case):<100} {seconds * 1e3:9.1f} ms {peak / 2**20:7.1f} MiB {length:>9} bytes")
+
+    failures = 0
+    if arguments.compare:
+        failures = _compare(results, json.loads(arguments.compare.read_text())["results"], arguments.tolerance)
+
+    if arguments.output:
+        environment = {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "textual-image": _version("textual-image"),
+            "pillow": _version("pillow"),
+            "numpy": _version("numpy"),
+        }
+        arguments.output.write_text(_dump_results(environment, results))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""Compare the pure-Python sixel band encoder with the per-pixel packer it replaced.
+
+Without NumPy, every band is packed into per-color bitmasks and split into
+segments before it is emitted.  The previous packer visited every pixel in
+Python and found segments with a regex; the current one locates colors with
+``bytes.find`` and ``bytes.translate`` and only visits pixels one by one in
+bands with many colors.  Both drive the same emitter and must produce the
+same sixels.
+"""
+
+import re
+import timeit
+from argparse import ArgumentParser
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+from PIL import Image as PILImage
+from PIL import ImageDraw
+
+from textual_image._sixel import (
+    _GAP_THRESHOLD,
+    MAX_COLORS,
+    AlphaMask,
+    Segment,
+    SixelOptions,
+    _band_holes,
+    _compact_palette,
+    _emit_band,
+    _pack_band,
+    _PaletteColorTracker,
+    _prepare_image,
+)
+
+_NONZERO_RUN_RE = re.compile(rb"[^\x00]+")
+
+Packer = Callable[[bytes, int, int, int, list[bytearray], AlphaMask], list[Segment]]
+
+
+def _previous_pack_band(
+    data: bytes, band_y: int, band_h: int, width: int, band_data: list[bytearray], alpha_mask: AlphaMask
+) -> list[Segment]:
+    """The per-pixel packer and regex segment splitter this benchmark compares against."""
+    span_start = [width] * MAX_COLORS
+    span_end = [0] * MAX_COLORS
+    for row in range(band_h):
+        bit = 1 << row
+        row_start = (band_y + row) * width
+        row_bytes = data[row_start : row_start + width]
+        pixels: Iterable[tuple[int, int]] = enumerate(row_bytes)
+        if alpha_mask is not None:
+            row_alpha = alpha_mask[row_start : row_start + width]
+            pixels = ((x, color) for x, (color, alpha) in enumerate(zip(row_bytes, row_alpha)) if alpha)
+        for x, color in pixels:
+            band_data[color][x] |= bit
+            if x < span_start[color]:
+                span_start[color] = x
+            if x >= span_end[color]:
+                span_end[color] = x + 1
+
+    segments: list[Segment] = []
+    for color in range(MAX_COLORS):
+        if span_end[color]:
+            segments.extend(_previous_split_segments(band_data[color], span_start[color], span_end[color], color))
+    return segments
+
+
+def _previous_split_segments(color_row: bytearray, span_start: int, span_end: int, color: int) -> list[Segment]:
+    segments: list[Segment] = []
+    seg_start = -1
+    seg_end = 0
+    for m in _NONZERO_RUN_RE.finditer(color_row, span_start, span_end):
+        ms, me = m.span()
+        if seg_start == -1:
+            seg_start, seg_end = ms, me
+        elif ms - seg_end < _GAP_THRESHOLD:
+            seg_end = me
+        else:
+            segments.append((seg_start, seg_end, color))
+            seg_start, seg_end = ms, me
+    segments.append((seg_start, seg_end, color))
+    return segments
+
+
+def _encode(pack: Packer, data: bytes, width: int, height: int, alpha_mask: AlphaMask) -> bytes:
+    band_data = [bytearray(width) for _ in range(MAX_COLORS)]
+    tracker = _PaletteColorTracker()
+    chunks = []
+    for band_y in range(0, height, 6):
+        band_h = min(6, height - band_y)
+        segments = pack(data, band_y, band_h, width, band_data, alpha_mask)
+        holes = None if alpha_mask is None else _band_holes(alpha_mask, band_y, band_h, width)
+        chunks.append(bytes(_emit_band(segments, band_data, tracker, band_h, holes)))
+        for color in {seg[2] for seg in segments}:
+            band_data[color][:] = bytes(width)
+    return b"".join(chunks)
+
+
+def _screenshot(size: tuple[int, int]) -> PILImage.Image:
+    image = PILImage.new("RGB", size, (30, 30, 46))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, size[0], 24), fill=(49, 50, 68))
+    for line in range(2, size[1] // 16):
+        draw.text((12, line * 16), f"{line:>4}  def render(self, width: int) -> Strip:  # {line}", fill=(205, 214, 244))
+    return image
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments = parser.parse_args()
+
+    size = (arguments.width, arguments.height)
+    with PILImage.open(Path(__file__).parent.parent / "textual_image" / "gracehopper.jpg") as opened:
+        photo = opened.convert("RGB").resize(size)
+    transparent = _screenshot(size).convert("RGBA")
+    transparent.putalpha(PILImage.linear_gradient("L").resize(size).point(lambda a: 255 * (a > 64)))
+
+    for label, image in (
+        ("screenshot", _screenshot(size)),
+        ("screenshot, transparent", transparent),
+        ("photo, 16 colors", photo.quantize(16).convert("RGB")),
+        ("photo, 256 colors", photo),
+    ):
+        prepared, alpha_mask = _prepare_image(image, SixelOptions(), None)
+        data, _ = _compact_palette(prepared, prepared.tobytes(), alpha_mask)
+        args = (data, prepared.width, prepared.height, alpha_mask)
+        assert _encode(_pack_band, *args) == _encode(_previous_pack_band, *args)
+
+        times = {
+            name: min(timeit.repeat(lambda: _encode(pack, *args), number=1, repeat=arguments.repeat))  # noqa: B023
+            for name, pack in (("previous", _previous_pack_band), ("current", _pack_band))
+        }
+        print(
+            f"{label:<24} previous {times['previous'] * 1e3:7.1f} ms"
+            f"  current {times['current'] * 1e3:7.1f} ms  {times['previous'] / times['current']:4.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""Measure how many copies of the sixel payload each output path makes.
+
+The frame is encoded once up front and replayed from memory, so only the work
+done after encoding is traced: joining, decoding and wrapping the payload into
+Rich/Textual segments.  Peak traced memory is reported as a multiple of the
+payload size, i.e. the number of payload-sized buffers alive at the same time.
+"""
+
+import io
+import tracemalloc
+from argparse import ArgumentParser
+from typing import Callable, Iterator
+from unittest.mock import patch
+
+from PIL import Image as PILImage
+from rich.console import Console
+
+from textual_image._sixel import image_to_sixels, iter_sixels
+from textual_image.renderable.sixel import Image as SixelRenderable
+from textual_image.widget.sixel import _ImageSixelImpl
+
+
+def _measure(label: str, payload_size: int, run: Callable[[], object]) -> None:
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<20} peak {peak / 2**20:7.1f} MiB = {peak / payload_size:5.2f}x payload")
+
+
+def _render_rich(image: PILImage.Image) -> None:
+    console = Console(file=io.StringIO(), force_terminal=True, width=image.width // 10, height=image.height // 20)
+    console.print(SixelRenderable(image))
+
+
+def _encode_widget(image: PILImage.Image) -> None:
+    _ImageSixelImpl()._image_to_sixel_chunks(image)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    arguments = parser.parse_args()
+
+    # Noise in a small palette skips quantization and produces a large payload
+    image = PILImage.effect_noise((arguments.width, arguments.height), 64).quantize(16)
+    chunks = list(iter_sixels(image))
+    payload_size = sum(len(chunk) for chunk in chunks)
+    print(f"{arguments.width}x{arguments.height} frame, {payload_size / 2**20:.1f} MiB sixel payload")
+
+    def replay(*args: object, **kwargs: object) -> Iterator[object]:
+        return iter(chunks)
+
+    with (
+        patch("textual_image._sixel.iter_sixels", replay),
+        patch("textual_image.renderable.sixel.iter_sixels", replay),
+        patch("textual_image.widget.sixel.iter_sixels", replay),
+    ):
+        _measure("image_to_sixels", payload_size, lambda: image_to_sixels(image))
+        _measure("rich renderable", payload_size, lambda: _render_rich(image))
+        _measure("textual widget", payload_size, lambda: _encode_widget(image))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""Time pass assignment on fragmented sixel bands.
+
+Colored noise and dithering split every color into many short segments that
+overlap each other.  A synthetic band of staggered segments in every color
+is the worst case: each pass takes only a few of them.  Rescanning all
+remaining segments once per pass, heap-based ``_assign_passes`` and the
+``_iter_passes`` hybrid the encoder uses are timed against each other, and
+all must produce the same passes.
+"""
+
+import timeit
+from argparse import ArgumentParser
+from pathlib import Path
+
+from PIL import Image as PILImage
+
+from textual_image._sixel import (
+    MAX_COLORS,
+    Segment,
+    _assign_passes,
+    _iter_greedy_passes,
+    _iter_passes,
+    _pack_band,
+)
+
+
+def _rescan_passes(segments: list[Segment]) -> list[list[Segment]]:
+    passes = []
+    while segments:
+        pass_segments, segments = _iter_greedy_passes(segments)
+        passes.append(pass_segments)
+    return passes
+
+
+def _staggered_segments(width: int, bands: int) -> list[list[Segment]]:
+    segments = [(x, x + 30, color) for color in range(MAX_COLORS) for x in range(color * 7 % 40, width - 30, 40)]
+    segments.sort(key=lambda seg: (seg[0], seg[0] - seg[1], seg[2]))
+    return [segments] * bands
+
+
+def _sorted_segments(image: PILImage.Image) -> list[list[Segment]]:
+    width = image.width
+    data = image.tobytes()
+    band_data = [bytearray(width) for _ in range(MAX_COLORS)]
+    result = []
+    for band_y in range(0, image.height, 6):
+        segments = _pack_band(data, band_y, 6, width, band_data)
+        result.append(sorted(segments, key=lambda seg: (seg[0], seg[0] - seg[1], seg[2])))
+        for color in {seg[2] for seg in segments}:
+            band_data[color][:] = bytes(width)
+    return result
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--bands", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    size = (arguments.width, arguments.bands * 6)
+    noise = PILImage.effect_noise(size, 96)
+    with PILImage.open(Path(__file__).parent.parent / "textual_image" / "gracehopper.jpg") as photo:
+        dithered = photo.convert("RGB").resize(size).quantize(256, dither=PILImage.Dither.FLOYDSTEINBERG)
+
+    for label, image in (
+        ("noise, 16 colors", noise.quantize(16)),
+        ("noise, 64 colors", noise.quantize(64)),
+        ("noise, 256 colors", noise.quantize(256)),
+        ("dithered photo", dithered),
+        ("staggered segments", None),
+    ):
+        bands = _staggered_segments(*size) if image is None else _sorted_segments(image)
+        for segments in bands:
+            assert _assign_passes(segments) == list(_iter_passes(segments)) == _rescan_passes(segments)
+
+        n_segments = sum(len(segments) for segments in bands) / len(bands)
+        n_passes = sum(len(_assign_passes(segments)) for segments in bands) / len(bands)
+        print(f"{label}: {n_segments:.0f} segments, {n_passes:.1f} passes per band")
+        for name, assign in (
+            ("rescan", _rescan_passes),
+            ("heap", _assign_passes),
+            ("hybrid", lambda segments: list(_iter_passes(segments))),
+        ):
+            best = min(
+                timeit.repeat(lambda: [assign(s) for s in bands], number=1, repeat=arguments.repeat)  # noqa: B023
+            )
+            print(f"    {name:<8} {best / len(bands) * 1e3:8.3f} ms per band")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""Weigh the output bytes the ``smooth`` option saves against the time it costs.
+
+Every image is encoded without smoothing and with each filter size.  The
+mode filter alone is timed both as Pillow's ``ModeFilter`` and as the
+vectorized filter the encoder uses with NumPy, which must agree.  The
+encode time includes the vectorized filter.
+"""
+
+import timeit
+from argparse import ArgumentParser
+from pathlib import Path
+
+from PIL import Image as PILImage
+from PIL import ImageFilter
+
+from textual_image._sixel import SixelOptions, _mode_filter, _prepare_image, image_to_sixels
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments = parser.parse_args()
+
+    size = (arguments.width, arguments.height)
+    with PILImage.open(Path(__file__).parent.parent / "textual_image" / "gracehopper.jpg") as opened:
+        photo = opened.convert("RGB").resize(size)
+
+    for label, image in (
+        ("photo", photo),
+        ("photo, 32 colors", photo.quantize(32).convert("RGB")),
+        ("gradient", PILImage.merge("RGB", [PILImage.linear_gradient("L").resize(size)] * 2 + [photo.convert("L")])),
+    ):
+        paletted, _ = _prepare_image(image, SixelOptions(), None)
+        plain = len(image_to_sixels(image))
+        plain_time = min(timeit.repeat(lambda: image_to_sixels(image), number=1, repeat=arguments.repeat))  # noqa: B023
+        print(f"{label}: {plain} bytes in {plain_time * 1e3:.1f} ms without smoothing")
+
+        for smooth in (3, 5, 7):
+            options = SixelOptions(smooth=smooth)
+            assert (
+                _mode_filter(paletted, smooth).tobytes()
+                == paletted.filter(ImageFilter.ModeFilter(size=smooth)).tobytes()
+            )
+            pillow, vectorized, encode = (
+                min(timeit.repeat(run, number=1, repeat=arguments.repeat))
+                for run in (
+                    lambda: paletted.filter(ImageFilter.ModeFilter(size=smooth)),  # noqa: B023
+                    lambda: _mode_filter(paletted, smooth),  # noqa: B023
+                    lambda: image_to_sixels(image, options),  # noqa: B023
+                )
+            )
+            saved = plain - len(image_to_sixels(image, options))
+            print(
+                f"    smooth={smooth}  saves {saved:>8} bytes ({saved / plain:6.1%})"
+                f"  filter: Pillow {pillow * 1e3:6.1f} ms, vectorized {vectorized * 1e3:6.1f} ms"
+                f"  encode +{(encode - plain_time) * 1e3:6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -17,3 +17,11 @@ def mock_cell_size() -> None:
     from textual_image._terminal import CellSize, get_cell_size
 
     setattr(get_cell_size, "_result", CellSize(10, 20))
+
+
+# The image cache is shared by the whole process, so every test starts with an empty one
+@fixture(autouse=True)
+def clear_image_cache() -> None:
+    from textual_image._pixeldata import image_cache
+
+    image_cache.clear()
@@ -25,6 +25,17 @@ def test_render_non_seekable() -> None:
     assert render(renderable) == render(renderable)
 
 
+def test_size_hint() -> None:
+    from textual_image.renderable.halfcell import Image
+
+    renderable = Image(TEST_IMAGE, width=4, size_hint=(100, 100))
+    assert (renderable._image_data.width, renderable._image_data.height) == (130, 152)
+    assert renderable.__rich_measure__(Console(), CONSOLE_OPTIONS) == Measurement(4, 4)
+    # The size to render at is measured from the full image, not from the pixels decoded for the hint
+    measure = Image(TEST_IMAGE, size_hint=(40, 20)).__rich_measure__(Console(), CONSOLE_OPTIONS)
+    assert measure == Image(TEST_IMAGE).__rich_measure__(Console(), CONSOLE_OPTIONS)
+
+
 def test_measure() -> None:
     from textual_image.renderable.halfcell import Image
 
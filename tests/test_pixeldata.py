@@ -1,9 +1,23 @@
+import os
+import shutil
 from base64 import b64decode
+from pathlib import Path
 
+import pytest
 from PIL import Image as PILImage
+from PIL.Image import core as pil_core  # type: ignore[attr-defined]
 
 from tests.data import TEST_IMAGE
-from textual_image._pixeldata import PixelData, PixelMeta, ensure_image
+from textual_image._pixeldata import (
+    ImageCache,
+    ImageCacheStats,
+    PixelBuffer,
+    PixelData,
+    PixelMeta,
+    ensure_image,
+    image_cache,
+    is_pixel_array,
+)
 
 
 def test_ensure_image() -> None:
@@ -20,6 +34,19 @@ def test_ensure_image() -> None:
             assert image is opened_image
 
 
+def test_ensure_image_size_hint() -> None:
+    with ensure_image(TEST_IMAGE, size_hint=(100, 100)) as image:
+        assert image.size == (130, 152)  # JPEG decoded at 1/4 scale, the smallest still covering the hint
+
+    with TEST_IMAGE.open("rb") as file:
+        with ensure_image(file, size_hint=(0, 0)) as image:
+            assert image.size == (65, 76)
+
+    with PILImage.open(TEST_IMAGE) as opened_image:
+        with ensure_image(opened_image, size_hint=(100, 100)) as image:
+            assert image.size == (517, 606)  # Images passed in are left alone
+
+
 def test_pixel_meta() -> None:
     with PILImage.open(TEST_IMAGE) as image:
         meta = PixelMeta(image)
@@ -40,6 +67,24 @@ def test_pixel_data_size() -> None:
         assert data.height == image.height
 
 
+def test_pixel_data_size_hint() -> None:
+    data = PixelData(TEST_IMAGE, mode="rgb", size_hint=(200, 300))
+    assert (data.width, data.height) == (259, 303)
+    assert data.pil_image.mode == "RGB"
+
+
+def test_pixel_data_source_size() -> None:
+    full_size = (PixelMeta(TEST_IMAGE).width, PixelMeta(TEST_IMAGE).height)
+    assert PixelData(TEST_IMAGE, size_hint=(100, 100)).source_size == full_size
+    # Cached drafts keep the size of the file, whichever call decoded them
+    assert PixelData(TEST_IMAGE).source_size == full_size
+    with TEST_IMAGE.open("rb") as file:
+        assert PixelData(file, size_hint=(100, 100)).source_size == full_size
+    assert PixelData(TEST_IMAGE).scaled(32, 16).source_size == (32, 16)
+    with PILImage.open(TEST_IMAGE) as image:
+        assert PixelData(image).source_size == full_size
+
+
 def test_pixel_data_pil_image() -> None:
     data = PixelData(TEST_IMAGE)
     assert isinstance(data.pil_image, PILImage.Image)
@@ -66,3 +111,140 @@ def test_pixel_data_iteration() -> None:
     data = PixelData(TEST_IMAGE).scaled(8, 8)
     assert len(list(data)) == 8
     assert all(len(list(row)) == 8 for row in data)
+
+
+def _images_created() -> int:
+    # Pillow allocates pixel data in C, where tracemalloc can't see it, but counts every image it creates
+    return int(pil_core.get_stats()["new_count"])
+
+
+def test_pixel_data_does_not_copy_images_it_opened() -> None:
+    created = _images_created()
+    data = PixelData(TEST_IMAGE)
+    assert _images_created() - created == 1  # Just the decoded image
+
+    created = _images_created()
+    data.scaled(100, 100).cropped(10, 10, 50, 50)
+    assert _images_created() - created == 3  # Two resampling passes and the crop
+
+    created = _images_created()
+    assert data.scaled(data.width, data.height).cropped(0, 0, data.width, data.height) is data
+    assert _images_created() - created == 0
+
+
+def test_pixel_data_copies_images_passed_in_once() -> None:
+    image = PILImage.open(TEST_IMAGE)
+    image.load()
+    created = _images_created()
+    copied = PixelData(image)
+    converted = PixelData(image, mode="grayscale")
+    assert _images_created() - created == 2
+    assert converted.pil_image.mode == "L"
+
+    # Closing the image passed in leaves the copy intact
+    image.close()
+    assert len(list(copied.scaled(4, 4))) == 4
+
+
+def test_pixel_data_wraps_pixel_buffers_without_copying() -> None:
+    pixels = bytearray(range(20))
+    data = PixelData(PixelBuffer(memoryview(pixels), (5, 4), "L"))
+    assert (data.width, data.height) == (5, 4)
+
+    pixels[6] = 200
+    assert data.pil_image.getpixel((1, 1)) == 200
+
+    meta = PixelMeta(PixelBuffer(pixels, (4, 5), "L"))
+    assert (meta.width, meta.height) == (4, 5)
+
+    with pytest.raises(ValueError):
+        PixelData(PixelBuffer(pixels, (5, 5), "L"))
+
+
+def test_pixel_data_wraps_arrays_without_copying() -> None:
+    np = pytest.importorskip("numpy")
+
+    frame = np.zeros((4, 5, 4), dtype=np.uint8)
+    data = PixelData(frame)
+    assert (data.width, data.height) == (5, 4)
+    assert data.pil_image.mode == "RGBA"
+
+    frame[1, 2] = (1, 2, 3, 4)
+    assert data.pil_image.getpixel((2, 1)) == (1, 2, 3, 4)
+
+    # PIL keeps RGB with a padding byte, so RGB frames are converted, once
+    assert PixelData(np.zeros((4, 5, 3), dtype=np.uint8), mode="rgb").pil_image.size == (5, 4)
+
+
+def test_is_pixel_array() -> None:
+    np = pytest.importorskip("numpy")
+
+    assert is_pixel_array(np.zeros((2, 2), dtype=np.uint8))
+    assert is_pixel_array(PixelBuffer(bytes(4), (2, 2), "L"))
+    assert not is_pixel_array(PILImage.new("L", (2, 2)))
+    assert not is_pixel_array(TEST_IMAGE)
+
+
+def test_image_cache_hands_out_decoded_images() -> None:
+    first = PixelData(TEST_IMAGE)
+    assert PixelMeta(TEST_IMAGE).width == first.width
+    second = PixelData(str(TEST_IMAGE), mode="rgb")
+    with ensure_image(TEST_IMAGE) as image:
+        assert image is first.pil_image
+
+    assert image_cache.stats() == ImageCacheStats(hits=2, misses=1, evictions=0, entries=1, bytes=517 * 606 * 4)
+    assert second.pil_image is not first.pil_image  # Converted from the cached image
+
+
+def test_image_cache_decodes_again_for_larger_size_hints() -> None:
+    small = PixelData(TEST_IMAGE, size_hint=(100, 100))
+    assert PixelData(TEST_IMAGE, size_hint=(50, 50)).pil_image is small.pil_image
+    assert PixelMeta(TEST_IMAGE).width == 517
+
+    larger = PixelData(TEST_IMAGE, size_hint=(200, 200))
+    assert larger.width == 259
+    full = PixelData(TEST_IMAGE)
+    assert full.width == 517
+    assert PixelData(TEST_IMAGE, size_hint=(200, 200)).pil_image is full.pil_image
+    assert image_cache.stats()[:2] == (2, 3)
+
+
+def test_image_cache_decodes_changed_files_again(tmp_path: Path) -> None:
+    path = tmp_path / "image.jpg"
+    shutil.copy(TEST_IMAGE, path)
+    first = PixelData(path)
+
+    with PILImage.open(TEST_IMAGE) as image:
+        image.resize((20, 10)).save(path)
+    os.utime(path, ns=(0, 0))
+
+    assert PixelMeta(path).width == 20
+    assert PixelData(path).pil_image is not first.pil_image
+    assert image_cache.stats().entries == 1
+
+
+def test_image_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    a, b, c, d = paths = [tmp_path / f"{name}.png" for name in "abcd"]
+    for path in paths:
+        PILImage.new("L", (400, 200)).save(path)  # 80000 bytes decoded
+    cache = ImageCache(max_bytes=250_000)
+
+    first_a, first_b, _ = cache.open(a), cache.open(b), cache.open(c)
+    assert cache.open(a) is first_a
+    cache.open(d)
+    assert cache.stats() == ImageCacheStats(hits=1, misses=4, evictions=1, entries=3, bytes=240_000)
+    assert cache.open(a) is first_a
+    assert cache.open(b) is not first_b  # Least recently used, so evicted for d
+
+    cache.max_bytes = 100_000
+    assert cache.max_bytes == 100_000
+    assert cache.stats()[2:] == (4, 1, 80_000)
+
+    cache.max_bytes = 0
+    assert cache.open(c) is not cache.open(c)
+    assert cache.stats().entries == 0
+
+    cache.max_bytes = 100_000
+    cache.open(c)
+    cache.clear()
+    assert cache.stats() == ImageCacheStats(0, 0, 0, 0, 0)
@@ -1,17 +1,61 @@
+import random
+import re
+from dataclasses import replace
+from typing import cast
 from unittest.mock import patch
 
 import pytest
 from PIL import Image as PILImage
+from PIL import ImageFilter
 from syrupy.assertion import SnapshotAssertion
 
 from tests.data import TEST_IMAGE
+from tests.utils import percent_pixels
 from textual_image._sixel import (
+    MAX_COLORS,
+    QuantizeMethod,
+    SixelEncoder,
     SixelOptions,
+    _assign_passes,
+    _BandCache,
     _compact_palette,
+    _estimate_sixels,
     _iter_bands,
+    _iter_budget_candidates,
+    _iter_greedy_passes,
+    _iter_passes,
     _LazyColorTracker,
+    _map_exact_colors,
+    _map_to_fixed_palette,
+    _mode_filter,
+    _PaletteColorTracker,
+    _prepare_image,
+    _replay_band,
+    _rle_encode_segments,
+    _uniform_palette,
+    fit_sixel_options,
     image_to_sixels,
+    iter_sixels,
+    palette_from_image,
 )
+from textual_image._sixel_decoder import decode_sixels
+
+
+def _random_image(width: int, height: int, colors: int, transparent: bool, seed: int) -> PILImage.Image:
+    """Random RGBA image with a few colors, gap-splitting empty stripes and optional transparent holes."""
+    rng = random.Random(seed)
+    palette = [(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(colors)]
+    image = PILImage.new("RGBA", (width, height))
+    image.putdata(
+        [
+            (0, 0, 0, 0)
+            if transparent and rng.random() < 0.2
+            else (*(palette[0] if width // 3 <= x < width // 3 + 12 else rng.choice(palette)), 255)
+            for _ in range(height)
+            for x in range(width)
+        ]
+    )
+    return image
 
 
 def test_image_to_sixels(snapshot: SnapshotAssertion) -> None:
@@ -24,7 +68,7 @@ def test_image_to_sixels(snapshot: SnapshotAssertion) -> None:
 def test_default_quantize_matches_fastoctree_and_is_smaller_than_adaptive() -> None:
     """The default quantizer should stay on the compact fastoctree path."""
     with PILImage.open(TEST_IMAGE) as opened_image:
-        image = opened_image.resize((16, 16))
+        image = opened_image.resize((64, 64))
 
     default_result = image_to_sixels(image)
     fastoctree_result = image_to_sixels(image, SixelOptions(quantize="fastoctree"))
@@ -67,6 +111,57 @@ def test_grayscale_input_skips_requantize() -> None:
         image_to_sixels(image)
 
 
+@pytest.mark.parametrize(
+    "colors",
+    [
+        [(0, 0, 0), (1, 0, 0), (2, 0, 0), (3, 1, 0), (255, 254, 253), (128, 0, 255)],
+        [(v, v, v) for v in range(0, 200, 2)],
+    ],
+    ids=["near-duplicates", "wide-channels"],
+)
+def test_few_color_rgb_input_maps_exactly_without_quantizing(colors: list[tuple[int, int, int]]) -> None:
+    """RGB inputs within budget keep every color, even those Pillow's palette lookup would merge."""
+    image = PILImage.new("RGB", (len(colors), 3))
+    image.putdata(colors * 3)
+
+    mapped = _map_exact_colors(image, 256)
+
+    assert mapped is not None
+    assert mapped.convert("RGB").tobytes() == image.tobytes()
+    with patch("textual_image._sixel._quantize_rgb_image", side_effect=AssertionError("unexpected requantize")):
+        image_to_sixels(image)
+
+
+def test_map_exact_colors_declines_images_over_budget() -> None:
+    """Images with more colors than requested, or none at all, are left to the quantizer."""
+    image = PILImage.new("RGB", (3, 1))
+    image.putdata([(0, 0, 0), (1, 0, 0), (2, 0, 0)])
+
+    assert _map_exact_colors(image, 2) is None
+    assert _map_exact_colors(PILImage.new("RGB", (0, 0)), 2) is None
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5, 6, 7, 9])
+@pytest.mark.parametrize("shape", [(1, 1), (3, 70), (70, 3), (0, 5), (23, 140)])
+def test_mode_filter_matches_pillow(size: int, shape: tuple[int, int]) -> None:
+    """The vectorized mode filter picks the same indices as Pillow, ties and image borders included."""
+    pytest.importorskip("numpy")
+
+    rng = random.Random(size * 1000 + shape[0])
+    width, height = shape
+    image = PILImage.new("P", shape)
+    image.putpalette([rng.randrange(256) for _ in range(768)])
+    # Few colors in blocky clusters, so windows have clear winners as well as ties
+    image.putdata([(x // 3 + y // 2 * 5 + rng.randrange(3)) % 7 * 30 for y in range(height) for x in range(width)])
+
+    with patch("textual_image._sixel._MODE_FILTER_STRIP_ROWS", 16):
+        filtered = _mode_filter(image, size)
+
+    expected = image.filter(ImageFilter.ModeFilter(size=size))
+    assert filtered.tobytes() == expected.tobytes()
+    assert filtered.getpalette() == image.getpalette()
+
+
 def test_reuses_active_palette_tag_across_bands() -> None:
     """A single-color multi-band image should not repeat the same body tag."""
     image = PILImage.new("RGB", (4, 8), color=(255, 0, 0))
@@ -164,7 +259,7 @@ def test_image_to_sixels_mixed_alpha_pixels_assume_black_background() -> None:
 
     result = image_to_sixels(image)
 
-    assert result == '\x1bP0;0;0q"1;1;2;1#0;2;0;100;0#1;2;50;0;0#1@#0@-\x1b\\'
+    assert result == '\x1bP0;0;0q"1;1;2;1#0;2;0;100;0#1;2;50;0;0#0@@$#1@-\x1b\\'
 
 
 def test_image_to_sixels_numpy_path() -> None:
@@ -252,8 +347,8 @@ def test_lazy_color_palette_defines_registers_inline() -> None:
     upfront = image_to_sixels(image)
     lazy = image_to_sixels(image, SixelOptions(lazy_color_palette=True))
 
-    assert upfront == '\x1bP0;0;0q"1;1;2;1#0;2;0;100;0#1;2;100;0;0#1@#0@-\x1b\\'
-    assert lazy == '\x1bP0;0;0q"1;1;2;1#1;2;100;0;0@#0;2;0;100;0@-\x1b\\'
+    assert upfront == '\x1bP0;0;0q"1;1;2;1#0;2;0;100;0#1;2;100;0;0#0@@$#1@-\x1b\\'
+    assert lazy == '\x1bP0;0;0q"1;1;2;1#0;2;0;100;0@@$#1;2;100;0;0@-\x1b\\'
 
 
 def test_compact_palette_reindexes_sparse_colors() -> None:
@@ -282,3 +377,632 @@ def test_compact_palette_deduplicates_identical_sixel_colors() -> None:
 
     assert remapped == bytes([0, 0, 0, 0])
     assert color_registers == (b"#0;2;100;0;0",)
+
+
+@pytest.mark.parametrize("size", [(1, 1), (7, 5), (40, 17), (64, 64), (3, 401), (0, 0), (5, 0), (0, 5)])
+@pytest.mark.parametrize("colors", [2, 6, 200])
+@pytest.mark.parametrize("transparent", [False, True])
+@pytest.mark.parametrize("lazy", [False, True])
+def test_vectorized_encoder_matches_pure_python(
+    size: tuple[int, int], colors: int, transparent: bool, lazy: bool
+) -> None:
+    """The whole-image NumPy encoder is byte-identical to the pure-Python band loop."""
+    pytest.importorskip("numpy")
+
+    image = _random_image(*size, colors=colors, transparent=transparent, seed=sum(size) + colors)
+    options = SixelOptions(lazy_color_palette=lazy)
+
+    with patch("textual_image._sixel._HAS_NUMPY", False):
+        expected = image_to_sixels(image, options)
+
+    assert image_to_sixels(image, options) == expected
+
+
+@pytest.mark.parametrize("transparent", [False, True])
+def test_pure_python_packers_match_vectorized_encoder(transparent: bool) -> None:
+    """Rare, common and many-color bands take different pure-Python packers with identical output."""
+    pytest.importorskip("numpy")
+
+    rng = random.Random(8)
+    image = PILImage.new("RGBA", (320, 18), (10, 20, 30, 255))
+    # Band 0: a few far-apart specks of rare colors on a common background
+    for x, y in [(3, 1), (40, 4), (41, 0), (300, 5), (150, 2)]:
+        image.putpixel((x, y), (200, 0, x % 256, 255))
+    # Band 1: two common colors in wide stripes
+    for x in range(320):
+        for y in range(6, 12):
+            image.putpixel((x, y), (0, 255, 0, 255) if (x // 40) % 2 else (0, 0, 255, 255))
+    # Band 2: many colors
+    for x in range(320):
+        for y in range(12, 18):
+            image.putpixel((x, y), (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255))
+    if transparent:
+        for x in range(0, 320, 7):
+            image.putpixel((x, x % 18), (0, 0, 0, 0))
+
+    with patch("textual_image._sixel._HAS_NUMPY", False):
+        expected = image_to_sixels(image)
+
+    assert image_to_sixels(image) == expected
+
+
+def test_vectorized_encoder_continues_tracker_state() -> None:
+    """Band offsets and the tracker's active color match the pure-Python encoder."""
+    pytest.importorskip("numpy")
+
+    from textual_image._sixel import _encode_bands_np
+
+    data = bytes([0] * 34 + [1])
+    py_tracker = _PaletteColorTracker(_active=0)
+    np_tracker = _PaletteColorTracker(_active=0)
+
+    py_bands = _iter_bands(data, 7, 5, py_tracker)
+    body, band_ends = _encode_bands_np(data, 7, 5, np_tracker)
+
+    assert body == b"".join(py_bands) == b"!7^$#1!6?O-"
+    assert band_ends == [len(body)]
+    assert np_tracker == py_tracker
+
+
+def test_sparse_bitmasks_merge_rows_and_skip_hidden_pixels() -> None:
+    """Per-color bitmasks of a column combine all its rows; hidden and padding rows add nothing."""
+    np = pytest.importorskip("numpy")
+
+    from textual_image._sixel import _sparse_bitmasks_np
+
+    arr = np.array([[1, 0], [0, 0], [1, 2], [0, 0], [0, 0], [0, 0], [2, 1]], dtype=np.uint8)
+    mask = np.ones_like(arr)
+    mask[2, 1] = 0
+
+    band, color, column, bits = _sparse_bitmasks_np(arr, mask)
+
+    assert band.tolist() == [0, 0, 0, 1, 1]
+    assert color.tolist() == [0, 0, 1, 1, 2]
+    assert column.tolist() == [0, 1, 0, 1, 0]
+    assert bits.tolist() == [0b111010, 0b111011, 0b000101, 0b000001, 0b000001]
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+def test_iter_sixels_yields_header_bands_and_terminator(has_numpy: bool) -> None:
+    """Streaming output is split into header, one chunk per band and the terminator."""
+    if has_numpy:
+        pytest.importorskip("numpy")
+
+    image = _random_image(5, 200, colors=4, transparent=False, seed=3)
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        chunks = list(iter_sixels(image))
+        expected = image_to_sixels(image)
+
+    assert bytes(chunks[0]).startswith(b'\x1bP0;0;0q"1;1;5;200#0;2;')
+    assert chunks[-1] == b"\x1b\\"
+    assert len(chunks) == 2 + 34
+    assert all(bytes(chunk).endswith(b"-") for chunk in chunks[1:-1])
+    assert b"".join(chunks).decode("ascii") == expected
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+@pytest.mark.parametrize("colors", [1, 2, 200])
+@pytest.mark.parametrize("lazy", [False, True])
+def test_parallel_encoding_matches_serial(has_numpy: bool, colors: int, lazy: bool) -> None:
+    """Strips encoded on worker threads are stitched back into the serial output."""
+    image = _random_image(30, 400, colors, transparent=colors == 2, seed=colors)
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        serial = image_to_sixels(image, SixelOptions(lazy_color_palette=lazy))
+        parallel = image_to_sixels(image, SixelOptions(lazy_color_palette=lazy, workers=3))
+
+    assert parallel == serial
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+@pytest.mark.parametrize("options", [SixelOptions(), SixelOptions(lazy_color_palette=True), SixelOptions(workers=2)])
+def test_encoder_matches_image_to_sixels_across_frames(has_numpy: bool, options: SixelOptions) -> None:
+    """An encoder reusing its buffers produces the same output as encoding every frame from scratch."""
+    frames = [
+        _random_image(40, 230, colors, transparent=transparent, seed=colors)
+        for colors, transparent in [(200, False), (3, True), (200, True), (1, False)]
+    ]
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        encoder = SixelEncoder(40, 230, options)
+        for frame in frames:
+            assert encoder.encode(frame) == image_to_sixels(frame, options)
+
+
+def test_encoder_buffers_survive_abandoned_frames() -> None:
+    """Closing a frame's iterator early leaves the encoder ready for the next frame."""
+    frame = _random_image(40, 30, 200, transparent=False, seed=1)
+    encoder = SixelEncoder(40, 30)
+
+    with patch("textual_image._sixel._HAS_NUMPY", False):
+        chunks = encoder.iter_encode(frame)
+        next(chunks)
+        next(chunks)
+        chunks.close()  # type: ignore[attr-defined]
+
+        assert encoder.encode(frame) == image_to_sixels(frame)
+
+
+def test_encoder_rejects_frames_of_another_size() -> None:
+    encoder = SixelEncoder(40, 30)
+
+    with pytest.raises(ValueError, match="Expected a 40x30 image, got 30x40"):
+        encoder.encode(PILImage.new("RGB", (30, 40)))
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+@pytest.mark.parametrize("lazy", [False, True])
+def test_fixed_palette_maps_frames_onto_shared_registers(has_numpy: bool, lazy: bool) -> None:
+    """Frames are mapped onto the fixed palette, whose registers keep their order and are not requantized."""
+    palette = ((0, 0, 0), (255, 0, 0), (0, 0, 255), (255, 255, 255))
+    options = SixelOptions(palette=palette, lazy_color_palette=lazy)
+    frames = [
+        _random_image(20, 13, 50, transparent=transparent, seed=seed) for seed, transparent in [(1, False), (2, True)]
+    ]
+
+    with (
+        patch("textual_image._sixel._HAS_NUMPY", has_numpy),
+        patch("textual_image._sixel._quantize_rgb_image", side_effect=AssertionError("unexpected requantize")),
+    ):
+        outputs = [image_to_sixels(frame, options) for frame in frames]
+
+    registers = "#0;2;0;0;0#1;2;100;0;0#2;2;0;0;100#3;2;100;100;100"
+    for output in outputs:
+        body = output.split('"1;1;20;13', 1)[1]
+        assert body.startswith(registers) != lazy
+        assert set(re.findall(r"#(\d+)", body)) <= {"0", "1", "2", "3"}
+
+
+@pytest.mark.parametrize(
+    ("palette", "message"),
+    [
+        ((), "A palette holds 1 to 256 colors, got 0"),
+        (((0, 0, 0),) * 257, "A palette holds 1 to 256 colors, got 257"),
+        (((0, 0, 0), (255, 0)), r"RGB triples of values from 0 to 255, got \(255, 0\)"),
+        (((0, 0, 0), (0, 256, 0)), r"RGB triples of values from 0 to 255, got \(0, 256, 0\)"),
+    ],
+)
+def test_fixed_palette_is_validated(palette: tuple[tuple[int, ...], ...], message: str) -> None:
+    """Empty, oversized and non-RGB palettes are rejected up-front instead of producing invalid sixels."""
+    with pytest.raises(ValueError, match=message):
+        SixelOptions(palette=cast("tuple[tuple[int, int, int], ...]", palette))
+
+
+def test_fixed_palette_maps_colors_it_holds_exactly() -> None:
+    """Images whose colors are all in the palette keep them, even where Pillow's palette lookup would not."""
+    colors = [(40, 42, 54), (68, 71, 90), (98, 114, 164), (248, 248, 242), (255, 121, 198), (80, 250, 123)]
+    image = PILImage.new("RGB", (48, 30))
+    for i, color in enumerate(colors):
+        image.paste(color, (i * 8, 0, i * 8 + 8, 30))
+    image.paste(colors[3], (2, 10, 40, 12))
+    crop = image.crop((5, 3, 29, 20))
+    palette = ((44, 44, 56), *reversed(colors), (66, 70, 90))
+
+    with patch("textual_image._sixel._quantize_rgb_image", side_effect=AssertionError("unexpected requantize")):
+        output = image_to_sixels(image, SixelOptions(palette=palette))
+        crop_output = image_to_sixels(crop, SixelOptions(palette=palette_from_image(image)))
+
+    assert decode_sixels(output).colors() == percent_pixels(image)
+    assert decode_sixels(crop_output).colors() == percent_pixels(crop)
+    assert _map_to_fixed_palette(PILImage.new("RGB", (0, 3)), palette) is None
+
+
+@pytest.mark.parametrize(
+    ("colors", "palette_size", "gray"),
+    [(256, 252, False), (100, 100, False), (16, 16, False), (8, 8, False), (4, 4, True)],
+)
+def test_uniform_palette_spreads_levels_over_the_channels(colors: int, palette_size: int, gray: bool) -> None:
+    """Green gets a level first, then red and blue; fewer than 8 colors make a gray ramp."""
+    palette = _uniform_palette(colors).palette
+
+    assert len(palette) == palette_size == len(set(palette))
+    assert palette[0] == (0, 0, 0)
+    assert palette[-1] == (255, 255, 255)
+    assert all(r == g == b for r, g, b in palette) == gray
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+@pytest.mark.parametrize("quantize", ["uniform", "ordered"])
+@pytest.mark.parametrize("colors", [256, 4])
+def test_uniform_quantize_maps_onto_fixed_registers(has_numpy: bool, quantize: QuantizeMethod, colors: int) -> None:
+    """Every register of the uniform palette is defined up front, and pixels land on nearby levels."""
+    image = _random_image(30, 20, 40, transparent=False, seed=8)
+    options = SixelOptions(colors=colors, quantize=quantize)
+
+    with (
+        patch("textual_image._sixel._HAS_NUMPY", has_numpy),
+        patch("textual_image._sixel._quantize_rgb_image", side_effect=AssertionError("unexpected requantize")),
+    ):
+        result = image_to_sixels(image, options)
+
+    palette = _uniform_palette(colors).palette
+    assert len(re.findall(r"#\d+;2;", result)) == len(palette)
+    decoded = decode_sixels(result).colors()
+    expected = percent_pixels(image if colors > 4 else image.convert("L").convert("RGB"))
+    step = 100 / (5 if colors > 4 else 3)
+    tolerance = (step if quantize == "ordered" else step / 2) + 1
+    for decoded_row, expected_row in zip(decoded, expected, strict=True):
+        for pixel, original in zip(decoded_row, expected_row, strict=True):
+            assert pixel is not None and original is not None
+            assert all(abs(a - b) <= tolerance for a, b in zip(pixel, original, strict=True))
+
+
+def test_ordered_dither_keeps_the_mean_color_of_flat_areas() -> None:
+    """Uniform quantization rounds a flat color to one level, ordered dithering mixes the levels around it."""
+    image = PILImage.new("RGB", (16, 16), (100, 150, 200))
+
+    uniform = decode_sixels(image_to_sixels(image, SixelOptions(quantize="uniform"))).colors()
+    ordered = decode_sixels(image_to_sixels(image, SixelOptions(quantize="ordered"))).colors()
+
+    assert {pixel for row in uniform for pixel in row} == {(40, 67, 80)}
+    pixels = [cast("tuple[int, int, int]", pixel) for row in ordered for pixel in row]
+    assert len(set(pixels)) > 1
+    for channel, percent in enumerate((100 * 100 / 255, 150 * 100 / 255, 200 * 100 / 255)):
+        assert abs(sum(pixel[channel] for pixel in pixels) / len(pixels) - percent) < 1
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+@pytest.mark.parametrize("options", [SixelOptions(), SixelOptions(lazy_color_palette=True, elide_background=True)])
+def test_bilevel_images_skip_the_band_packers(has_numpy: bool, options: SixelOptions) -> None:
+    """Images with up to two colors are encoded from their rows straight away, and decode to the same pixels."""
+    rng = random.Random(9)
+    noise = PILImage.frombytes("1", (45, 20), rng.randbytes(6 * 20))
+    two_colors = _random_image(31, 13, 2, transparent=False, seed=10)
+    single_color = PILImage.new("RGB", (9, 8), (0, 0, 255))
+
+    with (
+        patch("textual_image._sixel._HAS_NUMPY", has_numpy),
+        patch("textual_image._sixel._pack_band", side_effect=AssertionError("unexpected band packing")),
+        patch("textual_image._sixel._encode_bands_np", side_effect=AssertionError("unexpected band packing")),
+        patch("textual_image._sixel._compact_palette_np", side_effect=AssertionError("unexpected NumPy compaction")),
+    ):
+        for image in (noise, two_colors, single_color):
+            assert decode_sixels(image_to_sixels(image, options)).colors() == percent_pixels(image)
+
+
+def test_bilevel_bands_are_filled_with_the_color_of_more_whole_columns() -> None:
+    image = PILImage.new("1", (12, 9), 1)
+    image.putpixel((3, 0), 0)
+    image.paste(0, (0, 6, 12, 9))
+    image.putpixel((5, 7), 1)
+
+    result = image_to_sixels(image)
+    elided = image_to_sixels(image, SixelOptions(elide_background=True))
+
+    registers = '\x1bP0;0;0q"1;1;12;9#0;2;100;100;100#1;2;0;0;0'
+    assert result == registers + "#0!12~$#1???@-!12F$#0!5?A-\x1b\\"
+    assert elided == registers + "#1???@-!5FD!6F-\x1b\\"
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("mode", ["RGBA", "P"])
+def test_transparent_margins_are_trimmed(has_numpy: bool, workers: int, mode: str) -> None:
+    """Only the bounding box of the visible pixels is prepared and encoded, widened up to the top of its band."""
+    image = PILImage.new("RGBA", (60, 40), (0, 0, 0, 0))
+    image.paste(_random_image(20, 8, 5, transparent=False, seed=11), (25, 9))
+    image.paste(_random_image(20, 8, 5, transparent=False, seed=12), (30, 27))
+    if mode == "P":
+        image = image.quantize(colors=16, method=PILImage.Quantize.FASTOCTREE)
+        image.info["transparency"] = image.getpixel((0, 0))
+
+    with (
+        patch("textual_image._sixel._HAS_NUMPY", has_numpy),
+        patch("textual_image._sixel._prepare_image", wraps=_prepare_image) as prepare,
+    ):
+        result = image_to_sixels(image, SixelOptions(workers=workers))
+        empty = image_to_sixels(PILImage.new("LA", (10, 20)), SixelOptions(workers=workers))
+        no_columns = image_to_sixels(PILImage.new("RGB", (0, 5)), SixelOptions(workers=workers))
+
+    assert prepare.call_args_list[0].args[0].size == (25, 29)
+    assert result.startswith('\x1bP0;1;0q"1;1;60;40')
+    assert decode_sixels(result).colors() == percent_pixels(image)
+    assert empty == '\x1bP0;1;0q"1;1;10;20----\x1b\\'
+    assert no_columns == '\x1bP0;0;0q"1;1;0;5-\x1b\\'
+
+
+def test_palette_from_image_reproduces_a_flat_reference_frame() -> None:
+    """Encoding a reference frame with few colors with its own palette matches encoding it normally."""
+    image = PILImage.new("RGB", (10, 6), (0, 0, 255))
+    image.paste((255, 0, 0), (0, 0, 4, 6))
+    image.paste((0, 128, 0), (4, 0, 5, 6))
+
+    palette = palette_from_image(image)
+
+    assert palette == ((0, 0, 255), (255, 0, 0), (0, 128, 0))
+    assert image_to_sixels(image, SixelOptions(palette=palette)) == image_to_sixels(image)
+
+
+@pytest.mark.parametrize(
+    ("size", "colors", "max_mean_error", "max_p99_error"),
+    [((320, 180), 256, 1.25, 15), ((800, 600), 256, 1.25, 15), ((320, 180), 64, 2, 22)],
+)
+def test_palette_from_image_stays_close_to_a_photo(
+    size: tuple[int, int], colors: int, max_mean_error: float, max_p99_error: int
+) -> None:
+    """A photo mapped onto its own palette lands near its direct quantization, if not on it."""
+    image = PILImage.open(TEST_IMAGE).convert("RGB").resize(size)
+    options = SixelOptions(colors=colors)
+    mapped_options = replace(options, palette=palette_from_image(image, options))
+
+    direct = decode_sixels(image_to_sixels(image, options)).colors()
+    mapped = decode_sixels(image_to_sixels(image, mapped_options)).colors()
+
+    errors = [
+        max(abs(a - b) for a, b in zip(direct_pixel, mapped_pixel, strict=True))
+        for direct_row, mapped_row in zip(direct, mapped, strict=True)
+        for direct_pixel, mapped_pixel in zip(direct_row, mapped_row, strict=True)
+        if direct_pixel is not None and mapped_pixel is not None
+    ]
+    assert len(errors) == size[0] * size[1]
+    # Largest channel difference per pixel, in percentage points; a wrong palette is off by tens of them
+    assert sum(errors) / len(errors) < max_mean_error
+    assert sorted(errors)[len(errors) * 99 // 100] <= max_p99_error
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+def test_decoded_transparent_image_keeps_holes_and_fills_solid_spans(has_numpy: bool) -> None:
+    """Pass 0 spans fill solid when no transparent pixel lies in their columns, and leave holes see-through."""
+    image = PILImage.new("RGBA", (40, 14), (255, 255, 255, 255))
+    image.paste((0, 0, 0, 0), (25, 0, 36, 10))
+    image.paste((255, 0, 0, 255), (5, 3, 15, 12))
+    image.putpixel((38, 1), (0, 0, 0, 0))
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        result = image_to_sixels(image)
+        randomized = _random_image(30, 20, 3, transparent=True, seed=4)
+        randomized_result = image_to_sixels(randomized)
+
+    assert "#0!25~" in result  # the white span left of the hole is filled
+    assert decode_sixels(result).colors() == percent_pixels(image)
+    assert decode_sixels(randomized_result).colors() == percent_pixels(randomized)
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+@pytest.mark.parametrize("lazy", [False, True])
+def test_elide_background_leaves_register_zero_to_the_terminal(has_numpy: bool, lazy: bool) -> None:
+    """Pixels of the most frequent color are left to the P2=0 background fill, which decodes to the same image."""
+    image = PILImage.new("RGB", (60, 40), (255, 255, 255))
+    for x in range(5, 55, 10):
+        image.paste((70, 130, 180), (x, 40 - x // 2, x + 6, 38))
+    image.paste((0, 0, 0), (2, 38, 58, 40))
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        plain = image_to_sixels(image, SixelOptions(lazy_color_palette=lazy))
+        elided = image_to_sixels(image, SixelOptions(lazy_color_palette=lazy, elide_background=True))
+
+    header = '\x1bP0;0;0q"1;1;60;40'
+    assert elided.startswith(header + "#0;2;100;100;100")
+    assert not re.search(r"#0[^;]", elided)
+    assert len(elided) < len(plain)
+    assert decode_sixels(elided).colors() == decode_sixels(plain).colors() == percent_pixels(image)
+
+
+def test_elide_background_needs_register_zero_to_dominate_fixed_palettes() -> None:
+    """Fixed and uniform palettes keep their order; register 0 is only elided when it is the background."""
+    image = PILImage.new("RGB", (30, 24), (255, 255, 255))
+    image.paste((0, 0, 0), (5, 5, 25, 12))
+    dark_first = SixelOptions(palette=((0, 0, 0), (255, 255, 255)), elide_background=True)
+    light_first = replace(dark_first, palette=((255, 255, 255), (0, 0, 0)))
+
+    assert image_to_sixels(image, dark_first) == image_to_sixels(image, replace(dark_first, elide_background=False))
+    elided = image_to_sixels(image, light_first)
+    assert len(elided) < len(image_to_sixels(image, replace(light_first, elide_background=False)))
+    assert not re.search(r"#0[^;]", elided)
+    assert decode_sixels(elided).colors() == percent_pixels(image)
+
+    # The uniform cube's register 0 is black, which isn't the background either
+    uniform = SixelOptions(quantize="uniform", elide_background=True)
+    assert image_to_sixels(image, uniform) == image_to_sixels(image, replace(uniform, elide_background=False))
+    empty = image_to_sixels(PILImage.new("RGB", (0, 6)), light_first)
+    assert empty == '\x1bP0;0;0q"1;1;0;6#0;2;100;100;100#1;2;0;0;0-\x1b\\'
+
+
+def test_elide_background_is_ignored_for_transparent_images() -> None:
+    image = _random_image(20, 13, 3, transparent=True, seed=5)
+
+    assert image_to_sixels(image, SixelOptions(elide_background=True)) == image_to_sixels(image)
+
+
+def _repeated_bands_image(transparent: bool) -> PILImage.Image:
+    """Image whose patterned bands repeat, between bands of a single color."""
+    tile = _random_image(30, 6, 3, transparent=transparent, seed=7)
+    image = PILImage.new("RGBA", (30, 40), (0, 0, 255, 255))
+    for y in (0, 12, 18, 30):
+        image.paste(tile, (0, y))
+    return image
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("transparent", [False, True])
+def test_band_cache_replays_repeated_and_uniform_bands(has_numpy: bool, lazy: bool, transparent: bool) -> None:
+    """An encoder replays repeated and single-colored bands, with the same output as encoding every band."""
+    image = _repeated_bands_image(transparent)
+    options = SixelOptions(lazy_color_palette=lazy)
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        with patch.object(_BandCache, "lookup", return_value=None):
+            expected = SixelEncoder(30, 40, options).encode(image)
+        with patch("textual_image._sixel._replay_band", wraps=_replay_band) as replay_band:
+            result = SixelEncoder(30, 40, options).encode(image)
+
+    assert result == expected
+    # Without a lazy palette, only the first patterned band is encoded
+    assert replay_band.call_count >= 2 if lazy else replay_band.call_count == 6
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+def test_one_shot_encodes_yield_bands_without_caching_them(has_numpy: bool) -> None:
+    """Without an encoder to keep them for, bands are neither looked up nor stored; NumPy yields zero-copy slices."""
+    image = _repeated_bands_image(transparent=False)
+
+    with (
+        patch("textual_image._sixel._HAS_NUMPY", has_numpy),
+        patch.object(_BandCache, "lookup", side_effect=AssertionError("unexpected lookup")),
+        patch.object(_BandCache, "store", side_effect=AssertionError("unexpected store")),
+    ):
+        chunks = list(iter_sixels(image))
+
+    assert b"".join(chunks).decode("ascii") == SixelEncoder(30, 40).encode(image)
+    assert any(isinstance(chunk, memoryview) for chunk in chunks) == has_numpy
+
+
+def test_uniform_bands_are_not_packed() -> None:
+    image = PILImage.new("RGB", (10, 12), (255, 0, 0))
+
+    with (
+        patch("textual_image._sixel._HAS_NUMPY", False),
+        patch("textual_image._sixel._pack_band", side_effect=AssertionError("unexpected packing")),
+    ):
+        result = image_to_sixels(image)
+
+    assert result == '\x1bP0;0;0q"1;1;10;12#0;2;100;0;0#0!10~-!10~-\x1b\\'
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+def test_encoder_replays_the_bands_of_the_previous_frame(has_numpy: bool) -> None:
+    """Bands that didn't change since the previous frame are not encoded again."""
+    frame = _repeated_bands_image(transparent=False)
+    changed = frame.copy()
+    changed.putpixel((3, 39), (255, 255, 0, 255))
+    encoder = SixelEncoder(30, 40)
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        expected = encoder.encode(frame)
+        with (
+            patch("textual_image._sixel._pack_band", side_effect=AssertionError("unexpected packing")),
+            patch("textual_image._sixel._encode_bands_np", side_effect=AssertionError("unexpected encoding")),
+        ):
+            assert encoder.encode(frame) == expected
+        assert encoder.encode(changed) == image_to_sixels(changed)
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+def test_encoder_drops_the_bands_of_frames_trimmed_to_another_width(has_numpy: bool) -> None:
+    """A band 12 pixels wide and 6 high has the same key as one 18 wide and 4 high, but not the same sixels."""
+    pixels = _random_image(72, 1, 3, transparent=False, seed=13)
+    wide, narrow = (PILImage.new("RGBA", (40, 40)) for _ in range(2))
+    for frame, width in ((narrow, 12), (wide, 18)):
+        for y in range(72 // width):
+            frame.paste(pixels.crop((y * width, 0, (y + 1) * width, 1)), (0, y))
+    encoder = SixelEncoder(40, 40)
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        assert encoder.encode(narrow) == image_to_sixels(narrow)
+        assert encoder.encode(wide) == image_to_sixels(wide)
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+@pytest.mark.parametrize(
+    "options",
+    [
+        SixelOptions(),
+        SixelOptions(elide_background=True),
+        SixelOptions(lazy_color_palette=True),
+        SixelOptions(lazy_color_palette=True, elide_background=True),
+        SixelOptions(colors=16, lazy_color_palette=True, elide_background=True),
+    ],
+)
+def test_budget_estimate_matches_the_output(has_numpy: bool, options: SixelOptions) -> None:
+    """Estimates count elided backgrounds and lazily defined registers; with every band sampled they are exact."""
+    with PILImage.open(TEST_IMAGE) as opened:
+        photo, tall_photo = opened.resize((96, 72)), opened.resize((320, 720))
+    flat = PILImage.new("RGB", (96, 72), (250, 250, 250))
+    flat.paste((200, 30, 30), (10, 10, 80, 30))
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        for image in (photo, flat):
+            assert _estimate_sixels(image, options, options, None).fit.estimated_bytes == len(
+                image_to_sixels(image, options)
+            )
+        estimated = _estimate_sixels(tall_photo, options, options, None).fit.estimated_bytes
+        assert estimated == pytest.approx(len(image_to_sixels(tall_photo, options)), rel=0.05)
+
+
+@pytest.mark.parametrize("has_numpy", [False, True])
+def test_fit_sixel_options_picks_the_first_candidate_within_the_budget(has_numpy: bool) -> None:
+    """Bisecting the candidates finds the same options as trying them in order, and encoding uses them."""
+    with PILImage.open(TEST_IMAGE) as opened:
+        image = opened.resize((96, 72))
+    options = SixelOptions(max_bytes=6000, lazy_color_palette=True)
+
+    with patch("textual_image._sixel._HAS_NUMPY", has_numpy):
+        fit = fit_sixel_options(image, options)
+        first_fitting = next(
+            candidate
+            for candidate in _iter_budget_candidates(options)
+            if _estimate_sixels(image, candidate, options, None).fit.fits
+        )
+        result = image_to_sixels(image, options)
+        expected = image_to_sixels(image, fit.options)
+
+    assert fit.fits
+    assert fit.options == first_fitting
+    assert fit.options.colors < MAX_COLORS
+    assert fit.options.max_bytes is None
+    assert fit.options.lazy_color_palette
+    assert fit.estimated_bytes <= 6000
+    assert result == expected
+    assert len(result) < len(image_to_sixels(image))
+
+
+def test_fit_sixel_options_keeps_options_within_the_budget() -> None:
+    image = _random_image(20, 13, 3, transparent=False, seed=1)
+
+    fit = fit_sixel_options(image, SixelOptions(colors=16, max_bytes=10_000, max_encode_time=60.0))
+
+    assert fit.fits
+    assert fit.options == SixelOptions(colors=16)
+    assert fit.estimated_bytes == len(image_to_sixels(image, fit.options))
+    assert fit.estimated_seconds > 0
+
+
+@pytest.mark.parametrize("options", [SixelOptions(max_bytes=1), SixelOptions(max_encode_time=0.0)])
+def test_fit_sixel_options_falls_back_to_the_last_candidate(options: SixelOptions) -> None:
+    image = _random_image(20, 13, 50, transparent=True, seed=2)
+
+    fit = fit_sixel_options(image, options)
+
+    assert not fit.fits
+    assert fit.options == SixelOptions(colors=2, smooth=7)
+
+
+def test_budget_candidates_only_smooth_fixed_palettes() -> None:
+    palette = ((0, 0, 0), (255, 255, 255))
+    candidates = list(_iter_budget_candidates(SixelOptions(palette=palette, smooth=5, max_bytes=1)))
+
+    assert candidates == [SixelOptions(palette=palette, smooth=5), SixelOptions(palette=palette, smooth=7)]
+    assert fit_sixel_options(PILImage.new("RGB", (4, 4)), candidates[-1]).options == candidates[-1]
+
+
+def test_pass_assignment_matches_greedy_extraction_on_fragmented_bands() -> None:
+    """Staggered segments force many thin passes, where the encoder switches to first-fit assignment."""
+    segments = sorted(
+        ((x, x + 30, color) for color in range(64) for x in range(color * 7 % 40, 600, 40)),
+        key=lambda seg: (seg[0], seg[0] - seg[1], seg[2]),
+    )
+    greedy = []
+    remaining = segments
+    while remaining:
+        pass_segments, remaining = _iter_greedy_passes(remaining)
+        greedy.append(pass_segments)
+
+    assert list(_iter_passes(segments)) == _assign_passes(segments) == greedy
+    assert len(greedy) == 49  # the maximum number of segments overlapping one column
+
+
+def test_rle_encode_segments_keeps_runs_within_segments() -> None:
+    """Runs are compressed per segment, even when neighbors continue them, and long runs bypass the cache."""
+    band_data = [bytearray(200) for _ in range(3)]
+    band_data[1][0:10] = bytes([1, 1, 1, 2, 2, 2, 2, 2, 1, 1])
+    band_data[2][0:100] = bytes([63]) * 100
+    band_data[2][100:103] = bytes([2, 2, 2])
+
+    assert _rle_encode_segments(band_data, [(0, 10, 1), (0, 100, 2), (100, 103, 2), (2, 3, 1)]) == [
+        b"@@@!5A@@",
+        b"!100~",
+        b"AAA",
+        b"@",
+    ]
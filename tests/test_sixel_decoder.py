@@ -0,0 +1,161 @@
+import random
+from collections.abc import Callable
+from dataclasses import replace
+from typing import get_args
+from unittest.mock import patch
+
+import pytest
+from PIL import Image as PILImage
+
+from tests.utils import percent_pixels
+from textual_image._sixel import (
+    UNIFORM_QUANTIZE_METHODS,
+    QuantizeMethod,
+    SixelEncoder,
+    SixelOptions,
+    image_to_sixels,
+    palette_from_image,
+)
+from textual_image._sixel_decoder import decode_sixels
+
+HEADER = '\x1bP0;1;0q"1;1;4;8'
+
+
+def test_decode_sixels_draws_runs_passes_and_bands() -> None:
+    decoded = decode_sixels(HEADER + "#0;2;100;0;0#1;2;0;0;100#0!3~$#1?@-#1A\x1b\\")
+
+    assert decoded.width == 4
+    assert decoded.height == 8
+    assert decoded.transparent
+    assert decoded.registers == {0: (100, 0, 0), 1: (0, 0, 100)}
+    red, blue = (100, 0, 0), (0, 0, 100)
+    assert decoded.colors() == [
+        [red, blue, red, None],
+        *([[red, red, red, None]] * 5),
+        [None, None, None, None],
+        [blue, None, None, None],
+    ]
+
+
+def test_opaque_images_show_register_zero_where_nothing_is_drawn() -> None:
+    decoded = decode_sixels(b'\x1bP0;0;0q"1;1;2;1#0;2;0;100;0#1;2;100;0;0#1@-\x1b\\')
+
+    assert not decoded.transparent
+    assert decoded.pixels == [[1, None]]
+    assert decoded.colors() == [[(100, 0, 0), (0, 100, 0)]]
+
+
+@pytest.mark.parametrize(
+    ("sixels", "message"),
+    [
+        ("#0;2;0;0;0~\x1b\\", "doesn't start with a DCS header"),
+        ("\x1bP0;1;0q#0;2;0;0;0~\x1b\\", "doesn't define its raster attributes"),
+        (HEADER + "#0;2;0;0;0~", "doesn't end with a string terminator"),
+        (HEADER + "#0;2;0;0;0~*\x1b\\", "Unexpected byte b'\\*' at offset 27"),
+        (HEADER + "#0;1;120;50;100~\x1b\\", "Color register 0 is not defined in RGB"),
+        (HEADER + "#0;2;0;0;0!5~\x1b\\", "Sixels drawn past the right edge at offset 26"),
+        (HEADER + "#0;2;0;0;0--~\x1b\\", "Sixels drawn past the bottom edge at offset 28"),
+    ],
+)
+def test_decode_sixels_rejects_malformed_data(sixels: str, message: str) -> None:
+    with pytest.raises(ValueError, match=message):
+        decode_sixels(sixels)
+
+
+def test_colors_reject_undefined_registers() -> None:
+    with pytest.raises(ValueError, match="Pixels drawn in undefined color register 3"):
+        decode_sixels(HEADER + "#3~\x1b\\").colors()
+
+
+def _encode_python(image: PILImage.Image, options: SixelOptions) -> str:
+    with patch("textual_image._sixel._HAS_NUMPY", False):
+        return image_to_sixels(image, options)
+
+
+def _encode_numpy(image: PILImage.Image, options: SixelOptions) -> str:
+    with patch("textual_image._sixel._HAS_NUMPY", True):
+        return image_to_sixels(image, options)
+
+
+def _encode_threads(image: PILImage.Image, options: SixelOptions) -> str:
+    return image_to_sixels(image, replace(options, workers=3))
+
+
+def _encode_after_previous_frame(image: PILImage.Image, options: SixelOptions) -> str:
+    # The flipped frame leaves bands to the band cache that this one partly repeats
+    encoder = SixelEncoder(image.width, image.height, options)
+    encoder.encode(image.transpose(PILImage.Transpose.FLIP_TOP_BOTTOM))
+    return encoder.encode(image)
+
+
+# Every way of encoding must draw the same pixels; register new encoders and fast paths here
+BACKENDS: dict[str, Callable[[PILImage.Image, SixelOptions], str]] = {
+    "python": _encode_python,
+    "numpy": _encode_numpy,
+    "threads": _encode_threads,
+    "encoder": _encode_after_previous_frame,
+}
+
+
+def _random_image(rng: random.Random) -> PILImage.Image:
+    """Random image of runs of a few to many colors, with bands that repeat and transparent holes or margins."""
+    width, height = rng.randint(1, 70), rng.randint(1, 40)
+    colors = [
+        (rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(rng.choice([1, 2, 3, 9, 300]))
+    ]
+    pixels: list[tuple[int, int, int, int]] = []
+    while len(pixels) < width * height:
+        if len(pixels) >= 6 * width and rng.random() < 0.1:
+            pixels += pixels[-6 * width :]
+        else:
+            pixels += [(*rng.choice(colors), 255)] * rng.randint(1, 12)
+    image = PILImage.new("RGBA", (width, height))
+    image.putdata(pixels[: width * height])
+
+    match rng.choice(["opaque", "holes", "margins"]):
+        case "holes":
+            for _ in range(rng.randrange(width * height)):
+                x, y = rng.randrange(width), rng.randrange(height)
+                image.putpixel((x, y), (*image.getpixel((x, y))[:3], 0))  # type: ignore[index]
+        case "margins":
+            canvas = PILImage.new("RGBA", (width + rng.randrange(20), height + rng.randrange(20)))
+            canvas.paste(image, (rng.randrange(canvas.width - width + 1), rng.randrange(canvas.height - height + 1)))
+            image = canvas
+    return image
+
+
+def _random_options(rng: random.Random, image: PILImage.Image) -> SixelOptions:
+    options = SixelOptions(
+        colors=rng.choice([2, 5, 16, 256]),
+        smooth=rng.choice([None, None, 3]),
+        quantize=rng.choice(get_args(QuantizeMethod)),
+        lazy_color_palette=rng.random() < 0.5,
+        elide_background=rng.random() < 0.3,
+    )
+    if rng.random() < 0.2:
+        options = replace(options, palette=palette_from_image(image, options))
+    return options
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_backends_draw_the_same_pixels(seed: int) -> None:
+    """Every backend decodes to the pixels of the reference, which are exact for images with few enough colors."""
+    pytest.importorskip("numpy")
+
+    rng = random.Random(seed)
+    image = _random_image(rng)
+    options = _random_options(rng, image)
+
+    decoded = {name: decode_sixels(encode(image, options)).colors() for name, encode in BACKENDS.items()}
+
+    reference = decoded.pop("python")
+    for name, pixels in decoded.items():
+        assert pixels == reference, f"{name} draws other pixels than python with {options}"
+    exact = (
+        len(image.convert("RGB").getcolors(options.colors) or ()) > 0
+        and options.smooth is None
+        and options.palette is None
+        and options.quantize not in UNIFORM_QUANTIZE_METHODS
+    )
+    if exact:
+        assert reference == percent_pixels(image)
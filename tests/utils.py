@@ -1,8 +1,10 @@
 import io
+import itertools
 import pathlib
 from typing import IO
 from unittest.mock import patch
 
+from PIL import Image as PILImage
 from rich.console import Console, RenderableType
 
 from tests.data import CONSOLE_OPTIONS
@@ -37,3 +39,12 @@ def load_non_seekable_bytes_io(path: pathlib.Path) -> IO[bytes]:
         data = file.read()
 
     return NonSeekableBytesIO(data)
+
+
+def percent_pixels(image: PILImage.Image) -> list[list[tuple[int, int, int] | None]]:
+    """The pixels of *image* as ``DecodedSixels.colors`` returns them, ``None`` where they are transparent."""
+    pixels = [
+        None if a == 0 else (round(r * 100 / 255), round(g * 100 / 255), round(b * 100 / 255))
+        for r, g, b, a in itertools.batched(image.convert("RGBA").tobytes(), 4)
+    ]
+    return [pixels[y * image.width : (y + 1) * image.width] for y in range(image.height)]
@@ -1,5 +1,6 @@
 from unittest import skipUnless
 
+import pytest
 from PIL import Image as PILImage
 from PIL import ImageOps
 
@@ -41,6 +42,31 @@ async def test_app() -> None:
         assert app.query_one(Image).image != TEST_IMAGE
 
 
+@skipUnless(TEXTUAL_ENABLED, "Textual support disabled")
+async def test_raw_pixels() -> None:
+    from textual.app import App, ComposeResult
+
+    from textual_image.widget import Image, PixelBuffer
+
+    np = pytest.importorskip("numpy")
+    with PILImage.open(TEST_IMAGE) as test_image:
+        frame = np.asarray(test_image.convert("RGBA"))
+    pixels = PixelBuffer(bytearray(32 * 16), (32, 16), "L")
+
+    class TestApp(App[None]):
+        def compose(self) -> ComposeResult:
+            yield Image(frame)
+            yield Image(pixels, classes="auto")
+
+    app = TestApp()
+
+    async with app.run_test() as pilot:
+        images = app.query(Image)
+        assert images[0].image is frame
+        assert images[1].image is pixels
+        await pilot.pause()
+
+
 @skipUnless(TEXTUAL_ENABLED, "Textual support disabled")
 async def test_unseekable_stream() -> None:
     from textual.app import App, ComposeResult
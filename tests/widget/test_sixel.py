@@ -1,6 +1,7 @@
 from unittest import skipUnless
 from unittest.mock import PropertyMock, patch
 
+import pytest
 from PIL import Image as PILImage
 from PIL import ImageOps
 from rich.console import Console
@@ -48,6 +49,32 @@ async def test_app() -> None:
         await pilot.pause()
 
 
+@skipUnless(TEXTUAL_ENABLED, "Textual support disabled")
+async def test_raw_pixels() -> None:
+    from textual.app import App, ComposeResult
+
+    from textual_image.widget import PixelBuffer
+    from textual_image.widget.sixel import Image
+
+    np = pytest.importorskip("numpy")
+    with PILImage.open(TEST_IMAGE) as test_image:
+        frame = np.asarray(test_image.convert("RGBA"))
+    pixels = PixelBuffer(bytearray(32 * 16), (32, 16), "L")
+
+    class TestApp(App[None]):
+        def compose(self) -> ComposeResult:
+            yield Image(frame)
+            yield Image(pixels, classes="auto")
+
+    app = TestApp()
+
+    async with app.run_test() as pilot:
+        images = app.query(Image)
+        assert images[0].image is frame
+        assert images[1].image is pixels
+        await pilot.pause()
+
+
 @skipUnless(TEXTUAL_ENABLED, "Textual support disabled")
 async def test_unseekable_stream() -> None:
     from textual.app import App, ComposeResult
@@ -89,7 +116,7 @@ def test_image_to_sixels_inside_tmux_uses_native_sixel() -> None:
     sixel_impl = _ImageSixelImpl()
 
     with patch("textual_image._tmux.IS_TMUX", True):
-        sixel_data = sixel_impl._image_to_sixels(image)
+        sixel_data = "".join(sixel_impl._image_to_sixel_chunks(image))
 
     assert sixel_data.startswith("\x1bP0;0;0q")
     assert "\x1bPtmux;" not in sixel_data
@@ -138,6 +165,70 @@ def test_default_options_subclass_override() -> None:
     assert Image(TEST_IMAGE, sixel_options=explicit)._sixel_options is explicit
 
 
+@skipUnless(TEXTUAL_ENABLED, "Textual support disabled")
+def test_palette_is_built_once_per_image() -> None:
+    from textual_image._sixel import SixelOptions, palette_from_image
+    from textual_image.widget.sixel import _ImageSixelImpl
+
+    sixel_impl = _ImageSixelImpl()
+    with PILImage.open(TEST_IMAGE) as image:
+        small, large = image.resize((32, 32)), image.resize((64, 64))
+    background = (0, 0, 0, 1.0)
+
+    with patch("textual_image.widget.sixel.palette_from_image", wraps=palette_from_image) as build_palette:
+        first = sixel_impl._get_sixel_options(TEST_IMAGE, small, background)
+        resized = sixel_impl._get_sixel_options(TEST_IMAGE, large, background)
+        assert build_palette.call_count == 1
+
+        other_background = sixel_impl._get_sixel_options(TEST_IMAGE, small, (255, 255, 255, 1.0))
+        assert build_palette.call_count == 2
+
+    assert first.palette is not None
+    assert resized.palette is first.palette
+    assert other_background.palette is not first.palette
+
+    fixed = SixelOptions(palette=((0, 0, 0),))
+    sixel_impl._sixel_options = fixed
+    assert sixel_impl._get_sixel_options(TEST_IMAGE, small, background) is fixed
+
+    uniform = SixelOptions(quantize="ordered")
+    sixel_impl._sixel_options = uniform
+    assert sixel_impl._get_sixel_options(TEST_IMAGE, small, background) is uniform
+
+
+@skipUnless(TEXTUAL_ENABLED, "Textual support disabled")
+def test_budget_is_fitted_once_per_image_size() -> None:
+    from textual_image._sixel import SixelOptions, fit_sixel_options
+    from textual_image.widget.sixel import _ImageSixelImpl
+
+    with PILImage.open(TEST_IMAGE) as image:
+        small, large = image.resize((32, 32)), image.resize((64, 64))
+    background = (0, 0, 0, 1.0)
+
+    for palette in (None, ((0, 0, 0), (255, 255, 255))):
+        sixel_impl = _ImageSixelImpl(sixel_options=SixelOptions(max_bytes=2000, palette=palette))
+        with patch("textual_image.widget.sixel.fit_sixel_options", wraps=fit_sixel_options) as fit:
+            first = sixel_impl._get_sixel_options(TEST_IMAGE, small, background)
+            again = sixel_impl._get_sixel_options(TEST_IMAGE, small.copy(), background)
+            assert fit.call_count == 1
+
+            resized = sixel_impl._get_sixel_options(TEST_IMAGE, large, background)
+            assert fit.call_count == 2
+            assert fit.call_args.args[0] is large
+
+        assert again is first
+        assert resized is not first
+        assert first.max_bytes is None
+        assert first.palette is not None
+        assert palette is None or first.palette is palette
+
+    sixel_impl = _ImageSixelImpl(sixel_options=SixelOptions(max_bytes=2000, quantize="uniform"))
+    fitted = sixel_impl._get_sixel_options(TEST_IMAGE, small, background)
+    assert fitted.max_bytes is None
+    assert fitted.quantize == "uniform"
+    assert fitted.palette is None
+
+
 @skipUnless(TEXTUAL_ENABLED, "Textual support disabled")
 async def test_render_lines_clears_widget_area_before_sixel() -> None:
     from textual.app import App, ComposeResult
@@ -1,28 +1,115 @@
 """Provides access to pixel data."""
 
 import io
+import os
+import threading
 from base64 import b64encode
+from collections import OrderedDict
+from collections.abc import Buffer
 from contextlib import nullcontext
-from typing import IO, ContextManager, Iterable, Iterator, Literal, Tuple, cast
+from pathlib import Path
+from typing import IO, Any, ContextManager, Iterable, Iterator, Literal, NamedTuple, Protocol, Tuple, TypeAlias, cast
 
 from PIL import Image as PILImage
+from PIL import ImageMode
 
 from textual_image._utils import StrOrBytesPath, grouped, is_non_seekable_stream
 
+_MODES = {"grayscale": "L", "rgb": "RGB"}
 
-def ensure_image(image: StrOrBytesPath | IO[bytes] | PILImage.Image) -> ContextManager[PILImage.Image]:
+_DEFAULT_IMAGE_CACHE_BYTES = 256 * 2**20
+
+
+class PixelBuffer(NamedTuple):
+    """Raw pixels in an object supporting the buffer protocol, like a `memoryview`, `bytearray` or `mmap`.
+
+    Rows have to follow each other without padding. For modes PIL can use in place, like "L", "P", "RGBX" and "RGBA",
+    the pixels are wrapped without copying them, so the buffer must not be changed until the image is rendered.
+    """
+
+    data: Buffer
+    """The pixels."""
+    size: Tuple[int, int]
+    """Width and height in pixels."""
+    mode: str
+    """PIL mode of the pixels, e.g. "RGBA"."""
+
+
+class SupportsArrayInterface(Protocol):
+    """Object exposing its pixels through NumPy's array interface, like a NumPy array or `numpy.memmap`."""
+
+    @property
+    def __array_interface__(self) -> dict[str, Any]: ...
+
+    def __len__(self) -> int: ...
+
+
+ImageSource: TypeAlias = StrOrBytesPath | IO[bytes] | PILImage.Image | PixelBuffer | SupportsArrayInterface
+"""Image to render: a path, a byte stream, a `PIL.Image.Image`, a `PixelBuffer` or an array."""
+
+
+def is_pixel_array(image: object) -> bool:
+    """Returns if the value holds raw pixels, as a `PixelBuffer` or an object with an array interface.
+
+    Args:
+        image: The value to check.
+
+    Returns:
+        True if the value holds raw pixels, False if not.
+    """
+    return isinstance(image, PixelBuffer) or (
+        hasattr(image, "__array_interface__") and not isinstance(image, PILImage.Image)
+    )
+
+
+def wrap_pixels(pixels: PixelBuffer | SupportsArrayInterface) -> PILImage.Image:
+    """Wraps raw pixels into a `PIL.Image.Image`.
+
+    The image shares the memory of the pixels if PIL can use their mode in place, otherwise it holds a copy.
+    Arrays get their size and mode from their shape and type, like with `PIL.Image.fromarray`.
+
+    Args:
+        pixels: The pixels to wrap.
+
+    Returns:
+        A `PIL.Image.Image` of the pixels.
+    """
+    if isinstance(pixels, PixelBuffer):
+        # PIL is typed to take bytes only, but accepts any object supporting the buffer protocol
+        data = cast("bytes", pixels.data)
+        return PILImage.frombuffer(pixels.mode, pixels.size, data, "raw", pixels.mode, 0, 1)
+    return PILImage.fromarray(pixels)
+
+
+def ensure_image(image: ImageSource, size_hint: Tuple[int, int] | None = None) -> ContextManager[PILImage.Image]:
     """Ensures value to be an `PIL.Image.Image`.
 
-    This function accepts either a str or `pathlib.Path` of a path to an image file or a `PIL.Image.Image` instance.
-    It returns a context manager that either just provides the passed `PIL.Image.Image` instance or opens the path
-    with `PIL` and provides the result.
+    This function accepts either a str or `pathlib.Path` of a path to an image file, a byte stream, a
+    `PIL.Image.Image` instance or raw pixels. It returns a context manager that either just provides the passed
+    `PIL.Image.Image` instance, wraps the raw pixels with `wrap_pixels`, or opens the path or stream with `PIL` and
+    provides the result. Paths are decoded through `image_cache`, which hands out the same image for the same file,
+    so images provided for paths must not be modified.
+
+    If a `size_hint` is given, images opened by this function are put into draft mode for that size. JPEGs are then
+    decoded at 1/2, 1/4 or 1/8 scale, as long as that is still at least `size_hint`, which is a lot faster than
+    decoding them in full and scaling them down afterwards. Other formats and passed `PIL.Image.Image` instances are
+    left untouched.
 
     Args:
-        image: Path to an image file or `PIL.Image.Image` instance.
+        image: Path to an image file, byte stream, `PIL.Image.Image` instance or raw pixels.
+        size_hint: Size in pixels the image is going to be scaled to, or `None` to decode it at full size.
 
     Returns:
         A context manager providing a `PIL.Image.Image` instance.
     """
+    opened_image, _ = _ensure_sized_image(image, size_hint)
+    return opened_image
+
+
+def _ensure_sized_image(
+    image: ImageSource, size_hint: Tuple[int, int] | None
+) -> Tuple[ContextManager[PILImage.Image], Tuple[int, int]]:
+    """Implements `ensure_image`, also returning the full size of the image before it was drafted."""
     if is_non_seekable_stream(image):
         # If the value is a non-seekable stream, the data must be read into a BytesIO object.
         # This is necessary for two reasons:
@@ -31,43 +118,254 @@ def ensure_image(image: StrOrBytesPath | IO[bytes] | PILImage.Image) -> ContextM
         image = io.BytesIO(cast("IO[bytes]", image).read())
 
     if isinstance(image, PILImage.Image):
-        return nullcontext(image)
-    return PILImage.open(image)
+        return nullcontext(image), image.size
+    if is_pixel_array(image):
+        wrapped_image = wrap_pixels(cast("PixelBuffer | SupportsArrayInterface", image))
+        return nullcontext(wrapped_image), wrapped_image.size
+    if _is_path(image):
+        cached_image, size = image_cache._open_sized(cast("StrOrBytesPath", image), size_hint)
+        return nullcontext(cached_image), size
+
+    return _open_image(cast("IO[bytes]", image), size_hint)
+
+
+def _is_path(image: object) -> bool:
+    return isinstance(image, (str, bytes, os.PathLike))
+
+
+def _open_image(
+    image: StrOrBytesPath | IO[bytes], size_hint: Tuple[int, int] | None
+) -> Tuple[PILImage.Image, Tuple[int, int]]:
+    """Opens an image in draft mode for `size_hint` and returns it with its full size."""
+    opened_image = PILImage.open(image)
+    size = opened_image.size
+    if size_hint is not None:
+        opened_image.draft(None, (max(1, size_hint[0]), max(1, size_hint[1])))
+    return opened_image, size
+
+
+def _image_bytes(image: PILImage.Image) -> int:
+    # PIL keeps pixels of more than one band in 4 bytes and single band pixels in the size of their type
+    bands = len(image.getbands())
+    pixel_bytes = 4 if bands > 1 else int(ImageMode.getmode(image.mode).typestr[-1])
+    return image.width * image.height * pixel_bytes
+
+
+class ImageCacheStats(NamedTuple):
+    """Statistics of an `ImageCache`."""
+
+    hits: int
+    """Number of images served from the cache."""
+    misses: int
+    """Number of images decoded because they weren't cached, were too small or their file changed."""
+    evictions: int
+    """Number of images dropped to stay within the memory cap."""
+    entries: int
+    """Number of images currently cached."""
+    bytes: int
+    """Estimated memory held by the cached images."""
+
+
+class _CachedImage(NamedTuple):
+    stamp: Tuple[int, int]  # Modification time and size of the file
+    size: Tuple[int, int]  # Full size of the image, which may have been decoded smaller
+    image: PILImage.Image
+    bytes: int
+
+
+class ImageCache:
+    """Process-wide cache of images decoded from files, evicting the least recently used past a memory cap.
+
+    Images are keyed by their path and checked against the file's modification time and size, so changed files are
+    decoded again. An image decoded in draft mode for one size hint serves every smaller hint; a larger one decodes
+    it again. Cached images are shared by everything that opens the same file, so they must not be modified.
+
+    Streams, `PIL.Image.Image` instances and raw pixels are not cached.
+    """
+
+    def __init__(self, max_bytes: int = _DEFAULT_IMAGE_CACHE_BYTES) -> None:
+        """Initializes an ImageCache.
+
+        Args:
+            max_bytes: Memory cap for the cached images, in bytes. 0 disables caching.
+        """
+        self._max_bytes = max_bytes
+        self._images: OrderedDict[str, _CachedImage] = OrderedDict()
+        self._bytes = 0
+        self._hits = self._misses = self._evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        """Memory cap for the cached images, in bytes. Lowering it evicts images right away."""
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int) -> None:
+        with self._lock:
+            self._max_bytes = value
+            self._evict(0)
+
+    def stats(self) -> ImageCacheStats:
+        """Returns the cache's hit, miss and eviction counts and the images it currently holds."""
+        with self._lock:
+            return ImageCacheStats(self._hits, self._misses, self._evictions, len(self._images), self._bytes)
+
+    def clear(self) -> None:
+        """Drops all cached images and resets the statistics."""
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+            self._hits = self._misses = self._evictions = 0
+
+    def open(self, path: StrOrBytesPath, size_hint: Tuple[int, int] | None = None) -> PILImage.Image:
+        """Returns the decoded image of a file, from the cache if possible.
+
+        Args:
+            path: Path to the image file.
+            size_hint: Size in pixels the image is going to be scaled to, or `None` to get it at full size. See
+                `ensure_image`.
+
+        Returns:
+            The decoded image, which must not be modified.
+        """
+        image, _ = self._open_sized(path, size_hint)
+        return image
+
+    def _open_sized(
+        self, path: StrOrBytesPath, size_hint: Tuple[int, int] | None
+    ) -> Tuple[PILImage.Image, Tuple[int, int]]:
+        """Implements `open`, also returning the full size of the image."""
+        key, stamp = self._key(path)
+        with self._lock:
+            cached = self._images.get(key)
+            if cached is not None and cached.stamp == stamp and _covers(cached, size_hint):
+                self._images.move_to_end(key)
+                self._hits += 1
+                return cached.image, cached.size
+            self._misses += 1
+
+        image, size = _open_image(path, size_hint)
+        with image:
+            image.load()
+
+        with self._lock:
+            previous = self._images.pop(key, None)
+            self._bytes -= previous.bytes if previous else 0
+            image_bytes = _image_bytes(image)
+            if self._evict(image_bytes):
+                self._images[key] = _CachedImage(stamp, size, image, image_bytes)
+                self._bytes += image_bytes
+        return image, size
+
+    def source_size(self, path: StrOrBytesPath) -> Tuple[int, int]:
+        """Returns the full size of the image in a file, without decoding it if it isn't cached.
+
+        Args:
+            path: Path to the image file.
+
+        Returns:
+            Width and height of the image.
+        """
+        key, stamp = self._key(path)
+        with self._lock:
+            cached = self._images.get(key)
+            if cached is not None and cached.stamp == stamp:
+                return cached.size
+        with PILImage.open(path) as opened_image:
+            return opened_image.size
+
+    def _key(self, path: StrOrBytesPath) -> Tuple[str, Tuple[int, int]]:
+        # Opened like PIL opens it, so a bad path fails with the same error
+        file = Path(os.fsdecode(path)).absolute()
+        with file.open("rb") as opened_file:
+            stat = os.fstat(opened_file.fileno())
+        return str(file), (stat.st_mtime_ns, stat.st_size)
+
+    def _evict(self, needed_bytes: int) -> bool:
+        """Evicts the least recently used images until `needed_bytes` more fit, returns if they do."""
+        if needed_bytes > self._max_bytes:
+            return False
+        while self._images and self._bytes + needed_bytes > self._max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self._bytes -= evicted.bytes
+            self._evictions += 1
+        return True
+
+
+def _covers(cached: _CachedImage, size_hint: Tuple[int, int] | None) -> bool:
+    image = cached.image
+    if image.size == cached.size:
+        return True
+    return size_hint is not None and image.width >= size_hint[0] and image.height >= size_hint[1]
+
+
+image_cache = ImageCache()
+"""The process-wide cache `ensure_image`, `PixelMeta` and `PixelData` decode image files through."""
 
 
 class PixelMeta:
-    """Provides access to meta information of an image from a path or `PIL.Image.Image` instance."""
+    """Provides access to meta information of an image from a path, byte stream, `PIL.Image.Image` or raw pixels."""
 
-    def __init__(self, image: StrOrBytesPath | IO[bytes] | PILImage.Image) -> None:
+    def __init__(self, image: ImageSource) -> None:
         """Initializes a PixelMeta.
 
         Args:
-            image: Path to an image file or `PIL.Image.Image` instance with the image data to render.
+            image: Path to an image file, byte stream, `PIL.Image.Image` instance or raw pixels with the image data to
+                render.
         """
+        if _is_path(image):
+            self.width, self.height = image_cache.source_size(cast("StrOrBytesPath", image))
+            return
+
         with ensure_image(image) as opened_image:
             self.width = opened_image.width
             self.height = opened_image.height
 
 
 class PixelData:
-    """Provides access to pixel data from a path or `PIL.Image.Image` instance."""
+    """Provides access to pixel data from a path, byte stream, `PIL.Image.Image` instance or raw pixels.
+
+    The image is never modified after it was read, so scaled and cropped copies share it when they cover all of it.
+    """
 
     def __init__(
-        self, image: StrOrBytesPath | IO[bytes] | PILImage.Image, mode: Literal["grayscale", "rgb"] | None = None
+        self,
+        image: ImageSource,
+        mode: Literal["grayscale", "rgb"] | None = None,
+        size_hint: Tuple[int, int] | None = None,
     ) -> None:
         """Initializes a PixelData.
 
         Args:
-            image: Path to an image file or `PIL.Image.Image` instance with the image data to render.
+            image: Path to an image file, byte stream, `PIL.Image.Image` instance or raw pixels with the image data to
+                render.
             mode: Mode to convert the image into or `None` to keep the original mode.
+            size_hint: Size in pixels the image is going to be scaled to. Lets JPEGs be decoded at a reduced size
+                that is still at least this large, see `ensure_image`. `None` decodes the image at full size.
         """
-        with ensure_image(image) as opened_image:
-            self._image = opened_image.copy()
-
-        if mode == "grayscale":
-            self._image = self._image.convert("L")
-        elif mode == "rgb":
-            self._image = self._image.convert("RGB")
+        opened, self._source_size = _ensure_sized_image(image, size_hint)
+        with opened as opened_image:
+            if mode is not None:
+                # Converting creates a new image, so it doubles as the copy of images passed in
+                self._image = opened_image.convert(_MODES[mode])
+            elif opened_image is image:
+                # Passed in by the caller, who may still change or close it
+                self._image = opened_image.copy()
+            else:
+                # Opened or wrapped here, or shared with the image cache, none of which modifies it. Loading it reads
+                # the file before it is closed. Wrapped pixels share the caller's memory, which is what passing them
+                # is for.
+                opened_image.load()
+                self._image = opened_image
+
+    @classmethod
+    def _from_owned_image(cls, image: PILImage.Image) -> "PixelData":
+        """Wraps an image nothing else refers to, without copying it."""
+        pixel_data = cls.__new__(cls)
+        pixel_data._image = image
+        pixel_data._source_size = image.size
+        return pixel_data
 
     @property
     def pil_image(self) -> PILImage.Image:
@@ -84,6 +382,11 @@ class PixelData:
         """The image's height."""
         return self._image.height
 
+    @property
+    def source_size(self) -> Tuple[int, int]:
+        """The full size of the image, which is larger than its size if it was decoded at a reduced one."""
+        return self._source_size
+
     def scaled(self, width: int, height: int) -> "PixelData":
         """Returns a scaled copy of this PixelData.
 
@@ -92,10 +395,13 @@ class PixelData:
             height: Height to scale to.
 
         Returns:
-            A new `PixelData` instance of the same image, scaled to (width, height).
+            A `PixelData` instance of the same image, scaled to (width, height). This instance if it already has
+            that size.
         """
-        scaled_image = self._image.resize((max(1, width), max(1, height)))
-        return PixelData(scaled_image)
+        size = (max(1, width), max(1, height))
+        if size == self._image.size:
+            return self
+        return PixelData._from_owned_image(self._image.resize(size))
 
     def cropped(self, left: int, top: int, right: int, bottom: int) -> "PixelData":
         """Returns a cropped copy of this PixelData.
@@ -107,10 +413,12 @@ class PixelData:
             bottom: Bottom position of the crop rectangle.
 
         Returns:
-            A new `PixelData` instance of the same image, cropped (left, top, right, bottom).
+            A `PixelData` instance of the same image, cropped (left, top, right, bottom). This instance if the crop
+            rectangle covers all of it.
         """
-        cropped_image = self._image.crop((left, top, right, bottom))
-        return PixelData(cropped_image)
+        if (left, top, right, bottom) == (0, 0, *self._image.size):
+            return self
+        return PixelData._from_owned_image(self._image.crop((left, top, right, bottom)))
 
     def to_base64(self) -> str:
         """Return the pixel data as base64 encoded PNG.
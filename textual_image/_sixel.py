@@ -1,23 +1,32 @@
 from __future__ import annotations
 
+import logging
 import re
+import time
 from collections import Counter
-from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Literal, TypeAlias
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import lru_cache, partial
+from heapq import heappop, heappush
+from itertools import accumulate, compress, repeat
+from typing import TYPE_CHECKING, Literal, NamedTuple, TypeAlias, cast
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Iterable, Iterator
 
 from PIL import Image as PILImage
-from PIL import ImageFilter
+from PIL import ImageChops, ImageFilter
 
 try:
     import numpy as np
+    import numpy.typing as npt
 
     _HAS_NUMPY = True
 except ImportError:  # pragma: no cover
     _HAS_NUMPY = False
 
+logger = logging.getLogger(__name__)
+
 MAX_COLORS = 256
 
 # Sixel protocol bytes
@@ -29,6 +38,21 @@ _ST = b"\x1b\\"  # String Terminator
 _BAND_HEIGHT = 6  # Rows per sixel band
 _RLE_THRESHOLD = 4  # Runs shorter than this are emitted raw
 _GAP_THRESHOLD = 10  # Split spans with internal gaps >= this many empty columns
+_STREAM_BANDS = 32  # Bands encoded per vectorized call while streaming
+_TRANSLATE_COST_COLUMNS = 16  # Translating a color costs about one find per this many columns
+_PIXEL_COST_RATIO = 3  # A find step costs about this many steps of the per-pixel loop
+_RESCAN_RATIO = 32  # Stop rescanning for passes once one takes < 1/this of the rest
+_FIXED_PALETTE_CACHE_SIZE = 8  # Fixed palettes whose Pillow image and registers are kept
+_MODE_FILTER_STRIP_ROWS = 64  # Rows the vectorized mode filter processes at once
+_MODE_FILTER_MAX_SIZE = 7  # Larger mode filters are left to Pillow, which is about as fast for them
+_PALETTE_CACHE_STEP = 4  # Pillow maps colors to a palette through a cache with slots this wide
+_BUDGET_SAMPLE_BANDS = 16  # Bands encoded to estimate the output of options with a budget
+_BUDGET_MIN_COLORS = 2  # Budgets don't step colors down any further
+_BUDGET_SMOOTH_SIZES = (3, 5, 7)  # Mode filter sizes budgets step through
+_UNIFORM_MIN_COLORS = 8  # Fewer colors than this get a uniform gray ramp instead of RGB levels
+_UNIFORM_CHANNEL_ORDER = (1, 0, 2)  # Channels get another level in this order: green, red, blue
+_DITHER_SIZE = 8  # Width and height of the ordered dither's threshold matrix
+_DITHER_CACHE_SIZE = 4  # Image sizes whose tiled dither offsets are kept
 
 # RGB 0-255 -> sixel percentage 0-100 (rounded)
 _RGB_TO_PCT = tuple((v * 100 + 127) // 255 for v in range(256))
@@ -38,6 +62,15 @@ _COLOR_SELECT = tuple(f"#{i}".encode("ascii") for i in range(MAX_COLORS))
 # bytes.translate() table: sixel value i (0-63) -> byte i + 0x3F
 # Indices 64-255 are unused; zero-filled to meet the 256-byte requirement
 _TRANSLATE_TABLE = bytes(range(_SIXEL_OFFSET, _SIXEL_OFFSET + 64)) + bytes(192)
+# bytes.translate() tables: 0 -> 0x00, anything else -> 0xFF (alpha) or 0x01 (flags)
+_OPAQUE_TABLE = b"\x00" + b"\xff" * 255
+_NONZERO_TABLE = b"\x00" + b"\x01" * 255
+# bytes.translate() table: 0 -> 0x01, anything else -> 0x00
+_HOLE_TABLE = b"\x01" + bytes(255)
+# bytes.translate() tables: sixel value v of a band with h rows -> the value of the rows v leaves out
+_INVERT_TABLES = tuple(bytes(v ^ (1 << h) - 1 for v in range(256)) for h in range(7))
+# bytes.translate() tables: color c -> 0x01, anything else -> 0x00
+_COLOR_TABLES = tuple(bytes(c) + b"\x01" + bytes(255 - c) for c in range(MAX_COLORS))
 # Cached single-byte bytes objects to avoid allocation in hot paths
 _BYTE_CACHE = tuple(bytes((b,)) for b in range(256))
 
@@ -45,12 +78,22 @@ _BYTE_CACHE = tuple(bytes((b,)) for b in range(256))
 _CACHED_COUNTS = 2048
 _RLE_PREFIX = tuple(f"!{n}".encode("ascii") for n in range(_CACHED_COUNTS))
 
-# Matches runs of 4+ identical bytes; shorter runs pass through re.sub untouched
-_LONG_RUN_RE = re.compile(rb"(.)\1{3,}")
-_NONZERO_RUN_RE = re.compile(rb"[^\x00]+")
+# Splits out runs of 4+ identical bytes as ``[..., run, byte, ...]``; shorter runs stay in between
+_LONG_RUN_SPLIT_RE = re.compile(rb"((.)\2{3,})")
+_CACHED_RUN_LENGTH = 64
+# Joins the segments of a band for RLE; no sixel value is this large, and it translates to NUL
+_SEGMENT_SEPARATOR = b"\xff"
+# Color selection or lazy register definition; ``;`` never occurs in pixel data
+_COLOR_TOKEN_RE = re.compile(rb"#(\d+)(?:;2;\d+;\d+;\d+)?")
+_REGISTER_RE = re.compile(rb"#(\d+);2;\d+;\d+;\d+")
+# Start of a pass: an optional color token, then the empty columns it starts with, as a run or one by one
+_PASS_START_RE = re.compile(rb"(^|\$)(#\d+(?:;2;\d+;\d+;\d+)?)?(?:!(\d+)\?|(\?+))?")
+
 
+QuantizeMethod: TypeAlias = Literal["fastoctree", "maxcoverage", "adaptive", "uniform", "ordered"]
 
-QuantizeMethod: TypeAlias = Literal["fastoctree", "maxcoverage", "adaptive"]
+# Map images onto a fixed palette of evenly spaced levels instead of searching for one
+UNIFORM_QUANTIZE_METHODS: frozenset[QuantizeMethod] = frozenset(("uniform", "ordered"))
 
 _QUANTIZE_METHODS: dict[QuantizeMethod, PILImage.Quantize] = {
     "fastoctree": PILImage.Quantize.FASTOCTREE,
@@ -58,11 +101,12 @@ _QUANTIZE_METHODS: dict[QuantizeMethod, PILImage.Quantize] = {
     "adaptive": PILImage.Quantize.MEDIANCUT,
 }
 
-AnyBytes: TypeAlias = bytes | bytearray
+AnyBytes: TypeAlias = bytes | bytearray | memoryview
 Segment: TypeAlias = tuple[int, int, int]  # (start_col, end_col, color)
-ColorSpans: TypeAlias = dict[int, tuple[int, int]]  # {color: (start_col, end_col)}
 BackgroundColor: TypeAlias = tuple[int, int, int, float]  # (R, G, B, alpha)
+Palette: TypeAlias = tuple[tuple[int, int, int], ...]  # RGB colors; register N holds color N
 AlphaMask: TypeAlias = bytes | None  # Per-pixel alpha values; zero means "skip this pixel"
+BandKey: TypeAlias = tuple[bytes, bytes | None]  # Palette indices and alpha mask of a band's rows
 
 _DEFAULT_BACKGROUND: BackgroundColor = (0, 0, 0, 1.0)
 
@@ -86,7 +130,16 @@ class SixelOptions:
             colour allocation produces more spatially coherent regions,
             but is ~2x slower and allocates too many palette entries for
             very small images.  ``"adaptive"`` preserves Pillow's
-            median-cut behavior.
+            median-cut behavior.  ``"uniform"`` maps every color onto a
+            fixed palette of evenly spaced levels per channel (6x7x6 for 256
+            colors, a gray ramp below 8) in a few passes over the pixels,
+            without searching for a palette.  It is several times faster,
+            meant for real-time frames, and since its color registers never
+            change, consecutive frames share their bands as well.  Flat
+            areas may show banding; ``"ordered"`` breaks it up with 8x8
+            ordered dithering at the cost of larger output.  All registers
+            of a uniform palette are defined up front unless
+            ``lazy_color_palette`` is set.
         lazy_color_palette: When ``True``, color register definitions
             (``#N;2;R;G;B``) are emitted lazily, on first use of each
             register, and the freshly-defined register stays active for
@@ -97,12 +150,62 @@ class SixelOptions:
             color but renders correctly on terminals (e.g. WezTerm) that
             don't honor the spec rule that a freshly-defined register
             remains active.
+        workers: Number of threads encoding strips of bands concurrently.
+            ``1`` (the default) encodes serially.  NumPy releases the GIL
+            in its kernels, and free-threaded Python builds run the
+            pure-Python encoder in parallel as well.  The output is
+            identical to serial encoding.
+        palette: Fixed palette of 1 to 256 RGB colors, for example built
+            from a reference frame with ``palette_from_image``.  Images are
+            mapped onto it instead of being quantized, so consecutive
+            frames of an animation share their color registers and skip
+            quantization.  ``colors`` and ``quantize`` are ignored.
+            ``None`` (the default) quantizes every image on its own.
+        elide_background: When ``True``, pixels of color register 0, the
+            most frequent color, are not drawn.  The image is then left to
+            the terminal's background fill, which VT340-style terminals
+            paint in register 0 for opaque (``P2=0``) images.  Saves up to a
+            quarter of the output for flat content such as charts, but
+            terminals that fill with their own background color show that
+            instead.  Ignored for images with transparent pixels, and with a
+            fixed ``palette`` or uniform quantization for images whose most
+            frequent color isn't the palette's first.
+        max_bytes: Budget for the size of the sixel output.  When set,
+            ``smooth`` and ``colors`` are stepped down for every image until
+            the estimated output fits, see ``fit_sixel_options``.  ``None``
+            (the default) encodes with the options as they are.
+        max_encode_time: Budget for the encode time in seconds, fitted the
+            same way as ``max_bytes``.  Both budgets can be combined.
     """
 
     colors: int = MAX_COLORS
     smooth: int | None = None
     quantize: QuantizeMethod = "fastoctree"
     lazy_color_palette: bool = False
+    workers: int = 1
+    palette: Palette | None = None
+    elide_background: bool = False
+    max_bytes: int | None = None
+    max_encode_time: float | None = None
+
+    def __post_init__(self) -> None:
+        palette = self.palette
+        if palette is None:
+            return
+        if not 0 < len(palette) <= MAX_COLORS:
+            raise ValueError(f"A palette holds 1 to {MAX_COLORS} colors, got {len(palette)}")
+        for rgb in palette:
+            if len(rgb) != 3 or not all(0 <= value <= 255 for value in rgb):
+                raise ValueError(f"Palette colors are RGB triples of values from 0 to 255, got {rgb!r}")
+
+
+class SixelFit(NamedTuple):
+    """The options ``fit_sixel_options`` chose for an image, and what it estimated for them."""
+
+    options: SixelOptions
+    estimated_bytes: int
+    estimated_seconds: float
+    fits: bool
 
 
 _DEFAULT_SIXEL_OPTIONS = SixelOptions()
@@ -114,30 +217,401 @@ def image_to_sixels(
     background: BackgroundColor | None = None,
 ) -> str:
     """Convert a PIL Image to a sixel-encoded string."""
-    options = options or _DEFAULT_SIXEL_OPTIONS
+    return b"".join(iter_sixels(image, options, background)).decode("ascii")
 
-    image, alpha_mask = _prepare_image(image, options, background)
-    raw_data = image.tobytes()
 
-    if _HAS_NUMPY:
-        data, color_registers = _compact_palette_np(image, raw_data, alpha_mask)
-    else:
-        data, color_registers = _compact_palette(image, raw_data, alpha_mask)
+def iter_sixels(
+    image: PILImage.Image,
+    options: SixelOptions | None = None,
+    background: BackgroundColor | None = None,
+) -> Iterator[AnyBytes]:
+    """Convert a PIL Image to sixels, yielding the encoded data piece by piece.
+
+    The first chunk holds the DCS header and, unless ``lazy_color_palette`` is
+    set, the palette.  It is followed by one chunk per sixel band and the
+    string terminator.  Bands are encoded on demand, so consumers can write
+    the first chunks while later bands are still being encoded.
+
+    Chunks are bytes-like objects; the NumPy encoder yields the bands it
+    encodes as zero-copy ``memoryview`` slices of its output buffer.  Write
+    them to a binary stream as they are, or decode each one with
+    ``str(chunk, "ascii")``.
+    """
+    return _iter_sixels(image, options or _DEFAULT_SIXEL_OPTIONS, background)
 
-    if options.lazy_color_palette:
-        tracker: _ColorTracker = _LazyColorTracker(color_registers)
-        palette_prefix = b""
+
+def palette_from_image(
+    image: PILImage.Image,
+    options: SixelOptions | None = None,
+    background: BackgroundColor | None = None,
+) -> Palette:
+    """Build a fixed palette for ``SixelOptions.palette`` from a reference image.
+
+    The image is quantized as ``image_to_sixels`` would with *options*, and
+    the colors it ends up with are returned, most frequent first.  Images
+    using only these colors, such as a flat reference frame or its crops,
+    are mapped onto the palette exactly.  Others, a photo included, go to
+    a nearby palette color, so they come out close to but not identical
+    to their own quantization.
+    """
+    options = replace(options or _DEFAULT_SIXEL_OPTIONS, palette=None)
+    prepared, _ = _prepare_image(image, options, background)
+    palette = prepared.getpalette() or []
+    counts = [cast("tuple[int, int]", count) for count in prepared.getcolors(MAX_COLORS) or []]
+    counts.sort(key=lambda count: (-count[0], count[1]))
+    return tuple((palette[i * 3], palette[i * 3 + 1], palette[i * 3 + 2]) for _, i in counts)
+
+
+def fit_sixel_options(
+    image: PILImage.Image,
+    options: SixelOptions,
+    background: BackgroundColor | None = None,
+) -> SixelFit:
+    """Step *options* down until the sixels of *image* fit their ``max_bytes`` and ``max_encode_time``.
+
+    Starting from *options*, candidates enable ``smooth``, halve ``colors``
+    down to 2 and then smooth with larger filters; with a fixed ``palette``
+    only ``smooth`` is stepped.  Every candidate tried is quantized, but
+    only a sample of bands is encoded to extrapolate the output size and
+    encode time.  Output shrinks along the candidates, so they are bisected
+    for the first one within the budgets, or the last one if none is.  The
+    chosen options carry no budgets.
+    """
+    return _fit_budget(image, options, background).fit
+
+
+class SixelEncoder:
+    """Encode frames of one size to sixels, keeping the work buffers between frames.
+
+    ``image_to_sixels`` allocates its work buffers for every image.  Live
+    views that re-encode the same widget many times a second can create one
+    encoder instead, which allocates them once.  The output is identical to
+    ``image_to_sixels`` with the same options and background.
+
+    An encoder is not thread-safe and encodes one frame at a time: exhaust
+    or close the iterator of a frame before starting the next one.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        options: SixelOptions | None = None,
+        background: BackgroundColor | None = None,
+    ) -> None:
+        """Initialize the encoder.
+
+        Args:
+            width: Width of the frames, in pixels.
+            height: Height of the frames, in pixels.
+            options: Sixel encoding options, ``image_to_sixels``' default when ``None``.
+            background: Color semi-transparent pixels are composited onto.
+        """
+        self.width = width
+        self.height = height
+        self.options = options or _DEFAULT_SIXEL_OPTIONS
+        self.background = background
+        self._buffers = _WorkBuffers(width, height)
+
+    def encode(self, image: PILImage.Image) -> str:
+        """Convert a frame to a sixel-encoded string.
+
+        Raises:
+            ValueError: If the frame doesn't have the encoder's size.
+        """
+        return b"".join(self.iter_encode(image)).decode("ascii")
+
+    def iter_encode(self, image: PILImage.Image) -> Iterator[AnyBytes]:
+        """Convert a frame to sixels, yielding the encoded data piece by piece like ``iter_sixels``.
+
+        Raises:
+            ValueError: If the frame doesn't have the encoder's size.
+        """
+        if image.size != (self.width, self.height):
+            raise ValueError(f"Expected a {self.width}x{self.height} image, got {image.width}x{image.height}")
+        return _iter_sixels(image, self.options, self.background, self._buffers)
+
+
+class _WorkBuffers:
+    """Buffers a ``SixelEncoder`` reuses for every frame."""
+
+    def __init__(self, width: int, height: int) -> None:
+        # Per-color sixel rows of the band being encoded; all zero between bands
+        self.band_data = [bytearray(width) for _ in range(MAX_COLORS)]
+        # Compacted palette indices of the frame, written by the NumPy encoder
+        self.indices = bytearray(width * height)
+        # Encoded bands of this and the previous frame
+        self.band_cache = _BandCache()
+
+
+def _iter_sixels(
+    image: PILImage.Image,
+    options: SixelOptions,
+    background: BackgroundColor | None,
+    buffers: _WorkBuffers | None = None,
+) -> Iterator[AnyBytes]:
+    """Implement ``iter_sixels``, encoding into *buffers* when given."""
+    width, height = image.size
+    trimmed = _trim_transparent_margins(image)
+    left = top = 0
+    if trimmed is not None:
+        image, left, top = trimmed
+    if options.max_bytes is not None or options.max_encode_time is not None:
+        estimate = _fit_budget(image, options, background, trimmed=trimmed is not None)
+        fit = estimate.fit
+        logger.debug(
+            "fitted sixel options to budget: colors=%s, smooth=%s, estimated %d bytes in %.1f ms",
+            fit.options.colors,
+            fit.options.smooth,
+            fit.estimated_bytes,
+            fit.estimated_seconds * 1e3,
+        )
+        options, image, alpha_mask = fit.options, estimate.image, estimate.alpha_mask
     else:
-        tracker = _PaletteColorTracker()
-        palette_prefix = b"".join(color_registers)
+        image, alpha_mask = _prepare_image(image, options, background)
+    # Trimmed frames are smaller than the buffers, only the band cache fits them
+    indices = band_data = None
+    if buffers is not None and trimmed is None:
+        indices, band_data = buffers.indices, buffers.band_data
+    data, color_registers = _index_image(image, alpha_mask, options, indices)
+
+    transparent = trimmed is not None or alpha_mask is not None
+    header = _make_header(width, height, transparent=transparent)
+    bilevel = alpha_mask is None and 0 < len(color_registers) <= 2
+    tracker, palette_prefix, alpha_mask, elide_background = _plan_colors(
+        data, color_registers, alpha_mask, options, transparent=transparent
+    )
 
-    if _HAS_NUMPY:
-        chunks = _iter_bands_np(data, image.width, image.height, tracker, alpha_mask)
+    yield header + palette_prefix
+
+    # Bands above and below the visible pixels are left empty
+    yield from repeat(_BYTE_CACHE[_NL], top // _BAND_HEIGHT)
+    # Only encoders keep bands, for the frames after this one; one-shot encodes would just pay for copying them
+    cache = None if buffers is None else buffers.band_cache
+    if cache is not None:
+        cache.next_frame(image.width)
+    if bilevel:
+        # Cheaper to encode than to look up in the cache, and than to hand to threads
+        bands = _iter_bilevel_bands(bytes(data), image.width, image.height, tracker, elide_background)
+    elif options.workers > 1:
+        bands = _iter_bands_parallel(data, image.width, image.height, tracker, alpha_mask, options.workers)
+    elif _HAS_NUMPY:
+        bands = _iter_bands_np(data, image.width, image.height, tracker, alpha_mask, cache)
     else:
-        chunks = _iter_bands(data, image.width, image.height, tracker, alpha_mask)
+        bands = _iter_bands(bytes(data), image.width, image.height, tracker, alpha_mask, band_data, cache)
+    yield from bands if not left else map(partial(_offset_band, left), bands)
+    yield from repeat(_BYTE_CACHE[_NL], _band_count(height) - _band_count(top + image.height))
+
+    yield _ST
+
+
+class _ColorPlan(NamedTuple):
+    tracker: _ColorTracker
+    palette_prefix: bytes  # Registers defined ahead of the bands
+    alpha_mask: AlphaMask  # Pixels to draw, without the elided background
+    elide_background: bool
+
+
+def _plan_colors(
+    data: AnyBytes,
+    color_registers: tuple[bytes, ...],
+    alpha_mask: AlphaMask,
+    options: SixelOptions,
+    *,
+    transparent: bool,
+) -> _ColorPlan:
+    """Decide which registers are defined up-front, and which pixels are drawn, for an indexed image."""
+    elide_background = (
+        options.elide_background
+        and not transparent
+        and len(color_registers) > 0
+        and _register_zero_dominates(data, options)
+    )
+    if elide_background:
+        # Skipped like transparent pixels, but the P2=0 header paints them in register 0
+        alpha_mask = bytes(data).translate(_NONZERO_TABLE)
+
+    if options.lazy_color_palette:
+        # Register 0 is never selected when elided, but must be defined for the background
+        defined = {0} if elide_background else set()
+        palette_prefix = color_registers[0] if elide_background else b""
+        return _ColorPlan(_LazyColorTracker(color_registers, defined), palette_prefix, alpha_mask, elide_background)
+    return _ColorPlan(_PaletteColorTracker(), b"".join(color_registers), alpha_mask, elide_background)
+
+
+def _register_zero_dominates(data: AnyBytes, options: SixelOptions) -> bool:
+    """Tell whether register 0 holds the most pixels of an opaque indexed image.
 
-    header = _make_header(image.width, image.height, transparent=alpha_mask is not None)
-    return (header + palette_prefix + b"".join(chunks) + _ST).decode("ascii")
+    Quantized palettes are sorted by frequency, but fixed and uniform ones
+    keep their order, so register 0 can be any of their colors.
+    """
+    if options.palette is None and options.quantize not in UNIFORM_QUANTIZE_METHODS:
+        return True
+    counts = _visible_color_counts(bytes(data), None)
+    return counts.get(0, 0) == max(counts.values(), default=0)
+
+
+def _band_count(height: int) -> int:
+    """Count the bands of an image *height* rows high."""
+    return -(-height // _BAND_HEIGHT)
+
+
+def _trim_transparent_margins(image: PILImage.Image) -> tuple[PILImage.Image, int, int] | None:
+    """Crop an image to the bounding box of its visible pixels, widened up to the top of a band.
+
+    Returns the cropped image and its left and top offsets, or ``None``
+    when there are no transparent margins to trim.
+    """
+    if not _has_transparency(image):
+        return None
+    if "A" not in image.getbands():
+        image = image.convert("RGBA")
+
+    left, top, right, bottom = image.getbbox(alpha_only=True) or (0, 0, 0, 0)
+    top -= top % _BAND_HEIGHT
+    if (left, top, right, bottom) == (0, 0, image.width, image.height):
+        return None
+    return image.crop((left, top, right, bottom)), left, top
+
+
+def _offset_band(left: int, chunk: AnyBytes) -> AnyBytes:
+    """Move every pass of an encoded band *left* columns to the right, into the trimmed margin."""
+    if chunk == _BYTE_CACHE[_NL]:
+        return chunk
+
+    def skip_margin(match: re.Match[bytes]) -> bytes:
+        skipped = left + (int(match[3]) if match[3] else len(match[4] or b""))
+        return b"".join((match[1], match[2] or b"", _emit_repeat(skipped, _SIXEL_OFFSET)))
+
+    return _PASS_START_RE.sub(skip_margin, chunk)
+
+
+def _index_image(
+    image: PILImage.Image,
+    alpha_mask: AlphaMask,
+    options: SixelOptions,
+    indices: bytearray | None = None,
+) -> tuple[AnyBytes, tuple[bytes, ...]]:
+    """Return the color register of every pixel of a prepared image, and the registers' definitions.
+
+    The NumPy encoder writes the registers into *indices* when given.
+    """
+    raw_data = image.tobytes()
+    if options.palette is not None:
+        return raw_data, _fixed_palette(options.palette).registers
+    if options.quantize in UNIFORM_QUANTIZE_METHODS:
+        return raw_data, _fixed_palette(_uniform_palette(options.colors).palette).registers
+    index_freq = _visible_color_counts(raw_data, alpha_mask)
+    # A translate beats NumPy's take for bilevel images, whose bands are then encoded without NumPy anyway
+    if _HAS_NUMPY and len(index_freq) > 2:
+        return _compact_palette_np(image, raw_data, index_freq, indices)
+    return _compact_palette(image, raw_data, alpha_mask, index_freq)
+
+
+class _BudgetEstimate(NamedTuple):
+    fit: SixelFit
+    image: PILImage.Image  # Prepared with the fitted options
+    alpha_mask: AlphaMask
+
+
+def _fit_budget(
+    image: PILImage.Image,
+    options: SixelOptions,
+    background: BackgroundColor | None,
+    *,
+    trimmed: bool = False,
+) -> _BudgetEstimate:
+    """Implement ``fit_sixel_options``, also returning the image prepared with the chosen options.
+
+    *trimmed* tells that *image* was cut out of a larger, transparent one.
+    """
+    candidates = list(_iter_budget_candidates(options))
+    estimate = _estimate_sixels(image, candidates[0], options, background, trimmed=trimmed)
+    if estimate.fit.fits or len(candidates) == 1:
+        return estimate
+
+    low, high = 1, len(candidates) - 1
+    fitting = None
+    while low < high:
+        middle = (low + high) // 2
+        estimate = _estimate_sixels(image, candidates[middle], options, background, trimmed=trimmed)
+        if estimate.fit.fits:
+            fitting, high = estimate, middle
+        else:
+            low = middle + 1
+    if fitting is not None and fitting.fit.options == candidates[low]:
+        return fitting
+    return _estimate_sixels(image, candidates[low], options, background, trimmed=trimmed)
+
+
+def _iter_budget_candidates(options: SixelOptions) -> Iterator[SixelOptions]:
+    """Yield *options* without budgets, followed by the steps ``fit_sixel_options`` takes down from them."""
+    options = replace(options, max_bytes=None, max_encode_time=None)
+    yield options
+    if options.smooth is None:
+        options = replace(options, smooth=_BUDGET_SMOOTH_SIZES[0])
+        yield options
+    while options.palette is None and options.colors > _BUDGET_MIN_COLORS:
+        options = replace(options, colors=max(options.colors // 2, _BUDGET_MIN_COLORS))
+        yield options
+    for smooth in _BUDGET_SMOOTH_SIZES:
+        if smooth > (options.smooth or 0):
+            options = replace(options, smooth=smooth)
+            yield options
+
+
+def _estimate_sixels(
+    image: PILImage.Image,
+    options: SixelOptions,
+    budget: SixelOptions,
+    background: BackgroundColor | None,
+    *,
+    trimmed: bool = False,
+) -> _BudgetEstimate:
+    """Prepare *image* with *options* and extrapolate its sixels from a sample of bands.
+
+    The sample selects colors by number only; lazily defined registers are
+    added once for every color the image draws.
+    """
+    start = time.perf_counter()
+    prepared, alpha_mask = _prepare_image(image, options, background)
+    data, color_registers = _index_image(prepared, alpha_mask, options)
+    transparent = trimmed or alpha_mask is not None
+    plan = _plan_colors(data, color_registers, alpha_mask, options, transparent=transparent)
+    registers_bytes = len(plan.palette_prefix)
+    if options.lazy_color_palette:
+        used = _visible_color_counts(bytes(data), plan.alpha_mask)
+        registers_bytes += sum(len(color_registers[color]) - len(_COLOR_SELECT[color]) for color in used)
+    prepare_seconds = time.perf_counter() - start
+
+    width, height = prepared.size
+    n_bands = -(-height // _BAND_HEIGHT)
+    sampled = range(0, n_bands, max(n_bands // _BUDGET_SAMPLE_BANDS, 1))
+    heights = [min(_BAND_HEIGHT, height - band * _BAND_HEIGHT) for band in sampled]
+    keys = [
+        _band_key(data, plan.alpha_mask, band * _BAND_HEIGHT, band_h, width) for band, band_h in zip(sampled, heights)
+    ]
+    sample = b"".join(band for band, _ in keys)
+    sample_mask = None if plan.alpha_mask is None else b"".join(mask or b"" for _, mask in keys)
+
+    start = time.perf_counter()
+    tracker = _PaletteColorTracker()
+    if alpha_mask is None and 0 < len(color_registers) <= 2:
+        chunks = _iter_bilevel_bands(sample, width, sum(heights), tracker, plan.elide_background)
+    elif _HAS_NUMPY:
+        chunks = _iter_bands_np(sample, width, sum(heights), tracker, sample_mask, _BandCache())
+    else:
+        chunks = _iter_bands(sample, width, sum(heights), tracker, sample_mask, cache=_BandCache())
+    sample_bytes = sum(len(chunk) for chunk in chunks)
+    scale = n_bands / max(len(sampled), 1)
+    seconds = prepare_seconds + (time.perf_counter() - start) * scale
+
+    header = _make_header(width, height, transparent=transparent)
+    n_bytes = len(header) + registers_bytes + round(sample_bytes * scale) + len(_ST)
+    fits = (budget.max_bytes is None or n_bytes <= budget.max_bytes) and (
+        budget.max_encode_time is None or seconds <= budget.max_encode_time
+    )
+    return _BudgetEstimate(SixelFit(options, n_bytes, seconds, fits), prepared, alpha_mask)
 
 
 def _has_transparency(image: PILImage.Image) -> bool:
@@ -177,27 +651,210 @@ def _prepare_image(
         )
 
     n_colors = options.colors
-    small_palette = len(set(image.tobytes())) <= n_colors
 
     match image.mode:
-        case "P" if small_palette:
+        case _ if options.palette is not None:
+            rgb = image.convert("RGB")
+            result = _map_to_fixed_palette(rgb, options.palette) or rgb.quantize(
+                palette=_fixed_palette(options.palette).image, dither=PILImage.Dither.NONE
+            )
+        case _ if options.quantize in UNIFORM_QUANTIZE_METHODS:
+            result = _quantize_uniform(image.convert("RGB"), n_colors, dither=options.quantize == "ordered")
+        case "P" if _count_indices(image) <= n_colors:
             result = image
-        case "L" if small_palette:
+        case "L" if _count_indices(image) <= n_colors:
+            result = image.convert("P")
+        case "1" if n_colors >= 2:
             result = image.convert("P")
         case _:
-            result = _quantize_rgb_image(image.convert("RGB"), options)
+            rgb = image.convert("RGB")
+            result = _map_exact_colors(rgb, n_colors) or _quantize_rgb_image(rgb, options)
 
     if smooth := options.smooth:
-        result = result.filter(ImageFilter.ModeFilter(size=smooth))
+        result = _mode_filter(result, smooth)
 
     return result, alpha_mask
 
 
+def _mode_filter(image: PILImage.Image, size: int) -> PILImage.Image:
+    """Apply a mode filter to a paletted image, vectorized when NumPy is available."""
+    if _HAS_NUMPY and size <= _MODE_FILTER_MAX_SIZE:
+        return _mode_filter_np(image, size)
+    return image.filter(ImageFilter.ModeFilter(size=size))
+
+
+def _count_indices(image: PILImage.Image) -> int:
+    """Count the distinct values of a single-band ``P`` or ``L`` image."""
+    return MAX_COLORS - image.histogram().count(0)
+
+
+def _map_exact_colors(image: PILImage.Image, n_colors: int) -> PILImage.Image | None:
+    """Convert an RGB image with at most *n_colors* distinct colors to ``P`` without losing any.
+
+    Pillow's palette lookup is only exact for colors on its cache grid, so
+    each channel's values are first replaced by their rank on that grid.
+    Images with too many distinct values in a channel for the grid fall back
+    to max-coverage quantization, which keeps every color when there are no
+    more than requested.
+
+    Returns ``None`` when the image is empty or has more than *n_colors* colors.
+    """
+    colors = image.getcolors(n_colors)
+    if not colors:
+        return None
+
+    rgbs = [cast("tuple[int, int, int]", rgb) for _, rgb in colors]
+    levels = [sorted(set(channel)) for channel in zip(*rgbs, strict=True)]
+    if max(map(len, levels)) > MAX_COLORS // _PALETTE_CACHE_STEP:
+        return image.quantize(colors=len(colors), method=PILImage.Quantize.MAXCOVERAGE)
+
+    # One point() table for all three bands: R at 0-255, G at 256-511, B at 512-767
+    offsets = range(0, 3 * MAX_COLORS, MAX_COLORS)
+    lut = [0] * (3 * MAX_COLORS)
+    for offset, values in zip(offsets, levels, strict=True):
+        for rank, value in enumerate(values):
+            lut[offset + value] = rank * _PALETTE_CACHE_STEP
+
+    palette = PILImage.new("P", (1, 1))
+    palette.putpalette([lut[offset + value] for rgb in rgbs for offset, value in zip(offsets, rgb, strict=True)])
+    result = image.point(lut).quantize(palette=palette, dither=PILImage.Dither.NONE)
+    result.putpalette([value for rgb in rgbs for value in rgb])
+    return result
+
+
+def _map_to_fixed_palette(image: PILImage.Image, palette: Palette) -> PILImage.Image | None:
+    """Convert an RGB image whose colors all appear in *palette* to ``P`` indexing *palette* exactly.
+
+    ``quantize(palette=...)`` looks colors up on Pillow's coarse cache grid and
+    may pick a neighbouring palette entry, so the colors are mapped exactly
+    first and their indices then translated to the palette's own.
+
+    Returns ``None`` when the image is empty or has a color missing from *palette*.
+    """
+    fixed = _fixed_palette(palette)
+    colors = image.getcolors(len(palette))
+    if not colors or any(rgb not in fixed.indices for _, rgb in colors):
+        return None
+
+    mapped = cast("PILImage.Image", _map_exact_colors(image, len(colors)))
+    entries = mapped.getpalette() or []
+    table = bytes(fixed.indices.get(tuple(entries[i : i + 3]), 0) for i in range(0, len(entries), 3))
+    result = PILImage.frombytes("P", image.size, mapped.tobytes().translate(table.ljust(MAX_COLORS, b"\0")))
+    result.putpalette([value for rgb in palette for value in rgb])
+    return result
+
+
+class _FixedPalette(NamedTuple):
+    image: PILImage.Image  # ``P`` image holding the palette, for ``quantize(palette=...)``
+    registers: tuple[bytes, ...]  # ``#N;2;R;G;B`` definition of every palette color
+    indices: dict[tuple[int, ...], int]  # Index of the first entry of every color in the palette
+
+
+@lru_cache(maxsize=_FIXED_PALETTE_CACHE_SIZE)
+def _fixed_palette(palette: Palette) -> _FixedPalette:
+    """Build the Pillow palette image and the register definitions of a fixed palette once."""
+    image = PILImage.new("P", (1, 1))
+    image.putpalette([value for rgb in palette for value in rgb])
+    to_pct = _RGB_TO_PCT
+    registers = tuple(
+        f"#{i};2;{to_pct[r]};{to_pct[g]};{to_pct[b]}".encode("ascii") for i, (r, g, b) in enumerate(palette)
+    )
+    indices: dict[tuple[int, ...], int] = {}
+    for i, rgb in enumerate(palette):
+        indices.setdefault(rgb, i)
+    return _FixedPalette(image, registers, indices)
+
+
 def _quantize_rgb_image(image: PILImage.Image, options: SixelOptions) -> PILImage.Image:
     """Quantize an RGB image using the method from *options*."""
     return image.quantize(colors=options.colors, method=_QUANTIZE_METHODS[options.quantize])
 
 
+class _UniformPalette(NamedTuple):
+    mode: str  # Mode the image is quantized in: ``RGB``, or ``L`` for a gray ramp
+    steps: tuple[float, ...]  # Distance between two levels of each channel
+    round_lut: list[int]  # ``point`` table mapping each channel value to its nearest level's share of the index
+    floor_lut: list[int]  # The same, but to the level at or below the value, for dithering
+    palette: Palette
+
+
+@lru_cache(maxsize=_FIXED_PALETTE_CACHE_SIZE)
+def _uniform_palette(colors: int) -> _UniformPalette:
+    """Spread up to *colors* evenly spaced levels over the channels and build the tables to map images onto them."""
+    if colors < _UNIFORM_MIN_COLORS:
+        mode, levels = "L", [colors]
+    else:
+        mode, levels = "RGB", [2, 2, 2]
+        grown = True
+        while grown:
+            grown = False
+            for channel in _UNIFORM_CHANNEL_ORDER:
+                if (levels[0] + (channel == 0)) * (levels[1] + (channel == 1)) * (levels[2] + (channel == 2)) <= colors:
+                    levels[channel] += 1
+                    grown = True
+
+    # Index = level of the first channel, then the next one's, and so on as digits of a mixed-radix number
+    weights = [1] * len(levels)
+    for channel in reversed(range(len(levels) - 1)):
+        weights[channel] = weights[channel + 1] * levels[channel + 1]
+
+    steps = tuple((MAX_COLORS - 1) / (n - 1) if n > 1 else 0.0 for n in levels)
+    round_lut = [(v * (n - 1) + 127) // 255 * w for n, w in zip(levels, weights, strict=True) for v in range(256)]
+    floor_lut = [v * (n - 1) // 255 * w for n, w in zip(levels, weights, strict=True) for v in range(256)]
+
+    values = [[round(level * step) for level in range(n)] for n, step in zip(levels, steps, strict=True)]
+    if mode == "L":
+        palette = tuple((gray, gray, gray) for gray in values[0])
+    else:
+        palette = tuple((r, g, b) for r in values[0] for g in values[1] for b in values[2])
+    return _UniformPalette(mode, steps, round_lut, floor_lut, palette)
+
+
+def _bayer_matrix(size: int) -> list[list[int]]:
+    """Build the *size* x *size* threshold matrix for ordered dithering, *size* being a power of two."""
+    matrix = [[0]]
+    while len(matrix) < size:
+        n = len(matrix)
+        matrix = [
+            [4 * matrix[y % n][x % n] + (0, 2, 3, 1)[y // n * 2 + x // n] for x in range(2 * n)] for y in range(2 * n)
+        ]
+    return matrix
+
+
+@lru_cache(maxsize=_DITHER_CACHE_SIZE)
+def _dither_offsets(size: tuple[int, int], colors: int) -> PILImage.Image:
+    """Tile the ordered dither threshold of every pixel, scaled to the distance between two uniform levels."""
+    uniform = _uniform_palette(colors)
+    width, height = size
+    cells = _DITHER_SIZE * _DITHER_SIZE
+    rows = []
+    for thresholds in _bayer_matrix(_DITHER_SIZE):
+        tile = bytes(int((t + 0.5) / cells * step) for t in thresholds for step in uniform.steps)
+        rows.append((tile * (width // _DITHER_SIZE + 1))[: width * len(uniform.steps)])
+    return PILImage.frombytes(uniform.mode, size, b"".join(rows[y % _DITHER_SIZE] for y in range(height)))
+
+
+def _quantize_uniform(image: PILImage.Image, colors: int, dither: bool) -> PILImage.Image:
+    """Map an RGB image onto the uniform palette of *colors*, optionally with ordered dithering.
+
+    Every pass runs in Pillow's C code: the dither offsets are added with
+    clipping, which can only push a value onto the top level it would reach
+    anyway, a ``point`` table turns each channel into its share of the
+    palette index, and the shares are summed by a matrix conversion.
+    """
+    uniform = _uniform_palette(colors)
+    if uniform.mode == "L":
+        image = image.convert("L")
+    if dither:
+        image = ImageChops.add(image, _dither_offsets(image.size, colors))
+    indices = image.point(uniform.floor_lut if dither else uniform.round_lut)
+    if indices.mode == "RGB":
+        indices = indices.convert("L", matrix=(1, 1, 1, 0))
+    result = indices.convert("P")
+    result.putpalette([value for rgb in uniform.palette for value in rgb])
+    return result
+
+
 def _build_palette_map(palette: list[int], index_freq: dict[int, int]) -> tuple[dict[int, int], tuple[bytes, ...]]:
     """Build a remap table and register definitions from palette index frequencies.
 
@@ -223,24 +880,30 @@ def _build_palette_map(palette: list[int], index_freq: dict[int, int]) -> tuple[
 
 
 def _visible_color_counts(data: bytes, alpha_mask: AlphaMask) -> dict[int, int]:
-    """Count palette indices that will actually be emitted."""
-    if alpha_mask is None:
-        return dict(Counter(data))
+    """Count palette indices that will actually be emitted, with Pillow's C histogram."""
+    if not data:
+        return {}
 
-    return dict(Counter(color for color, alpha in zip(data, alpha_mask, strict=True) if alpha))
+    image = PILImage.frombuffer("L", (len(data), 1), data, "raw", "L", 0, 1)
+    mask = None if alpha_mask is None else PILImage.frombuffer("L", (len(data), 1), alpha_mask, "raw", "L", 0, 1)
+    return {index: n for index, n in enumerate(image.histogram(mask)) if n}
 
 
 def _compact_palette(
     image: PILImage.Image,
     data: bytes,
     alpha_mask: AlphaMask = None,
+    index_freq: dict[int, int] | None = None,
 ) -> tuple[bytes, tuple[bytes, ...]]:
     """Deduplicate palette entries that round to the same sixel RGB percentage.
 
     and remap indices so the most frequent colours get the smallest numbers.
+    *index_freq* holds the counts of ``_visible_color_counts`` when they are
+    already known.
     """
     palette = image.getpalette() or []
-    index_freq = _visible_color_counts(data, alpha_mask)
+    if index_freq is None:
+        index_freq = _visible_color_counts(data, alpha_mask)
     remap, registers = _build_palette_map(palette, index_freq)
 
     table = bytearray(MAX_COLORS)
@@ -272,6 +935,15 @@ class _PaletteColorTracker:
 
     _active: int | None = None
 
+    @property
+    def active(self) -> int | None:
+        """The register selected last, ``None`` before the first selection."""
+        return self._active
+
+    def set_active(self, color: int | None) -> None:
+        """Record *color* as active after sixels that select it without ``select``, ``None`` to force a selection."""
+        self._active = color
+
     def select(self, color: int) -> AnyBytes:
         if color == self._active:
             return b""
@@ -291,10 +963,32 @@ class _LazyColorTracker:
     why this mode is opt-in via ``SixelOptions.lazy_color_palette``.
     """
 
-    _registers: tuple[bytes, ...]
+    registers: tuple[bytes, ...]  # ``#N;2;R;G;B`` definition of every register
     _defined: set[int] = field(default_factory=set)
     _active: int | None = None
 
+    @property
+    def active(self) -> int | None:
+        """The register selected last, ``None`` before the first selection."""
+        return self._active
+
+    def set_active(self, color: int | None) -> None:
+        """Record *color* as active after sixels that select it without ``select``, ``None`` to force a selection."""
+        self._active = color
+
+    @property
+    def defined(self) -> frozenset[int]:
+        """The registers defined so far."""
+        return frozenset(self._defined)
+
+    def all_defined(self, colors: set[int]) -> bool:
+        """Tell whether all of *colors* are defined already."""
+        return colors <= self._defined
+
+    def mark_defined(self, colors: Iterable[int]) -> None:
+        """Record *colors* as defined by sixels that define them without ``select``."""
+        self._defined.update(colors)
+
     def select(self, color: int) -> AnyBytes:
         if color == self._active:
             return b""
@@ -304,21 +998,130 @@ class _LazyColorTracker:
             return _COLOR_SELECT[color]
 
         self._defined.add(color)
-        return self._registers[color]
+        return self.registers[color]
 
 
 _ColorTracker: TypeAlias = _PaletteColorTracker | _LazyColorTracker
 
 
-def _iter_visible_pixels(
-    row_bytes: bytes,
-    row_alpha: bytes | None,
-) -> Iterable[tuple[int, int]]:
-    """Yield ``(x, color)`` pairs for pixels that should be emitted."""
-    if row_alpha is None:
-        return enumerate(row_bytes)
+class _CachedBand(NamedTuple):
+    """An encoded band, split off the selection of its first color so it can follow any active color."""
+
+    first_color: int | None  # None for bands without visible pixels
+    body: bytes
+    last_color: int | None
+
+    def colors(self) -> set[int]:
+        """Return the colors the band selects."""
+        colors = {int(color) for color in _COLOR_TOKEN_RE.findall(self.body)}
+        if self.first_color is not None:
+            colors.add(self.first_color)
+        return colors
+
+
+_EMPTY_BAND = _CachedBand(None, _BYTE_CACHE[_NL], None)
+
+
+class _BandCache:
+    """Encoded bands by their pixels, reused for identical bands of a frame and the frame before it.
+
+    A band's encoding only depends on its pixels and on whether its first
+    color is still active, so entries leave out the selection of that color
+    and are replayed against the tracker.  Bands of a single color, or
+    without visible pixels, are encoded directly.  With a lazy palette,
+    entries select registers instead of defining them, and are only used
+    once all their colors are defined.
+    """
+
+    def __init__(self) -> None:
+        self._current: dict[BandKey, _CachedBand] = {}
+        self._previous: dict[BandKey, _CachedBand] = {}
+        self._width: int | None = None
+
+    def next_frame(self, width: int) -> None:
+        """Start a new frame, dropping the bands the previous frame didn't use.
+
+        Frames trimmed to another *width* drop all bands, as their keys could
+        match bands of another shape.
+        """
+        self._previous, self._current = ({} if width != self._width else self._current), {}
+        self._width = width
+
+    def lookup(self, key: BandKey, width: int, tracker: _ColorTracker) -> _CachedBand | None:
+        """Return the band with the pixels of *key* if it can be replayed against *tracker*."""
+        band = self._current.get(key)
+        if band is None:
+            band = self._previous.get(key)
+            if band is not None:
+                self._current[key] = band
+            else:
+                pixels, band_alpha = key
+                return _replayable(_uniform_band(pixels, band_alpha, 0, len(pixels), width), tracker)
+        return _replayable(band, tracker)
+
+    def store(self, key: BandKey, chunk: AnyBytes, active: int | None) -> _CachedBand:
+        """Store and return a band that was encoded while *active* was the active color."""
+        chunk = bytes(chunk)
+        if b";" in chunk:  # Defines registers of a lazy palette, which are defined when it repeats
+            chunk = _REGISTER_RE.sub(rb"#\1", chunk)
+
+        token = _COLOR_TOKEN_RE.match(chunk)
+        if token is not None:
+            first_color: int | None = int(token[1])
+            body = chunk[token.end() :]
+        else:
+            first_color = None if chunk == _BYTE_CACHE[_NL] else active
+            body = chunk
+        band = self._current[key] = _CachedBand(first_color, body, _last_color(chunk, first_color))
+        return band
+
+
+def _band_key(data: AnyBytes, alpha_mask: AnyBytes | None, band_y: int, band_h: int, width: int) -> BandKey:
+    """Build the cache key of the band starting at row *band_y*."""
+    rows = slice(band_y * width, (band_y + band_h) * width)
+    return bytes(data[rows]), None if alpha_mask is None else bytes(alpha_mask[rows])
 
-    return ((x, color) for x, (color, alpha) in enumerate(zip(row_bytes, row_alpha, strict=True)) if alpha)
+
+def _uniform_band(
+    data: bytes | bytearray, alpha_mask: bytes | bytearray | None, start: int, end: int, width: int
+) -> _CachedBand | None:
+    """Encode the band in ``data[start:end]`` without packing it, if it has a single color or no visible pixels."""
+    if alpha_mask is not None:
+        hidden = alpha_mask.count(0, start, end)
+        if hidden == end - start:
+            return _EMPTY_BAND
+        if hidden:
+            return None
+    if start == end or data.count(data[start], start, end) != end - start:
+        return None
+
+    band_h = (end - start) // width
+    body = b"".join((_emit_repeat(width, _SIXEL_OFFSET + (1 << band_h) - 1), _BYTE_CACHE[_NL]))
+    return _CachedBand(data[start], body, data[start])
+
+
+def _replayable(band: _CachedBand | None, tracker: _ColorTracker) -> _CachedBand | None:
+    """Return *band* unless it selects registers a lazy palette hasn't defined yet."""
+    if band is None or (isinstance(tracker, _LazyColorTracker) and not tracker.all_defined(band.colors())):
+        return None
+    return band
+
+
+def _last_color(chunk: bytes, active: int | None) -> int | None:
+    """Return the color that is active after *chunk*, given the one active before it."""
+    pos = chunk.rfind(b"#")
+    token = _COLOR_TOKEN_RE.match(chunk, pos) if pos >= 0 else None
+    return active if token is None else int(token[1])
+
+
+def _replay_band(band: _CachedBand, tracker: _ColorTracker) -> AnyBytes:
+    """Emit a cached band, selecting its first color unless that is still active."""
+    if band.first_color is None:
+        return band.body
+
+    selection = tracker.select(band.first_color)
+    tracker.set_active(band.last_color)
+    return b"".join((selection, band.body)) if selection else band.body
 
 
 def _pack_band(
@@ -328,28 +1131,163 @@ def _pack_band(
     width: int,
     band_data: list[bytearray],
     alpha_mask: AlphaMask = None,
-) -> ColorSpans:
-    """Build per-color sixel bitmasks for one band.
+) -> list[Segment]:
+    """Build per-color sixel bitmasks for one band and split them into segments.
+
+    Colors are located with C-speed ``bytes`` methods: rare ones with
+    ``find``, common ones with one ``translate`` per row.  Bands where that
+    adds up to more work than visiting every pixel once, like photos with
+    many colors, are packed pixel by pixel instead.
 
-    Returns ``{color: (first_col, last_col + 1)}`` for every active color.
+    Returns ``(start_col, end_col, color)`` for every run of a color's
+    columns without internal gaps of >= _GAP_THRESHOLD empty columns.
     """
-    span_start = [width] * MAX_COLORS
-    span_end = [0] * MAX_COLORS
+    band_slice = slice(band_y * width, (band_y + band_h) * width)
+    band = data[band_slice]
+    band_alpha = None if alpha_mask is None else alpha_mask[band_slice]
+    counts = _band_color_counts(band, band_alpha, width, band_h)
+
+    # In units of one find step: translating a color costs about width / 16
+    max_find = width // _TRANSLATE_COST_COLUMNS
+    if sum(min(n, max_find) for n in counts.values()) * _PIXEL_COST_RATIO > len(band):
+        return _pack_band_pixels(band, band_alpha, band_h, width, counts, band_data)
+
+    rows = [band[row * width : (row + 1) * width] for row in range(band_h)]
+    opaque = None
+    if band_alpha is not None:
+        opaque = [
+            int.from_bytes(band_alpha[row * width : (row + 1) * width].translate(_OPAQUE_TABLE), "little")
+            for row in range(band_h)
+        ]
+
+    segments: list[Segment] = []
+    for color, n in counts.items():
+        if n <= max_find:
+            segments += _pack_color_find(band, band_alpha, width, color, band_data[color])
+        else:
+            segments += _pack_color_translate(rows, opaque, width, color, band_data[color])
+    return segments
+
+
+def _band_color_counts(band: bytes, band_alpha: bytes | None, width: int, band_h: int) -> dict[int, int]:
+    """Count the visible pixels of each color in a band with Pillow's C histogram."""
+    if not band:
+        return {}
+
+    image = PILImage.frombuffer("L", (width, band_h), band, "raw", "L", 0, 1)
+    mask = None if band_alpha is None else PILImage.frombuffer("L", (width, band_h), band_alpha, "raw", "L", 0, 1)
+    return {color: n for color, n in enumerate(image.histogram(mask)) if n}
+
+
+def _pack_band_pixels(
+    band: bytes,
+    band_alpha: bytes | None,
+    band_h: int,
+    width: int,
+    counts: dict[int, int],
+    band_data: list[bytearray],
+) -> list[Segment]:
+    """Build the bitmasks of a band with many colors in a single pass over its pixels.
 
+    Segments of rare colors come from their ``find`` positions, which also
+    sets their bits again, and the others from their bitmasks.
+    """
     for row in range(band_h):
         bit = 1 << row
-        row_start = (band_y + row) * width
-        row_bytes = data[row_start : row_start + width]
-        row_alpha = None if alpha_mask is None else alpha_mask[row_start : row_start + width]
-
-        for x, color in _iter_visible_pixels(row_bytes, row_alpha):
+        row_slice = slice(row * width, (row + 1) * width)
+        pixels: Iterable[tuple[int, int]] = enumerate(band[row_slice])
+        if band_alpha is not None:
+            pixels = compress(pixels, band_alpha[row_slice])
+        for x, color in pixels:
             band_data[color][x] |= bit
-            if x < span_start[color]:
-                span_start[color] = x
-            if x >= span_end[color]:
-                span_end[color] = x + 1
 
-    return {c: (span_start[c], span_end[c]) for c in range(MAX_COLORS) if span_end[c]}
+    # Splitting a bitmask costs about as much as finding width / 64 pixels
+    max_find = width // (4 * _TRANSLATE_COST_COLUMNS)
+    segments: list[Segment] = []
+    for color, n in counts.items():
+        if n <= max_find:
+            segments += _pack_color_find(band, band_alpha, width, color, band_data[color])
+        else:
+            segments += _split_bits(int.from_bytes(band_data[color], "little"), width, color)
+    return segments
+
+
+def _pack_color_find(
+    band: bytes,
+    band_alpha: bytes | None,
+    width: int,
+    color: int,
+    color_row: bytearray,
+) -> list[Segment]:
+    """Build the bitmask of a rare color from its ``find`` positions."""
+    columns = set()
+    pos = band.find(color)
+    while pos != -1:
+        if band_alpha is None or band_alpha[pos]:
+            row, x = divmod(pos, width)
+            color_row[x] |= 1 << row
+            columns.add(x)
+        pos = band.find(color, pos + 1)
+
+    segments: list[Segment] = []
+    start = end = -_GAP_THRESHOLD
+    for x in sorted(columns):
+        if x - end >= _GAP_THRESHOLD:
+            if start >= 0:
+                segments.append((start, end, color))
+            start = x
+        end = x + 1
+    if start >= 0:
+        segments.append((start, end, color))
+    return segments
+
+
+def _pack_color_translate(
+    rows: list[bytes],
+    opaque: list[int] | None,
+    width: int,
+    color: int,
+    color_row: bytearray,
+) -> list[Segment]:
+    """Build the bitmask of a common color with one ``translate`` per row.
+
+    Translating a row marks the color's pixels with a 1 byte.  As a
+    little-endian integer, shifting by the row number moves those marks to
+    the row's sixel bit without carrying into the next column.
+    """
+    table = _COLOR_TABLES[color]
+    bits = 0
+    for row, row_bytes in enumerate(rows):
+        row_bits = int.from_bytes(row_bytes.translate(table), "little")
+        if opaque is not None:
+            row_bits &= opaque[row]
+        bits |= row_bits << row
+
+    color_row[:] = bits.to_bytes(width, "little")
+    return _split_bits(bits, width, color)
+
+
+def _split_bits(bits: int, width: int, color: int) -> list[Segment]:
+    """Split a color's bitmask, as a little-endian integer, at gaps of >= _GAP_THRESHOLD empty columns.
+
+    OR-ing the bitmask with copies shifted by up to ``_GAP_THRESHOLD - 1``
+    columns fills exactly the shorter gaps, so each segment is a run of
+    nonzero bytes that ``find`` locates, overhanging by the shift.
+    """
+    spread = bits | bits << 8
+    spread |= spread << 16
+    spread |= spread << 32
+    spread |= spread << 16  # bits shifted by 0..9 columns
+    flags = spread.to_bytes(width + _GAP_THRESHOLD, "little").translate(_NONZERO_TABLE)
+
+    segments: list[Segment] = []
+    end = flags.find(1)
+    while end != -1:
+        start = end
+        end = flags.find(0, start)
+        segments.append((start, end - _GAP_THRESHOLD + 1, color))
+        end = flags.find(1, end)
+    return segments
 
 
 def _iter_greedy_passes(
@@ -374,56 +1312,74 @@ def _iter_greedy_passes(
     return current_pass, remaining
 
 
-def _emit_repeat(count: int, char_byte: int) -> AnyBytes:
-    """Emit *count* repetitions of a single sixel byte."""
-    if count < _RLE_THRESHOLD:
-        return _BYTE_CACHE[char_byte] * count
+def _assign_passes(segments: list[Segment]) -> list[list[Segment]]:
+    """Partition segments sorted by start into passes of non-overlapping segments.
 
-    return _rle_prefix(count) + _BYTE_CACHE[char_byte]
+    Each segment goes into the lowest-numbered pass whose last segment ends
+    at or before its start (first-fit), which gives the same passes as
+    repeated ``_iter_greedy_passes`` calls.  Passes are freed by sweeping a
+    heap of end columns, and the free ones are the set bits of an integer so
+    the lowest is found in constant time: O(n log n) overall.
+    """
+    passes: list[list[Segment]] = []
+    free = 0
+    ending: dict[int, int] = {}  # {end_col: bitmask of passes whose last segment ends there}
+    end_cols: list[int] = []
+
+    for seg in segments:
+        start, end, _ = seg
+        while end_cols and end_cols[0] <= start:
+            free |= ending.pop(heappop(end_cols))
+
+        if free:
+            bit = free & -free
+            free ^= bit
+            passes[bit.bit_length() - 1].append(seg)
+        else:
+            bit = 1 << len(passes)
+            passes.append([seg])
 
+        if end in ending:
+            ending[end] |= bit
+        else:
+            ending[end] = bit
+            heappush(end_cols, end)
 
-def _split_segments(spans: ColorSpans, band_data: list[bytearray]) -> list[Segment]:
-    """Split color spans at internal gaps of >= _GAP_THRESHOLD empty columns.
+    return passes
 
-    Iterates regex matches in a single pass, merging small gaps on the fly
-    without building an intermediate list of runs. Skips the regex scan
-    entirely when the span contains no zero bytes.
-    """
-    segments: list[Segment] = []
-    for color, (start, end) in spans.items():
-        row = band_data[color]
 
-        # Fast path: no zeros in span means no gaps to split
-        if row.find(0, start, end) == -1:
-            segments.append((start, end, color))
-            continue
+def _iter_passes(segments: list[Segment]) -> Iterator[list[Segment]]:
+    """Yield passes of non-overlapping segments from segments sorted by start.
 
-        seg_start = -1
-        seg_end = 0
-        for m in _NONZERO_RUN_RE.finditer(row, start, end):
-            ms, me = m.span()
-            if seg_start == -1:
-                seg_start = ms
-                seg_end = me
-            elif ms - seg_end < _GAP_THRESHOLD:
-                seg_end = me
-            else:
-                segments.append((seg_start, seg_end, color))
-                seg_start = ms
-                seg_end = me
+    Greedy extraction rescans every remaining segment per pass, which is the
+    fastest way in CPython while passes take a good share of the segments.
+    Once a pass takes less than ``1 / _RESCAN_RATIO`` of what remains, the
+    band is fragmented into many thin passes and the rest goes through
+    ``_assign_passes`` instead.
+    """
+    remaining = segments
+    while remaining:
+        pass_segments, remaining = _iter_greedy_passes(remaining)
+        yield pass_segments
+        if len(remaining) > _RESCAN_RATIO * len(pass_segments):
+            yield from _assign_passes(remaining)
+            return
 
-        if seg_start != -1:
-            segments.append((seg_start, seg_end, color))
 
-    return segments
+def _emit_repeat(count: int, char_byte: int) -> AnyBytes:
+    """Emit *count* repetitions of a single sixel byte."""
+    if count < _RLE_THRESHOLD:
+        return _BYTE_CACHE[char_byte] * count
+
+    return _rle_prefix(count) + _BYTE_CACHE[char_byte]
 
 
 def _emit_band(
-    spans: ColorSpans,
+    segments: list[Segment],
     band_data: list[bytearray],
     tracker: _ColorTracker,
     band_h: int = _BAND_HEIGHT,
-    allow_fill: bool = True,
+    holes: bytes | None = None,
 ) -> AnyBytes:
     """Encode one band, packing non-overlapping color spans into shared passes.
 
@@ -431,85 +1387,262 @@ def _emit_band(
     blocks (all bits set) that RLE-compress into short ``!N~`` runs.
     Subsequent passes emit real bitmask data which overwrites the filled
     pixels -- sixel 0-bits mean "no change", so correctness is preserved.
+    Skipped pixels are never overwritten, so pass 0 segments spanning
+    any column flagged in *holes* (see ``_band_holes``) emit their real
+    bitmask data instead.
 
-    Uses streaming greedy extraction to avoid materializing all passes
-    at once, matching libsixel's NodeFlush pattern.
+    The bitmask data of all unfilled segments is RLE-encoded in one go, see
+    ``_rle_encode_segments``.
     """
-    if not spans:  # pragma: no cover
+    if not segments:  # pragma: no cover
         return _BYTE_CACHE[_NL]
 
-    remaining = sorted(
-        _split_segments(spans, band_data),
-        key=lambda seg: (seg[0], seg[0] - seg[1], seg[2]),
-    )
+    segments.sort(key=lambda seg: (seg[0], seg[0] - seg[1], seg[2]))
 
     # Fillable byte: all band_h bits set, offset to printable range
     fill_byte = _SIXEL_OFFSET + (1 << band_h) - 1
 
+    passes = list(_iter_passes(segments))
+    fill_flags = [holes is None or holes.find(1, start, end) < 0 for start, end, _ in passes[0]]
+    data_segments = [seg for seg, fill in zip(passes[0], fill_flags, strict=True) if not fill]
+    data_segments += [seg for p in passes[1:] for seg in p]
+    encoded = iter(_rle_encode_segments(band_data, data_segments))
+    fillable = iter(fill_flags)
+
     buffer = bytearray()
-    fillable = allow_fill
 
-    while remaining:
-        pass_segments, remaining = _iter_greedy_passes(remaining)
+    for pass_index, pass_segments in enumerate(passes):
+        if pass_index:
+            buffer.append(_CR)
 
         cursor = 0
         for start, end, color in pass_segments:
             buffer.extend(tracker.select(color))
             if start > cursor:
                 buffer.extend(_emit_repeat(start - cursor, _SIXEL_OFFSET))
-            if fillable:
+            if not pass_index and next(fillable):
                 buffer.extend(_emit_repeat(end - start, fill_byte))
             else:
-                buffer.extend(_rle_encode(band_data[color], start, end))
+                buffer.extend(next(encoded))
             cursor = end
 
-        fillable = False
-        if remaining:
-            buffer.append(_CR)
-
     buffer.append(_NL)
     return buffer
 
 
+def _band_holes(alpha_mask: bytes, band_y: int, band_h: int, width: int) -> bytes:
+    """Flag the columns of a band that hold at least one skipped pixel with 0x01."""
+    holes = 0
+    for row in range(band_y, band_y + band_h):
+        holes |= int.from_bytes(alpha_mask[row * width : (row + 1) * width].translate(_HOLE_TABLE), "little")
+    return holes.to_bytes(width, "little")
+
+
 def _iter_bands(
     data: bytes,
     width: int,
     height: int,
     tracker: _ColorTracker,
     alpha_mask: AlphaMask = None,
-) -> list[AnyBytes]:
-    """Return encoded sixel chunks, one per band."""
-    band_data = [bytearray(width) for _ in range(MAX_COLORS)]
+    band_data: list[bytearray] | None = None,
+    cache: _BandCache | None = None,
+) -> Iterator[AnyBytes]:
+    """Yield encoded sixel chunks, one per band.
+
+    *band_data* holds ``MAX_COLORS`` zeroed rows of *width* bytes to pack
+    bands into, and is left zeroed even if the iterator is closed early.
+    Bands found in *cache* are replayed instead of being packed.  Without a
+    cache, bands of a single color are still emitted without packing them.
+    """
+    if band_data is None:
+        band_data = [bytearray(width) for _ in range(MAX_COLORS)]
     zero_fill = bytes(width)
-    allow_fill = alpha_mask is None
 
-    bands: list[AnyBytes] = []
     for band_y in range(0, height, _BAND_HEIGHT):
         band_h = min(_BAND_HEIGHT, height - band_y)
-        spans = _pack_band(data, band_y, band_h, width, band_data, alpha_mask)
-        bands.append(_emit_band(spans, band_data, tracker, band_h, allow_fill=allow_fill))
+        if cache is not None:
+            key = _band_key(data, alpha_mask, band_y, band_h, width)
+            cached = cache.lookup(key, width, tracker)
+            active = tracker.active
+        else:
+            uniform = _uniform_band(data, alpha_mask, band_y * width, (band_y + band_h) * width, width)
+            cached = _replayable(uniform, tracker)
+        if cached is not None:
+            yield _replay_band(cached, tracker)
+            continue
+
+        segments = _pack_band(data, band_y, band_h, width, band_data, alpha_mask)
+        holes = None if alpha_mask is None else _band_holes(alpha_mask, band_y, band_h, width)
+        try:
+            chunk = _emit_band(segments, band_data, tracker, band_h, holes)
+            if cache is not None:
+                cache.store(key, chunk, active)
+            yield chunk
+        finally:
+            for c in {seg[2] for seg in segments}:
+                band_data[c][:] = zero_fill
+
+
+def _iter_bilevel_bands(
+    data: bytes,
+    width: int,
+    height: int,
+    tracker: _ColorTracker,
+    elide_background: bool = False,
+) -> Iterator[AnyBytes]:
+    """Yield encoded sixel chunks, one per band, of an opaque image with no more than two color registers.
+
+    Every pixel is 0 or 1, so shifting a row as a little-endian integer by
+    its row number moves its pixels to their sixel bit without carrying
+    into the next column, and OR-ing the band's rows gives the sixel values
+    of register 1.  Each band is filled with the color of more whole
+    columns, and the other one is drawn over it in a second pass.  An
+    elided background is never filled.
+    """
+    for band_y in range(0, height, _BAND_HEIGHT):
+        band_h = min(_BAND_HEIGHT, height - band_y)
+        full = (1 << band_h) - 1
+        bits = 0
+        for row in range(band_h):
+            start = (band_y + row) * width
+            bits |= int.from_bytes(data[start : start + width], "little") << row
+        sixels = bits.to_bytes(width, "little")
+
+        buffer = bytearray()
+        drawn_color = 1
+        if not elide_background:
+            if sixels.count(full) > sixels.count(0):
+                drawn_color = 0
+                sixels = sixels.translate(_INVERT_TABLES[band_h])
+            buffer += tracker.select(1 - drawn_color)
+            buffer += _emit_repeat(width, _SIXEL_OFFSET + full)
+
+        drawn = sixels.rstrip(b"\0")
+        if drawn:
+            if buffer:
+                buffer.append(_CR)
+            skipped = len(drawn) - len(drawn.lstrip(b"\0"))
+            buffer += tracker.select(drawn_color)
+            buffer += _emit_repeat(skipped, _SIXEL_OFFSET)
+            buffer += _rle_encode(drawn[skipped:])
+        buffer.append(_NL)
+        yield buffer
+
+
+def _encode_strip(
+    data: AnyBytes,
+    width: int,
+    height: int,
+    alpha_mask: AnyBytes | None,
+    registers: tuple[bytes, ...] | None,
+) -> tuple[list[AnyBytes], _ColorTracker]:
+    """Encode one strip of bands from a fresh tracker, returning its chunks and final tracker state."""
+    tracker: _ColorTracker = _PaletteColorTracker() if registers is None else _LazyColorTracker(registers)
+    if _HAS_NUMPY:
+        return list(_iter_bands_np(data, width, height, tracker, alpha_mask)), tracker
+
+    mask = None if alpha_mask is None else bytes(alpha_mask)
+    return list(_iter_bands(bytes(data), width, height, tracker, mask)), tracker
 
-        for c in spans:
-            band_data[c][:] = zero_fill
 
-    return bands
+def _stitch_strip(chunks: list[AnyBytes], strip_tracker: _ColorTracker, tracker: _ColorTracker) -> Iterator[AnyBytes]:
+    """Yield a strip's chunks as if it had been encoded after everything *tracker* has seen.
+
+    The strip started without an active color, so its first non-empty band
+    opens with a color token.  That token is dropped when the color is
+    still active from the previous strip.  In lazy mode, definitions of
+    registers that earlier strips already defined become plain selections.
+    """
+    defined = tracker.defined if isinstance(tracker, _LazyColorTracker) else frozenset()
+
+    def select_defined(match: re.Match[bytes]) -> bytes:
+        color = int(match[1])
+        return _COLOR_SELECT[color] if color in defined else match[0]
+
+    first_token_pending = True
+    for chunk in chunks:
+        if first_token_pending and (token := _COLOR_TOKEN_RE.match(chunk)):
+            first_token_pending = False
+            if int(token[1]) == tracker.active:
+                chunk = chunk[token.end() :]
+        yield _REGISTER_RE.sub(select_defined, chunk) if defined else chunk
+
+    if strip_tracker.active is not None:
+        tracker.set_active(strip_tracker.active)
+    if isinstance(tracker, _LazyColorTracker) and isinstance(strip_tracker, _LazyColorTracker):
+        tracker.mark_defined(strip_tracker.defined)
+
+
+def _iter_bands_parallel(
+    data: AnyBytes,
+    width: int,
+    height: int,
+    tracker: _ColorTracker,
+    alpha_mask: AlphaMask,
+    workers: int,
+) -> Iterator[AnyBytes]:
+    """Yield encoded sixel chunks, one per band, encoding strips of bands on a thread pool.
+
+    Strips are submitted up front and stitched back together in order, so
+    chunks are yielded as soon as the strips before them are done.
+    """
+    registers = tracker.registers if isinstance(tracker, _LazyColorTracker) else None
+    strip_rows = _STREAM_BANDS * _BAND_HEIGHT
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        strips = []
+        for strip_y in range(0, height, strip_rows):
+            strip_h = min(strip_rows, height - strip_y)
+            rows = slice(strip_y * width, (strip_y + strip_h) * width)
+            strip_mask = None if alpha_mask is None else memoryview(alpha_mask)[rows]
+            strips.append(executor.submit(_encode_strip, memoryview(data)[rows], width, strip_h, strip_mask, registers))
+
+        for strip in strips:
+            chunks, strip_tracker = strip.result()
+            yield from _stitch_strip(chunks, strip_tracker, tracker)
+    finally:
+        executor.shutdown(cancel_futures=True)
 
 
 def _rle_prefix(n: int) -> bytes:
     return _RLE_PREFIX[n] if n < _CACHED_COUNTS else f"!{n}".encode("ascii")
 
 
-def _compress_long_run(match: re.Match[bytes]) -> bytes:
-    """``re.sub`` callback: compress a run of 4+ identical bytes to ``!N<char>``."""
-    n = match.end() - match.start()
-    return _rle_prefix(n) + match.group(1)
+class _RunCache(dict[bytes, bytes]):
+    """``{run: b"!N<char>"}`` for runs of 4+ identical sixel bytes, filled on first use.
+
+    Runs longer than ``_CACHED_RUN_LENGTH`` are encoded every time so the
+    cache stays small.
+    """
+
+    def __missing__(self, run: bytes) -> bytes:
+        encoded = _rle_prefix(len(run)) + run[:1]
+        if len(run) <= _CACHED_RUN_LENGTH:
+            self[run] = encoded
+        return encoded
 
 
-def _rle_encode(data: bytearray, start: int, end: int) -> AnyBytes:
-    """RLE-encode ``data[start:end]`` with the +0x3F sixel offset applied."""
-    if segment := data[start:end].translate(_TRANSLATE_TABLE):
-        return _LONG_RUN_RE.sub(_compress_long_run, segment)
-    return b""  # pragma: no cover
+_RUN_CACHE = _RunCache()
+
+
+def _rle_encode_segments(band_data: list[bytearray], segments: list[Segment]) -> list[bytes]:
+    """RLE-encode the bitmask data of every segment, with the +0x3F sixel offset applied.
+
+    The segments are joined with a separator that translates to NUL, so one
+    ``translate`` and one regex split cover the whole band.  The split yields
+    each long run as its own piece, which is compressed by a ``_RUN_CACHE``
+    lookup instead of a Python callback per run.
+    """
+    joined = _SEGMENT_SEPARATOR.join([band_data[color][start:end] for start, end, color in segments])
+    return _rle_encode(joined).split(b"\0")
+
+
+def _rle_encode(sixels: bytes) -> bytes:
+    """RLE-encode raw sixel values, with the +0x3F sixel offset applied."""
+    pieces = _LONG_RUN_SPLIT_RE.split(sixels.translate(_TRANSLATE_TABLE))
+    del pieces[2::3]  # the run's repeated byte, captured by the backreference group
+    pieces[1::2] = map(_RUN_CACHE.__getitem__, pieces[1::2])
+    return b"".join(pieces)
 
 
 if _HAS_NUMPY:
@@ -519,112 +1652,504 @@ if _HAS_NUMPY:
     def _compact_palette_np(
         image: PILImage.Image,
         data: bytes,
-        alpha_mask: AlphaMask = None,
-    ) -> tuple[bytes, tuple[bytes, ...]]:
-        """Numpy-accelerated palette compaction using ``np.bincount``."""
+        index_freq: dict[int, int],
+        out: bytearray | None = None,
+    ) -> tuple[AnyBytes, tuple[bytes, ...]]:
+        """Numpy-accelerated palette compaction from the counts of ``_visible_color_counts``.
+
+        The remapped indices are written to *out* when given, which must have
+        the same length as *data*.
+        """
         palette = image.getpalette() or []
         arr = np.frombuffer(data, dtype=np.uint8)
-        visible_arr = arr if alpha_mask is None else arr[np.frombuffer(alpha_mask, dtype=np.uint8) != 0]
-        counts_arr = np.bincount(visible_arr, minlength=MAX_COLORS)
-
-        index_freq = {int(i): int(counts_arr[i]) for i in np.flatnonzero(counts_arr)}
         remap_dict, registers = _build_palette_map(palette, index_freq)
 
         remap = np.zeros(MAX_COLORS, dtype=np.uint8)
         for idx, new_idx in remap_dict.items():
             remap[idx] = new_idx
 
-        return remap[arr].tobytes(), registers
-
-    def _iter_bands_np(
-        data: bytes,
+        if out is None:
+            return remap[arr].tobytes(), registers
+        np.take(remap, arr, out=np.frombuffer(out, dtype=np.uint8))
+        return out, registers
+
+    def _mode_filter_np(image: PILImage.Image, size: int) -> PILImage.Image:
+        """Replace every palette index with the most common one around it, like ``ImageFilter.ModeFilter``.
+
+        Pillow builds a 256-bin histogram for every pixel.  Here the count of
+        every candidate in a window is a sum of equality masks: one mask per
+        displacement between two pixels of a window, compared over the whole
+        strip at once.  The masks of all candidates share their sums, which
+        are taken as sliding box sums, first along rows, then along columns.
+
+        As in Pillow, windows are clipped at the image border, ties go to the
+        lowest index and pixels keep their own index unless the most common
+        one occurs more than twice.  The border is padded with values above
+        255 that differ from each other within any window, so they never
+        match anything but themselves.  Counts fit the key's upper bits for
+        windows up to ``_MODE_FILTER_MAX_SIZE``.
+        """
+        arr = np.asarray(image)
+        height, width = arr.shape
+        half = size // 2
+        window = 2 * half + 1
+        span = 2 * half  # Largest displacement between two pixels of a window
+        pad = span + half  # Candidates lie up to ``half`` outside a window, compared up to ``span`` away
+
+        ys, xs = np.ogrid[: height + 2 * pad, : width + 2 * pad]
+        padded = (MAX_COLORS + ys % window * window + xs % window).astype(np.uint16)
+        padded[pad : pad + height, pad : pad + width] = arr
+
+        out = np.empty_like(arr)
+        for strip_y in range(0, height, _MODE_FILTER_STRIP_ROWS):
+            strip_h = min(_MODE_FILTER_STRIP_ROWS, height - strip_y)
+            # Candidate positions: the strip grown by ``half`` on every side
+            top, left = strip_y + pad - half, pad - half
+            cand_h, cand_w = strip_h + span, width + span
+            candidates = padded[top : top + cand_h, left : left + cand_w]
+
+            # row_sums[dy][i]: matches at row offset dy, for a candidate at column offset half - i
+            row_sums = []
+            for dy in range(-span, span + 1):
+                masks = [
+                    candidates == padded[top + dy : top + dy + cand_h, left + dx : left + dx + cand_w]
+                    for dx in range(-span, span + 1)
+                ]
+                row_sums.append(_sliding_sums_np(masks, window))
+
+            # Every candidate matches itself, so any key beats zero
+            best = np.zeros((strip_h, width), dtype=np.uint16)
+            for i in range(window):
+                # counts[j]: occurrences in the window of the candidate at offset (half - j, half - i)
+                counts = _sliding_sums_np([row[i] for row in row_sums], window)
+                for j, count in enumerate(counts):
+                    rows = slice(span - j, span - j + strip_h)
+                    cols = slice(span - i, span - i + width)
+                    # Highest count first, then lowest value
+                    key = count[rows, cols].astype(np.uint16) << 10 | (1023 - candidates[rows, cols])
+                    np.maximum(best, key, out=best)
+
+            strip = slice(strip_y, strip_y + strip_h)
+            out[strip] = np.where(best >> 10 > 2, 1023 - (best & 1023), arr[strip])
+
+        result = PILImage.frombytes("P", image.size, out.tobytes())
+        result.putpalette(image.getpalette() or [])
+        return result
+
+    def _sliding_sums_np(
+        terms: list[npt.NDArray[np.bool_]] | list[npt.NDArray[np.uint8]], n: int
+    ) -> list[npt.NDArray[np.uint8]]:
+        """Sum every *n* consecutive arrays of *terms*."""
+        total = terms[0].astype(np.uint8)
+        for term in terms[1:n]:
+            total += term
+        sums = [total]
+        for i in range(n, len(terms)):
+            total = total + terms[i]
+            total -= terms[i - n]
+            sums.append(total)
+        return sums
+
+    # Token kinds of the vectorized emitter.  The sixel body is described as a
+    # flat stream of tokens ``(kind, a, b)`` that is rendered to bytes at once.
+    _TOKEN_RUN = 0  # byte ``a`` repeated ``b`` times, compressed like ``_emit_repeat``
+    _TOKEN_SELECT = 1  # ``#a`` color selection
+    _TOKEN_BYTE = 2  # literal byte ``a``
+    _TOKEN_REGISTER = 3  # lazy ``#a;2;R;G;B`` register definition
+
+    # 10**0 ... 10**18, used to count and extract decimal digits
+    _NP_POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+    def _sparse_bitmasks_np(
+        arr: npt.NDArray[np.uint8],
+        mask_arr: npt.NDArray[np.uint8] | None,
+    ) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.intp], npt.NDArray[np.intp], npt.NDArray[np.uint8]]:
+        """Build the sixel bitmasks of all bands as sparse ``(band, color, column, bits)`` arrays.
+
+        Only non-zero sixel columns are returned, ordered by band, then color,
+        then column.
+
+        Each sixel column holds six pixels, so a color's bits are the summed
+        weights of the rows sharing its value -- computed with elementwise
+        comparisons over the whole image.  The first row of every color in a
+        column carries its entry.  Entries come out in (band, column) order and
+        are brought into (band, color) order with two stable radix sorts.
+        """
+        height, width = arr.shape
+        pad_h = (_BAND_HEIGHT - height % _BAND_HEIGHT) % _BAND_HEIGHT
+        visible = np.ones((height, width), dtype=bool) if mask_arr is None else mask_arr != 0
+        if pad_h:
+            arr = np.pad(arr, ((0, pad_h), (0, 0)))
+            visible = np.pad(visible, ((0, pad_h), (0, 0)))
+
+        # (n_bands, 6, width): padded and transparent pixels weigh nothing
+        band_arr = arr.reshape(-1 if width else 0, _BAND_HEIGHT, width)
+        weights = visible.reshape(band_arr.shape) * _NP_BIT_WEIGHTS[:, None]
+        rows = [band_arr[:, r] for r in range(_BAND_HEIGHT)]
+
+        bits = np.zeros((*band_arr.shape[::2], _BAND_HEIGHT), dtype=np.uint8)
+        first = np.ones(bits.shape, dtype=bool)
+        for r in range(_BAND_HEIGHT):
+            for s in range(_BAND_HEIGHT):
+                same = rows[r] == rows[s]
+                bits[..., r] += same * weights[:, s]
+                if s < r:
+                    first[..., r] &= ~same
+
+        entries = np.flatnonzero(first & (bits != 0))
+        band, column = np.divmod(entries // _BAND_HEIGHT, width)
+        color = band_arr.transpose(0, 2, 1).ravel()[entries]
+
+        order = np.argsort(color, kind="stable")
+        order = order[np.argsort(band[order].astype(np.min_scalar_type(len(band_arr))), kind="stable")]
+        return band[order], color[order].astype(np.intp), column[order], bits.ravel()[entries[order]]
+
+    def _assign_passes_np(
+        band: npt.NDArray[np.intp],
+        start: npt.NDArray[np.intp],
+        end: npt.NDArray[np.intp],
+        seg_count: npt.NDArray[np.intp],
+    ) -> npt.NDArray[np.intp]:
+        """First-fit pass assignment for segments sorted by band and emission order.
+
+        Each segment goes into the lowest pass whose last segment ends at or
+        before its start, which is exactly what repeated ``_iter_greedy_passes``
+        calls produce.  The loop runs over segment ranks and handles the
+        segments of that rank in all bands at once.
+        """
+        passes = np.zeros(len(start), dtype=np.intp)
+        if not len(start):
+            return passes
+
+        # First-fit on intervals ordered by start needs exactly as many passes as
+        # the maximum overlap.  Ends sort before starts on the same column, and
+        # every band's deltas sum to zero, so a global cumsum stays per-band.
+        event_band = np.concatenate((band, band))
+        event_col = np.concatenate((start, end))
+        event_delta = np.concatenate((np.ones_like(start), -np.ones_like(end)))
+        events = np.lexsort((event_delta, event_col, event_band))
+        depth = int(np.cumsum(event_delta[events]).max())
+
+        band_first = np.cumsum(seg_count) - seg_count
+        by_count = np.argsort(-seg_count, kind="stable")
+        neg_counts = -seg_count[by_count]
+        cursors = np.zeros((len(seg_count), depth), dtype=np.intp)
+
+        for rank in range(int(-neg_counts[0])):
+            bands = by_count[: np.searchsorted(neg_counts, -rank)]
+            idx = band_first[bands] + rank
+            chosen = np.argmax(cursors[bands] <= start[idx, None], axis=1)
+            passes[idx] = chosen
+            cursors[bands, chosen] = end[idx]
+
+        return passes
+
+    def _render_tokens_np(
+        kind: npt.NDArray[np.uint8],
+        tok_a: npt.NDArray[np.uint8],
+        tok_b: npt.NDArray[np.intp],
+        registers: tuple[bytes, ...],
+    ) -> tuple[memoryview, npt.NDArray[np.intp]]:
+        """Render a token stream to bytes, returning a view of the bytes and each token's end offset."""
+        is_register = kind == _TOKEN_REGISTER
+        is_select = kind == _TOKEN_SELECT
+        is_number = is_select | ((kind == _TOKEN_RUN) & (tok_b >= _RLE_THRESHOLD))
+        number = np.where(is_select, tok_a, tok_b)
+        n_digits = np.searchsorted(_NP_POW10, np.maximum(number, 1), side="right")
+
+        length = np.where(kind == _TOKEN_RUN, tok_b, 1)
+        length[is_number] = n_digits[is_number] + np.where(is_select[is_number], 1, 2)
+
+        reg_flat = np.frombuffer(b"".join(registers), dtype=np.uint8)
+        reg_len = np.array([len(r) for r in registers], dtype=np.intp)
+        reg_offset = np.cumsum(reg_len) - reg_len
+        length[is_register] = reg_len[tok_a[is_register]]
+
+        ends = np.cumsum(length)
+        token = np.repeat(np.arange(len(kind)), length)
+        out = tok_a[token]
+
+        # Digits and ``!``/``#`` prefixes of RLE counts and color selections
+        number_bytes = np.flatnonzero(is_number[token])
+        number_token = token[number_bytes]
+        pos = number_bytes - (ends - length)[number_token]
+        token_digits = n_digits[number_token]
+        digits = (number[number_token] // _NP_POW10[np.clip(token_digits - pos, 0, 18)]) % 10 + ord("0")
+        lead = np.where(is_select[number_token], ord("#"), ord("!"))
+        out[number_bytes] = np.where(pos == 0, lead, np.where(pos <= token_digits, digits, out[number_bytes]))
+
+        register_bytes = np.flatnonzero(is_register[token])
+        register_token = token[register_bytes]
+        pos = register_bytes - (ends - length)[register_token]
+        out[register_bytes] = reg_flat[reg_offset[tok_a[register_token]] + pos]
+
+        return memoryview(out), ends
+
+    def _encode_bands_np(
+        data: AnyBytes,
         width: int,
         height: int,
         tracker: _ColorTracker,
-        alpha_mask: AlphaMask = None,
-    ) -> list[AnyBytes]:
-        """Return encoded sixel chunks using numpy-accelerated band packing.
-
-        Uses band-major reshaping for cache locality: the pixel array is
-        padded to a multiple of 6 rows and reshaped to (n_bands, 6, width)
-        so each band is contiguous in memory.
-
-        Uses ``np.add.at`` to scatter bit weights into a (MAX_COLORS, width)
-        bitmask array -- replacing the per-pixel Python loop in ``_pack_band``.
+        alpha_mask: AnyBytes | None = None,
+        select_bands: bool = False,
+    ) -> tuple[AnyBytes, list[int]]:
+        """Encode all bands at once, returning the sixel body and the end offset of every band.
+
+        Produces the same bytes as ``_iter_bands`` and advances *tracker* the
+        same way, but spans, gap splits, pass assignment and RLE runs are
+        computed for the whole image as array operations.  Python only loops
+        over segment ranks during pass assignment.
+
+        With *select_bands*, every band opens with the selection of its first
+        color, even if the previous band left it active.
         """
-        band_data = [bytearray(width) for _ in range(MAX_COLORS)]
-        zero_fill = bytes(width)
-        allow_fill = alpha_mask is None
-
+        n_bands = -(-height // _BAND_HEIGHT)
         arr = np.frombuffer(data, dtype=np.uint8).reshape(height, width)
         mask_arr = None if alpha_mask is None else np.frombuffer(alpha_mask, dtype=np.uint8).reshape(height, width)
+        band, color, column, bits = _sparse_bitmasks_np(arr, mask_arr)
+
+        # Split every (band, color) row into segments at gaps of >= _GAP_THRESHOLD empty columns
+        step = np.diff(column)
+        new_seg = np.ones(len(column), dtype=bool)
+        new_seg[1:] = (band[1:] != band[:-1]) | (color[1:] != color[:-1]) | (step > _GAP_THRESHOLD)
+        seg_first = np.flatnonzero(new_seg)
+        seg_last = np.append(seg_first[1:], len(column))[: len(seg_first)] - 1
+        seg_band = band[seg_first]
+        seg_start = column[seg_first]
+        seg_end = column[seg_last] + 1
+
+        # Sort like ``_emit_band`` (start, longest first, color), then order by pass
+        order = np.lexsort((color[seg_first], seg_start - seg_end, seg_start, seg_band))
+        seg_count = np.bincount(seg_band, minlength=n_bands)
+        passes = _assign_passes_np(seg_band[order], seg_start[order], seg_end[order], seg_count)
+        emit_seg = order[np.lexsort((np.arange(len(order)), passes, seg_band[order]))]
+        seg_pass = np.empty_like(passes)
+        seg_pass[order] = passes
+        e_pass = seg_pass[emit_seg]
+        e_band = seg_band[emit_seg]
+        e_color = color[seg_first][emit_seg]
+        e_start = seg_start[emit_seg]
+        e_end = seg_end[emit_seg]
+        n_emit = len(emit_seg)
+
+        same_band = e_band[1:] == e_band[:-1]
+        same_pass = same_band & (e_pass[1:] == e_pass[:-1])
+        last_in_band = np.ones(n_emit, dtype=bool)
+        last_in_band[:-1] = ~same_band
+        last_in_pass = np.ones(n_emit, dtype=bool)
+        last_in_pass[:-1] = ~same_pass
+        carriage_return = last_in_pass & ~last_in_band
+        fill = e_pass == 0
+        if mask_arr is not None:
+            # Like ``_band_holes``: pass 0 segments over skipped pixels can't be filled
+            holes = np.zeros((n_bands * _BAND_HEIGHT, width), dtype=bool)
+            holes[:height] = mask_arr == 0
+            hole_count = np.zeros((n_bands, width + 1), dtype=np.intp)
+            np.cumsum(holes.reshape(n_bands, _BAND_HEIGHT, width).any(axis=1), axis=1, out=hole_count[:, 1:])
+            fill &= hole_count[e_band, e_end] == hole_count[e_band, e_start]
+
+        cursor = np.zeros(n_emit, dtype=np.intp)
+        cursor[1:] = np.where(same_pass, e_end[:-1], 0)
+        gap = e_start - cursor
+        has_gap = gap > 0
+
+        active = -1 if tracker.active is None else tracker.active
+        select = e_color != np.append(active, e_color[:-1])[:n_emit]
+        if select_bands:
+            select[:1] = True
+            select[1:] |= ~same_band
+
+        # RLE runs of the real bitmask data: zero columns inside a segment form
+        # runs of their own, so a new run starts on every value or column jump.
+        data_seg = np.zeros(len(seg_first), dtype=bool)
+        data_seg[emit_seg] = ~fill
+        entry_seg = np.cumsum(new_seg) - 1
+        run_start = new_seg.copy()
+        run_start[1:] |= (step != 1) | (bits[1:] != bits[:-1])
+        zero_before = np.zeros(len(column), dtype=bool)
+        zero_before[1:] = ~new_seg[1:] & (step > 1)
+        run_len = np.diff(np.append(np.flatnonzero(run_start), len(column)))
+
+        entry_tokens = (run_start.astype(np.intp) + zero_before) * data_seg[entry_seg]
+        entry_token_end = np.cumsum(entry_tokens)
+        seg_token_first = (entry_token_end - entry_tokens)[seg_first]
+        body_tokens = np.ones(n_emit, dtype=np.intp)
+        body_tokens[~fill] = (entry_token_end[seg_last] - seg_token_first)[emit_seg[~fill]]
+
+        # Lay out tokens: emitted segments and the bare newlines of empty bands, in band order
+        seg_tokens = body_tokens + select + has_gap + carriage_return + last_in_band
+        empty_bands = np.flatnonzero(seg_count == 0)
+        item_tokens = np.concatenate((seg_tokens, np.ones(len(empty_bands), dtype=np.intp)))
+        item_order = np.argsort(np.concatenate((e_band, empty_bands)), kind="stable")
+        item_first = np.empty(len(item_order), dtype=np.intp)
+        item_first[item_order] = np.cumsum(item_tokens[item_order]) - item_tokens[item_order]
+        n_tokens = int(item_tokens.sum())
+
+        kind = np.full(n_tokens, _TOKEN_RUN, dtype=np.uint8)
+        tok_a = np.zeros(n_tokens, dtype=np.uint8)
+        tok_b = np.zeros(n_tokens, dtype=np.intp)
+
+        pos = item_first[:n_emit]
+        kind[pos[select]] = _TOKEN_SELECT
+        tok_a[pos[select]] = e_color[select]
+        if isinstance(tracker, _LazyColorTracker):
+            selected = e_color[select]
+            colors, first_use = np.unique(selected, return_index=True)
+            undefined = ~np.isin(colors, list(tracker.defined))
+            kind[pos[select][first_use[undefined]]] = _TOKEN_REGISTER
+            tracker.mark_defined(int(c) for c in colors)
+        pos = pos + select
+
+        tok_a[pos[has_gap]] = _SIXEL_OFFSET
+        tok_b[pos[has_gap]] = gap[has_gap]
+        pos = pos + has_gap
+
+        band_h = np.minimum(height - e_band[fill] * _BAND_HEIGHT, _BAND_HEIGHT)
+        tok_a[pos[fill]] = _SIXEL_OFFSET + (1 << band_h) - 1
+        tok_b[pos[fill]] = (e_end - e_start)[fill]
+
+        body_first = np.zeros(len(seg_first), dtype=np.intp)
+        body_first[emit_seg] = pos
+        run_entries = np.flatnonzero(run_start & data_seg[entry_seg])
+        run_pos = body_first[entry_seg] + entry_token_end - 1 - seg_token_first[entry_seg]
+        tok_a[run_pos[run_entries]] = bits[run_entries] + _SIXEL_OFFSET
+        tok_b[run_pos[run_entries]] = run_len[np.cumsum(run_start)[run_entries] - 1]
+        zero_entries = np.flatnonzero(zero_before & data_seg[entry_seg])
+        tok_a[run_pos[zero_entries] - 1] = _SIXEL_OFFSET
+        tok_b[run_pos[zero_entries] - 1] = step[zero_entries - 1] - 1
+        pos = pos + body_tokens
+
+        kind[pos[carriage_return]] = _TOKEN_BYTE
+        tok_a[pos[carriage_return]] = _CR
+        pos = pos + carriage_return
+        newlines = np.concatenate((pos[last_in_band], item_first[n_emit:]))
+        kind[newlines] = _TOKEN_BYTE
+        tok_a[newlines] = _NL
+
+        if n_emit:
+            tracker.set_active(int(e_color[-1]))
+
+        registers = tracker.registers if isinstance(tracker, _LazyColorTracker) else ()
+        body, ends = _render_tokens_np(kind, tok_a, tok_b, registers)
+        return body, ends[np.sort(newlines)].tolist()
 
-        # Pad height to a multiple of 6 and reshape to (n_bands, 6, width)
-        pad_h = (_BAND_HEIGHT - height % _BAND_HEIGHT) % _BAND_HEIGHT
-        if pad_h:
-            arr = np.pad(arr, ((0, pad_h), (0, 0)), constant_values=0)
-            if mask_arr is not None:
-                mask_arr = np.pad(mask_arr, ((0, pad_h), (0, 0)), constant_values=0)
-        band_arr = arr.reshape(-1, _BAND_HEIGHT, width)
-        band_mask_arr = None if mask_arr is None else mask_arr.reshape(-1, _BAND_HEIGHT, width)
-        n_bands = band_arr.shape[0]
-
-        bitmask = np.zeros((MAX_COLORS, width), dtype=np.uint8)
-        cols = np.arange(width)
-
-        # Last band may be partial (fewer than 6 real rows)
-        last_band_h = _BAND_HEIGHT - pad_h if pad_h else _BAND_HEIGHT
-
-        bands: list[AnyBytes] = []
-        for band_idx in range(n_bands):
-            band = band_arr[band_idx]
-            band_h = last_band_h if band_idx == n_bands - 1 else _BAND_HEIGHT
-            band_mask = None if band_mask_arr is None else band_mask_arr[band_idx]
-
-            # Scatter bit weights into the bitmask array (up to 6 vectorized passes)
-            for row in range(band_h):
-                visible = slice(None) if band_mask is None else band_mask[row] != 0
-                np.add.at(bitmask, (band[row, visible], cols[visible]), _NP_BIT_WEIGHTS[row])
-
-            # Identify active colors and compute horizontal spans
-            active_colors = np.flatnonzero(np.any(bitmask, axis=1))
-            active_rows = bitmask[active_colors]  # (n_active, width)
-            nonzero = active_rows > 0
-            first_cols = np.argmax(nonzero, axis=1)
-            last_cols = width - 1 - np.argmax(nonzero[:, ::-1], axis=1)
-
-            # Every color returned by np.unique exists in the band, so
-            # the bitmask row is guaranteed to have nonzero data
-            spans: ColorSpans = {}
-            for i, c_np in enumerate(active_colors):
-                c = int(c_np)
-                spans[c] = (int(first_cols[i]), int(last_cols[i]) + 1)
-                band_data[c][:] = active_rows[i].tobytes()
-
-            bands.append(_emit_band(spans, band_data, tracker, band_h, allow_fill=allow_fill))
-
-            for c in spans:
-                band_data[c][:] = zero_fill
-            bitmask[active_colors] = 0
-
-        return bands
+    def _iter_bands_np(
+        data: AnyBytes,
+        width: int,
+        height: int,
+        tracker: _ColorTracker,
+        alpha_mask: AnyBytes | None = None,
+        cache: _BandCache | None = None,
+    ) -> Iterator[AnyBytes]:
+        """Yield encoded sixel chunks, one per band, using the vectorized encoder.
+
+        Bands are encoded in strips of ``_STREAM_BANDS`` so the first chunks are
+        available early; the tracker carries the active color across strips.
+        Bands found in *cache* are replayed instead of being encoded.
+        """
+        strip_rows = _STREAM_BANDS * _BAND_HEIGHT
+        for strip_y in range(0, height, strip_rows):
+            strip_h = min(strip_rows, height - strip_y)
+            rows = slice(strip_y * width, (strip_y + strip_h) * width)
+            strip_mask = None if alpha_mask is None else memoryview(alpha_mask)[rows]
+            if cache is not None:
+                yield from _iter_cached_bands_np(memoryview(data)[rows], width, strip_h, tracker, strip_mask, cache)
+                continue
+            body, band_ends = _encode_bands_np(memoryview(data)[rows], width, strip_h, tracker, strip_mask)
+            yield from (body[begin:end] for begin, end in zip([0, *band_ends], band_ends, strict=False))
+
+    def _iter_cached_bands_np(
+        data: AnyBytes,
+        width: int,
+        height: int,
+        tracker: _ColorTracker,
+        alpha_mask: AnyBytes | None,
+        cache: _BandCache,
+    ) -> Iterator[AnyBytes]:
+        """Yield the bands of a strip, replaying cached ones and encoding the rest in one vectorized call.
+
+        Distinct missed bands are encoded once, as if they were adjacent, each
+        opening with a color selection that is dropped again if the band
+        before it left that color active.  Whether a cached band can be
+        replayed with a lazy palette is decided before the missed bands
+        define their colors.
+        """
+        heights = [min(_BAND_HEIGHT, height - band_y) for band_y in range(0, height, _BAND_HEIGHT)]
+        keys = [_band_key(data, alpha_mask, i * _BAND_HEIGHT, band_h, width) for i, band_h in enumerate(heights)]
+        cached_bands = [cache.lookup(key, width, tracker) for key in keys]
+        missed: dict[BandKey, int] = {}
+        for key, band_h, cached in zip(keys, heights, cached_bands, strict=True):
+            if cached is None:
+                missed.setdefault(key, band_h)
+
+        chunks: Iterator[AnyBytes] = iter(())
+        if missed:
+            active = tracker.active
+            missed_mask = None if alpha_mask is None else b"".join(mask or b"" for _, mask in missed)
+            body, band_ends = _encode_bands_np(
+                b"".join(band for band, _ in missed), width, sum(missed.values()), tracker, missed_mask, True
+            )
+            tracker.set_active(active)
+            chunks = (body[begin:end] for begin, end in zip([0, *band_ends], band_ends, strict=False))
+
+        encoded: dict[BandKey, _CachedBand] = {}
+        for key, cached in zip(keys, cached_bands, strict=True):
+            replayed = encoded.get(key) if cached is None else cached
+            if replayed is not None:
+                yield _replay_band(replayed, tracker)
+                continue
+
+            # The slice of the encoded strip is yielded as it is; only the cache entry copies it
+            active = tracker.active
+            chunk = next(chunks)
+            token = _COLOR_TOKEN_RE.match(chunk)
+            if token is not None and int(token[1]) == active:
+                chunk = chunk[token.end() :]
+            band = encoded[key] = cache.store(key, chunk, active)
+            tracker.set_active(active if band.last_color is None else band.last_color)
+            yield chunk
 
 else:  # pragma: no cover
 
+    def _mode_filter_np(image: PILImage.Image, size: int) -> PILImage.Image:
+        """Fallback to Pillow's mode filter when NumPy is unavailable."""
+        return image.filter(ImageFilter.ModeFilter(size=size))
+
     def _compact_palette_np(
         image: PILImage.Image,
         data: bytes,
-        alpha_mask: AlphaMask = None,
-    ) -> tuple[bytes, tuple[bytes, ...]]:
+        index_freq: dict[int, int],
+        out: bytearray | None = None,
+    ) -> tuple[AnyBytes, tuple[bytes, ...]]:
         """Fallback to the pure-Python palette compactor when NumPy is unavailable."""
-        return _compact_palette(image, data, alpha_mask)
+        return _compact_palette(image, data, None, index_freq)
+
+    def _encode_bands_np(
+        data: AnyBytes,
+        width: int,
+        height: int,
+        tracker: _ColorTracker,
+        alpha_mask: AnyBytes | None = None,
+        select_bands: bool = False,
+    ) -> tuple[AnyBytes, list[int]]:
+        """Fallback to the pure-Python band iterator when NumPy is unavailable."""
+        mask = None if alpha_mask is None else bytes(alpha_mask)
+        chunks = _iter_bands(bytes(data), width, height, tracker, mask)
+        bands = []
+        for _ in range(0, height, _BAND_HEIGHT):
+            if select_bands:
+                tracker.set_active(None)
+            bands.append(next(chunks))
+        return b"".join(bands), list(accumulate(len(band) for band in bands))
 
     def _iter_bands_np(
-        data: bytes,
+        data: AnyBytes,
         width: int,
         height: int,
         tracker: _ColorTracker,
-        alpha_mask: AlphaMask = None,
-    ) -> list[AnyBytes]:
+        alpha_mask: AnyBytes | None = None,
+        cache: _BandCache | None = None,
+    ) -> Iterator[AnyBytes]:
         """Fallback to the pure-Python band iterator when NumPy is unavailable."""
-        return _iter_bands(data, width, height, tracker, alpha_mask)
+        mask = None if alpha_mask is None else bytes(alpha_mask)
+        return _iter_bands(bytes(data), width, height, tracker, mask, cache=cache)
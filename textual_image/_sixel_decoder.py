@@ -0,0 +1,115 @@
+"""Decodes sixel data back into pixels, to check what the encoder's output draws."""
+
+import re
+from typing import NamedTuple, TypeAlias
+
+from textual_image._sixel import _BAND_HEIGHT, _SIXEL_OFFSET, _ST
+
+RGBPercent: TypeAlias = tuple[int, int, int]  # RGB color as sixel percentages 0-100
+
+_DCS_RE = re.compile(rb"\x1bP(\d*);(\d*);(\d*)q")
+_RASTER_RE = re.compile(rb'"(\d+);(\d+);(\d+);(\d+)')
+# Color definition or selection, repeated sixel, sixels, carriage return or new line
+_TOKEN_RE = re.compile(rb"#(\d+)(?:;(\d+);(\d+);(\d+);(\d+))?|!(\d+)([?-~])|([?-~]+)|(\$)|(-)")
+
+
+class DecodedSixels(NamedTuple):
+    """Pixels drawn by sixel data, as a terminal with shared color registers keeps them.
+
+    Pixels refer to their color register, so redefining a register changes
+    every pixel drawn in it before, like on a VT340.
+    """
+
+    width: int
+    height: int
+    transparent: bool  # The ``P2=1`` header leaves pixels that are never drawn transparent
+    registers: dict[int, RGBPercent]  # Last definition of every register
+    pixels: list[list[int | None]]  # Register each pixel was last drawn in, ``None`` if never
+
+    def colors(self) -> list[list[RGBPercent | None]]:
+        """Return the color of every pixel, ``None`` where the image is transparent.
+
+        Opaque images start out in register 0, so pixels that are never
+        drawn show its color.
+
+        Raises:
+            ValueError: If a pixel is drawn in a register that is never defined.
+        """
+        background = None if self.transparent else self.registers.get(0)
+        try:
+            return [[background if pixel is None else self.registers[pixel] for pixel in row] for row in self.pixels]
+        except KeyError as error:
+            raise ValueError(f"Pixels drawn in undefined color register {error.args[0]}") from None
+
+
+def decode_sixels(sixels: str | bytes) -> DecodedSixels:
+    """Decode sixel data as ``image_to_sixels`` produces it back into pixels.
+
+    The data must start with the DCS header and raster attributes and end
+    with the string terminator.  Colors may only be defined in RGB.
+
+    Raises:
+        ValueError: If the data is malformed, defines a color in another color
+            space, or draws outside the raster.
+    """
+    data = sixels.encode("ascii") if isinstance(sixels, str) else sixels
+    pos, width, height, transparent = _decode_header(data)
+    registers: dict[int, RGBPercent] = {}
+    pixels: list[list[int | None]] = [[None] * width for _ in range(height)]
+    color = x = band_y = 0
+    end = len(data) - len(_ST)
+    while pos < end:
+        token = _TOKEN_RE.match(data, pos, end)
+        if token is None:
+            raise ValueError(f"Unexpected byte {data[pos : pos + 1]!r} at offset {pos}")
+        pos = token.end()
+        register, space, *components, count, repeated, run, carriage_return, new_line = token.groups()
+        if register is not None:
+            color = int(register)
+            if space is not None:
+                registers[color] = _decode_color(color, space, components)
+        elif carriage_return:
+            x = 0
+        elif new_line:
+            x, band_y = 0, band_y + _BAND_HEIGHT
+        else:
+            sixel_run = repeated * int(count) if count else run
+            x = _draw_sixels(pixels, sixel_run, x, band_y, color, token.start())
+
+    return DecodedSixels(width, height, transparent, registers, pixels)
+
+
+def _decode_header(data: bytes) -> tuple[int, int, int, bool]:
+    """Return where the sixels start, the raster's width and height, and whether the image is transparent."""
+    header = _DCS_RE.match(data)
+    if header is None:
+        raise ValueError("Sixel data doesn't start with a DCS header")
+    raster = _RASTER_RE.match(data, header.end())
+    if raster is None:
+        raise ValueError("Sixel data doesn't define its raster attributes")
+    if not data.endswith(_ST):
+        raise ValueError("Sixel data doesn't end with a string terminator")
+    return raster.end(), int(raster[3]), int(raster[4]), header[2] == b"1"
+
+
+def _decode_color(register: int, space: bytes, components: list[bytes]) -> RGBPercent:
+    """Decode the color of a register definition."""
+    if space != b"2":
+        raise ValueError(f"Color register {register} is not defined in RGB")
+    red, green, blue = (int(component) for component in components)
+    return red, green, blue
+
+
+def _draw_sixels(pixels: list[list[int | None]], sixels: bytes, x: int, band_y: int, color: int, offset: int) -> int:
+    """Draw *sixels* from column *x* of the band at row *band_y* and return the column after them."""
+    if x + len(sixels) > len(pixels[0] if pixels else ()):
+        raise ValueError(f"Sixels drawn past the right edge at offset {offset}")
+    for sixel in sixels:
+        bits = sixel - _SIXEL_OFFSET
+        for row in range(_BAND_HEIGHT):
+            if bits >> row & 1:
+                if band_y + row >= len(pixels):
+                    raise ValueError(f"Sixels drawn past the bottom edge at offset {offset}")
+                pixels[band_y + row][x] = color
+        x += 1
+    return x
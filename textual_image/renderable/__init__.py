@@ -4,6 +4,7 @@ import logging
 import sys
 from typing import Type
 
+from textual_image._pixeldata import PixelBuffer, image_cache
 from textual_image.renderable import sixel, tgp
 from textual_image.renderable.halfcell import Image as HalfcellImage
 from textual_image.renderable.sixel import Image as SixelImage
@@ -33,4 +34,4 @@ else:
     logger.debug("Not connected to a terminal, falling back to unicode")
     Image = UnicodeImage
 
-__all__ = ["Image", "TGPImage", "SixelImage", "HalfcellImage", "UnicodeImage"]
+__all__ = ["Image", "TGPImage", "SixelImage", "HalfcellImage", "UnicodeImage", "PixelBuffer", "image_cache"]
@@ -1,10 +1,9 @@
-from typing import IO, Protocol
+from typing import Protocol, Tuple
 
-from PIL import Image as PILImage
 from rich.console import Console, ConsoleOptions, RenderResult
 from rich.measure import Measurement
 
-from textual_image._utils import StrOrBytesPath
+from textual_image._pixeldata import ImageSource
 
 
 class ImageRenderable(Protocol):
@@ -12,9 +11,10 @@ class ImageRenderable(Protocol):
 
     def __init__(
         self,
-        image: StrOrBytesPath | IO[bytes] | PILImage.Image,
+        image: ImageSource,
         width: int | str | None = None,
         height: int | str | None = None,
+        size_hint: Tuple[int, int] | None = None,
     ) -> None: ...
     def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult: ...
     def __rich_measure__(self, console: Console, options: ConsoleOptions) -> Measurement: ...
@@ -1,8 +1,7 @@
 """Provides a Rich Renderable to render images as colored half cells."""
 
-from typing import IO, Tuple
+from typing import Tuple
 
-from PIL import Image as PILImage
 from rich.color import Color
 from rich.color_triplet import ColorTriplet
 from rich.console import Console, ConsoleOptions, RenderResult
@@ -11,9 +10,9 @@ from rich.segment import Segment
 from rich.style import Style
 
 from textual_image._geometry import ImageSize
-from textual_image._pixeldata import PixelData
+from textual_image._pixeldata import ImageSource, PixelData
 from textual_image._terminal import get_cell_size
-from textual_image._utils import StrOrBytesPath, grouped
+from textual_image._utils import grouped
 
 
 def _map_pixel(pixel_value: Tuple[int, int, int]) -> Color:
@@ -33,22 +32,26 @@ class Image:
 
     def __init__(
         self,
-        image: StrOrBytesPath | IO[bytes] | PILImage.Image,
+        image: ImageSource,
         width: int | str | None = None,
         height: int | str | None = None,
+        size_hint: Tuple[int, int] | None = None,
     ) -> None:
         """Initialized the `Image`.
 
         Args:
-            image: Path to an image file, a byte stream containing image data, or `PIL.Image.Image` instance with the
-                   image data to render.
+            image: Path to an image file, a byte stream containing image data, `PIL.Image.Image` instance, or raw
+                   pixels in a `PixelBuffer` or NumPy array with the image data to render. Raw pixels are wrapped
+                   without copying them where PIL can use their mode in place.
             width: Width specification to render the image.
                 See `textual_image.geometry.ImageSize` for details about possible values.
             height: height specification to render the image.
                 See `textual_image.geometry.ImageSize` for details about possible values.
+            size_hint: Size in pixels the image is going to be rendered at, if known in advance. Lets JPEGs be decoded
+                at a reduced size that is still at least this large, which is a lot faster for large photos.
         """
-        self._image_data = PixelData(image, mode="rgb")
-        self._render_size = ImageSize(self._image_data.width, self._image_data.height, width, height)
+        self._image_data = PixelData(image, mode="rgb", size_hint=size_hint)
+        self._render_size = ImageSize(*self._image_data.source_size, width, height)
 
     def cleanup(self) -> None:
         """No-op."""
@@ -1,19 +1,17 @@
 """Provides a Rich Renderable to render images as Sixels (https://en.wikipedia.org/wiki/Sixel)."""
 
 import sys
-from typing import IO, ClassVar
+from typing import ClassVar, Tuple
 
-from PIL import Image as PILImage
 from rich.console import Console, ConsoleOptions, RenderResult
 from rich.control import Control
 from rich.measure import Measurement
 from rich.segment import ControlType, Segment
 
 from textual_image._geometry import ImageSize
-from textual_image._pixeldata import PixelData
-from textual_image._sixel import SixelOptions, image_to_sixels
+from textual_image._pixeldata import ImageSource, PixelData
+from textual_image._sixel import SixelOptions, iter_sixels
 from textual_image._terminal import TerminalError, capture_terminal_response, get_cell_size
-from textual_image._utils import StrOrBytesPath
 
 # Random no-op control code to prevent Rich from messing with our data
 _NULL_CONTROL = [(ControlType.CURSOR_FORWARD, 0)]
@@ -32,25 +30,29 @@ class Image:
 
     def __init__(
         self,
-        image: StrOrBytesPath | IO[bytes] | PILImage.Image,
+        image: ImageSource,
         width: int | str | None = None,
         height: int | str | None = None,
         sixel_options: SixelOptions | None = None,
+        size_hint: Tuple[int, int] | None = None,
     ) -> None:
         """Initialized the `Image`.
 
         Args:
-            image: Path to an image file, a byte stream containing image data, or `PIL.Image.Image` instance with the
-                   image data to render.
+            image: Path to an image file, a byte stream containing image data, `PIL.Image.Image` instance, or raw
+                   pixels in a `PixelBuffer` or NumPy array with the image data to render. Raw pixels are wrapped
+                   without copying them where PIL can use their mode in place.
             width: Width specification to render the image.
                 See `textual_image.geometry.ImageSize` for details about possible values.
             height: height specification to render the image.
                 See `textual_image.geometry.ImageSize` for details about possible values.
             sixel_options: Sixel encoding options.  When ``None``, falls back to
                 ``self.DEFAULT_OPTIONS``.
+            size_hint: Size in pixels the image is going to be rendered at, if known in advance. Lets JPEGs be decoded
+                at a reduced size that is still at least this large, which is a lot faster for large photos.
         """
-        self._image_data = PixelData(image)
-        self._render_size = ImageSize(self._image_data.width, self._image_data.height, width, height)
+        self._image_data = PixelData(image, size_hint=size_hint)
+        self._render_size = ImageSize(*self._image_data.source_size, width, height)
         self._sixel_options = sixel_options if sixel_options is not None else self.DEFAULT_OPTIONS
 
     def cleanup(self) -> None:
@@ -84,10 +86,11 @@ class Image:
         yield Control.move(0, -cell_height)
 
         scaled_image = self._image_data.scaled(pixel_width, pixel_height)
-        sixel_data = image_to_sixels(scaled_image.pil_image, self._sixel_options)
 
+        # Sixel data is yielded band by band as it is encoded, so it never has to be held in one piece.
         # We add a random no-op control code to prevent Rich from messing with our data
-        yield Segment(sixel_data, control=_NULL_CONTROL)
+        for sixel_chunk in iter_sixels(scaled_image.pil_image, self._sixel_options):
+            yield Segment(str(sixel_chunk, "ascii"), control=_NULL_CONTROL)
         yield Segment("\x1b8", control=_NULL_CONTROL)
 
     def __rich_measure__(self, console: Console, options: ConsoleOptions) -> Measurement:
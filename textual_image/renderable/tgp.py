@@ -4,18 +4,16 @@ import logging
 import sys
 from itertools import count
 from random import randint
-from typing import IO, Iterator
+from typing import Iterator, Tuple
 
-from PIL import Image as PILImage
 from rich.console import Console, ConsoleOptions, RenderResult
 from rich.measure import Measurement
 from rich.segment import Segment
 from rich.style import Style
 
 from textual_image._geometry import ImageSize
-from textual_image._pixeldata import PixelData
+from textual_image._pixeldata import ImageSource, PixelData
 from textual_image._terminal import TerminalError, capture_terminal_response, get_cell_size, prepare_terminal_sequence
-from textual_image._utils import StrOrBytesPath
 
 logger = logging.getLogger(__name__)
 
@@ -85,22 +83,26 @@ class Image:
 
     def __init__(
         self,
-        image: StrOrBytesPath | IO[bytes] | PILImage.Image,
+        image: ImageSource,
         width: int | str | None = None,
         height: int | str | None = None,
+        size_hint: Tuple[int, int] | None = None,
     ) -> None:
         """Initialized the `Image`.
 
         Args:
-            image: Path to an image file, a byte stream containing image data, or `PIL.Image.Image` instance with the
-                   image data to render.
+            image: Path to an image file, a byte stream containing image data, `PIL.Image.Image` instance, or raw
+                   pixels in a `PixelBuffer` or NumPy array with the image data to render. Raw pixels are wrapped
+                   without copying them where PIL can use their mode in place.
             width: Width specification to render the image.
                 See `textual_image.geometry.ImageSize` for details about possible values.
             height: height specification to render the image.
                 See `textual_image.geometry.ImageSize` for details about possible values.
+            size_hint: Size in pixels the image is going to be rendered at, if known in advance. Lets JPEGs be decoded
+                at a reduced size that is still at least this large, which is a lot faster for large photos.
         """
-        self._image_data = PixelData(image)
-        self._render_size = ImageSize(self._image_data.width, self._image_data.height, width, height)
+        self._image_data = PixelData(image, size_hint=size_hint)
+        self._render_size = ImageSize(*self._image_data.source_size, width, height)
         self.terminal_image_id: int | None = None
 
     def cleanup(self) -> None:
@@ -2,6 +2,7 @@
 
 from typing import Type
 
+from textual_image._pixeldata import PixelBuffer, image_cache
 from textual_image._terminal import get_cell_size
 from textual_image.renderable import Image as AutoRenderable
 from textual_image.renderable.halfcell import Image as HalfcellRenderable
@@ -54,6 +55,8 @@ __all__ = [
     "TGPImage",
     "SixelImage",
     "SixelOptions",
+    "PixelBuffer",
+    "image_cache",
     "HalfcellImage",
     "UnicodeImage",
 ]
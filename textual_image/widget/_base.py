@@ -12,9 +12,9 @@ from textual.widget import Widget
 from typing_extensions import override
 
 from textual_image._geometry import ImageSize
-from textual_image._pixeldata import PixelMeta
+from textual_image._pixeldata import ImageSource, PixelMeta
 from textual_image._terminal import get_cell_size
-from textual_image._utils import StrOrBytesPath, is_non_seekable_stream
+from textual_image._utils import is_non_seekable_stream
 from textual_image.renderable._protocol import ImageRenderable
 
 
@@ -47,7 +47,7 @@ class Image(Widget):
 
     def __init__(
         self,
-        image: StrOrBytesPath | IO[bytes] | PILImage.Image | None = None,
+        image: ImageSource | None = None,
         *,
         name: str | None = None,
         id: str | None = None,
@@ -58,8 +58,9 @@ class Image(Widget):
         """Initializes the `Image`.
 
         Args:
-            image: Path to an image file, a byte stream containing image data, or `PIL.Image.Image` instance with the
-                   image data to render.
+            image: Path to an image file, a byte stream containing image data, `PIL.Image.Image` instance, or raw
+                   pixels in a `PixelBuffer` or NumPy array with the image data to render. Raw pixels are wrapped
+                   without copying them where PIL can use their mode in place.
             name: The name of the widget.
             id: The ID of the widget in the DOM.
             classes: The CSS classes for the widget.
@@ -68,7 +69,7 @@ class Image(Widget):
         """
         super().__init__(name=name, id=id, classes=classes, disabled=disabled)
         self._renderable: ImageRenderable | None = None
-        self._image: StrOrBytesPath | IO[bytes] | PILImage.Image | None = None
+        self._image: ImageSource | None = None
         self._image_width: int = 0
         self._image_height: int = 0
 
@@ -77,15 +78,15 @@ class Image(Widget):
         self.image = image
 
     @property
-    def image(self) -> StrOrBytesPath | IO[bytes] | PILImage.Image | None:
+    def image(self) -> ImageSource | None:
         """The image to render.
 
-        Path to an image file or `PIL.Image.Image` instance with the image data to render.
+        Path to an image file, byte stream, `PIL.Image.Image` instance or raw pixels with the image data to render.
         """
         return self._image
 
     @image.setter
-    def image(self, value: StrOrBytesPath | IO[bytes] | PILImage.Image | None) -> None:
+    def image(self, value: ImageSource | None) -> None:
         if self._renderable:
             self._renderable.cleanup()
             self._renderable = None
@@ -100,7 +101,8 @@ class Image(Widget):
         else:
             self._image = value
 
-        if self._image:
+        # Compared with None, as arrays don't have a truth value
+        if self._image is not None:
             try:
                 pixel_meta = PixelMeta(self._image)
             except (
@@ -126,7 +128,7 @@ class Image(Widget):
 
     @override
     def render(self) -> RenderResult:
-        if not self._image:
+        if self._image is None:
             return ""
 
         if self._renderable:
@@ -134,7 +136,7 @@ class Image(Widget):
             self._renderable = None
 
         try:
-            self._renderable = self._Renderable(self._image, *self._get_styled_size())
+            self._renderable = self._Renderable(self._image, *self._get_styled_size(), size_hint=self._get_pixel_size())
         except OSError as e:
             if self.on_error is not None:
                 self._error_widget = self.on_error(e)
@@ -169,6 +171,12 @@ class Image(Widget):
         ).get_cell_size(width, container.height or 2**32, terminal_sizes)
         return height
 
+    def _get_pixel_size(self) -> Tuple[int, int]:
+        styled_width, styled_height = self._get_styled_size()
+        return ImageSize(
+            self._image_width, self._image_height, width=styled_width, height=styled_height
+        ).get_pixel_size(self.content_size.width, self.content_size.height, get_cell_size())
+
     def _get_styled_size(self) -> Tuple[None | Literal["auto"] | int, None | Literal["auto"] | int]:
         width = self._get_styled_dimension(self.styles, "width")
         height = self._get_styled_dimension(self.styles, "height")
@@ -1,7 +1,8 @@
 """Provides a Textual `Widget` to render images as Sixels (<https://en.wikipedia.org/wiki/Sixel>) in the terminal."""
 
 import logging
-from typing import IO, Callable, ClassVar, Iterable, NamedTuple
+from dataclasses import replace
+from typing import Callable, ClassVar, Iterable, NamedTuple
 
 from PIL import Image as PILImage
 from rich.console import Console, ConsoleOptions, RenderResult
@@ -18,10 +19,16 @@ from textual.widget import Widget
 from typing_extensions import override
 
 from textual_image._geometry import ImageSize
-from textual_image._pixeldata import PixelData
-from textual_image._sixel import BackgroundColor, SixelOptions, image_to_sixels
+from textual_image._pixeldata import ImageSource, PixelData
+from textual_image._sixel import (
+    UNIFORM_QUANTIZE_METHODS,
+    BackgroundColor,
+    SixelOptions,
+    fit_sixel_options,
+    iter_sixels,
+    palette_from_image,
+)
 from textual_image._terminal import CellSize, get_cell_size
-from textual_image._utils import StrOrBytesPath
 from textual_image.widget._base import Image as BaseImage
 
 logger = logging.getLogger(__name__)
@@ -31,25 +38,26 @@ _NULL_STYLE = Style()
 
 
 class _CachedSixels(NamedTuple):
-    image: StrOrBytesPath | IO[bytes] | PILImage.Image
+    image: ImageSource
     content_crop: Region
     content_size: Size
     terminal_sizes: CellSize
     sixel_options: SixelOptions | None
     background: BackgroundColor
-    sixel_data: str
+    sixel_chunks: tuple[str, ...]
 
     def is_hit(
         self,
-        image: StrOrBytesPath | IO[bytes] | PILImage.Image,
+        image: ImageSource,
         content_crop: Region,
         content_size: Size,
         terminal_sizes: CellSize,
         sixel_options: SixelOptions | None,
         background: BackgroundColor,
     ) -> bool:
+        # Images are compared by identity, as arrays compare element-wise and PIL images compare all their pixels
         return (
-            image == self.image
+            image is self.image
             and content_crop == self.content_crop
             and content_size == self.content_size
             and terminal_sizes == self.terminal_sizes
@@ -58,6 +66,28 @@ class _CachedSixels(NamedTuple):
         )
 
 
+class _CachedOptions(NamedTuple):
+    image: ImageSource
+    sixel_options: SixelOptions | None
+    background: BackgroundColor
+    pixel_size: tuple[int, int] | None  # Size the budgets were fitted to, None without budgets
+    options: SixelOptions
+
+    def is_hit(
+        self,
+        image: ImageSource,
+        sixel_options: SixelOptions | None,
+        background: BackgroundColor,
+        pixel_size: tuple[int, int] | None,
+    ) -> bool:
+        return (
+            image is self.image
+            and sixel_options == self.sixel_options
+            and background == self.background
+            and pixel_size == self.pixel_size
+        )
+
+
 class _NoopRenderable:
     """Image renderable rendering nothing.
 
@@ -69,9 +99,10 @@ class _NoopRenderable:
 
     def __init__(
         self,
-        image: StrOrBytesPath | IO[bytes] | PILImage.Image,
+        image: ImageSource,
         width: int | str | None = None,
         height: int | str | None = None,
+        size_hint: tuple[int, int] | None = None,
     ) -> None:
         pass
 
@@ -98,7 +129,7 @@ class Image(BaseImage, Renderable=_NoopRenderable):
 
     def __init__(
         self,
-        image: StrOrBytesPath | IO[bytes] | PILImage.Image | None = None,
+        image: ImageSource | None = None,
         *,
         name: str | None = None,
         id: str | None = None,
@@ -124,7 +155,7 @@ class Image(BaseImage, Renderable=_NoopRenderable):
 
     @override
     @BaseImage.image.setter  # type: ignore
-    def image(self, value: StrOrBytesPath | IO[bytes] | PILImage.Image | None) -> None:
+    def image(self, value: ImageSource | None) -> None:
         super(__class__, type(self)).image.fset(self, value)  # type: ignore
         self.refresh(recompose=True)
 
@@ -175,20 +206,21 @@ class _ImageSixelImpl(Widget, can_focus=False, inherit_css=False):
     @override
     def __init__(
         self,
-        image: StrOrBytesPath | IO[bytes] | PILImage.Image | None = None,
+        image: ImageSource | None = None,
         sixel_options: SixelOptions | None = None,
     ) -> None:
         super().__init__()
         self.image = image
         self._sixel_options = sixel_options
         self._cached_sixels: _CachedSixels | None = None
+        self._cached_options: _CachedOptions | None = None
 
     @override
     def render_lines(self, crop: Region) -> list[Strip]:
         # We don't render anything if the screen isn't active. Textual may try to tint the widget which leads to weird
         # effects.
         try:
-            if not self.image or not self.screen.is_active:
+            if self.image is None or not self.screen.is_active:
                 return []
         except NoScreen:  # if no screen, return empty list
             return []
@@ -201,49 +233,79 @@ class _ImageSixelImpl(Widget, can_focus=False, inherit_css=False):
             self.image, crop, self.content_size, terminal_sizes, self._sixel_options, background
         ):
             logger.debug(f"using Sixel data from cache for crop region {crop}")
-            sixel_data = self._cached_sixels.sixel_data
+            sixel_chunks = self._cached_sixels.sixel_chunks
         else:
             logger.debug(f"encoding Sixel data for crop region {crop}")
 
+            pixel_size = self._get_pixel_size(terminal_sizes)
             try:
-                image_data = PixelData(self.image)
+                image_data = PixelData(self.image, size_hint=pixel_size)
             except OSError as e:
                 self.post_message(self.Failed(e))
                 return []
 
-            image_data = self._scale_image(image_data, terminal_sizes)
+            image_data = image_data.scaled(*pixel_size)
+            sixel_options = self._get_sixel_options(self.image, image_data.pil_image, background)
             image_data = self._crop_image(image_data, crop, terminal_sizes)
 
-            sixel_data = self._image_to_sixels(image_data.pil_image, self._sixel_options, background=background)
+            sixel_chunks = self._image_to_sixel_chunks(image_data.pil_image, sixel_options, background=background)
             self._cached_sixels = _CachedSixels(
-                self.image, crop, self.content_size, terminal_sizes, self._sixel_options, background, sixel_data
+                self.image, crop, self.content_size, terminal_sizes, self._sixel_options, background, sixel_chunks
             )
 
-        sixel_segments = self._get_sixel_segments(sixel_data)
+        sixel_segments = self._get_sixel_segments(sixel_chunks)
         clear_style = self._get_clear_style()
         clear_segment = Segment(" " * crop.width, style=clear_style)
         lines = [Strip([clear_segment], cell_length=crop.width) for _ in range(crop.height - 1)]
         lines.append(Strip([clear_segment, *sixel_segments], cell_length=crop.width))
         return lines
 
-    def _image_to_sixels(
+    def _image_to_sixel_chunks(
         self,
         image: PILImage.Image,
         sixel_options: SixelOptions | None = None,
         background: BackgroundColor | None = None,
-    ) -> str:
-        return image_to_sixels(image, sixel_options, background)
+    ) -> tuple[str, ...]:
+        # Each chunk is decoded once and becomes its own segment, so the full sixel data is never joined here.
+        return tuple(str(chunk, "ascii") for chunk in iter_sixels(image, sixel_options, background))
 
-    def _scale_image(self, image_data: PixelData, terminal_sizes: CellSize) -> PixelData:
+    def _get_sixel_options(
+        self,
+        image: ImageSource,
+        scaled_image: PILImage.Image,
+        background: BackgroundColor,
+    ) -> SixelOptions:
+        # Unless the options fix a palette or quantize onto a uniform one, a palette is built from the whole scaled
+        # image once and reused for every crop and size of the same image. Colors don't change while scrolling or
+        # resizing, and crops are mapped onto the palette instead of being quantized again. Budgets are fitted to the
+        # whole scaled image along with it, so crops don't step down their options on their own. As the output grows
+        # with the scaled image, they are fitted again whenever its size changes.
+        options = self._sixel_options or SixelOptions()
+        has_budget = options.max_bytes is not None or options.max_encode_time is not None
+        has_palette = options.palette is not None or options.quantize in UNIFORM_QUANTIZE_METHODS
+        if has_palette and not has_budget:
+            return options
+
+        pixel_size = scaled_image.size if has_budget else None
+        cached = self._cached_options
+        if not cached or not cached.is_hit(image, self._sixel_options, background, pixel_size):
+            if has_budget:
+                options = fit_sixel_options(scaled_image, options, background).options
+            if not has_palette:
+                options = replace(options, palette=palette_from_image(scaled_image, options, background))
+            cached = self._cached_options = _CachedOptions(image, self._sixel_options, background, pixel_size, options)
+        return cached.options
+
+    def _get_pixel_size(self, terminal_sizes: CellSize) -> tuple[int, int]:
+        # Computed from the size the parent read from the image's header, so the image can be decoded straight at a
+        # reduced size.
         assert isinstance(self.parent, Image)
 
         styled_width, styled_height = self.parent._get_styled_size()
-        image_size = ImageSize(image_data.width, image_data.height, width=styled_width, height=styled_height)
-        pixel_width, pixel_height = image_size.get_pixel_size(
-            self.content_size.width, self.content_size.height, terminal_sizes
+        image_size = ImageSize(
+            self.parent._image_width, self.parent._image_height, width=styled_width, height=styled_height
         )
-
-        return image_data.scaled(pixel_width, pixel_height)
+        return image_size.get_pixel_size(self.content_size.width, self.content_size.height, terminal_sizes)
 
     def _crop_image(self, image: PixelData, crop: Region, terminal_sizes: CellSize) -> PixelData:
         crop_pixels_left = crop.x * terminal_sizes.width
@@ -261,10 +323,10 @@ class _ImageSixelImpl(Widget, can_focus=False, inherit_css=False):
         _, color = self.background_colors
         return Style(bgcolor=color.rich_color)
 
-    def _get_sixel_segments(self, sixel_data: str) -> Iterable[Segment]:
+    def _get_sixel_segments(self, sixel_chunks: tuple[str, ...]) -> Iterable[Segment]:
         visible_region = self.screen.find_widget(self).visible_region
         return [
             Segment(Control.move_to(visible_region.x, visible_region.y).segment.text, style=_NULL_STYLE),
-            Segment(sixel_data, style=_NULL_STYLE, control=((ControlType.CURSOR_FORWARD, 0),)),
+            *(Segment(chunk, style=_NULL_STYLE, control=((ControlType.CURSOR_FORWARD, 0),)) for chunk in sixel_chunks),
             Segment(Control.move_to(visible_region.right, visible_region.bottom).segment.text, style=_NULL_STYLE),
         ]